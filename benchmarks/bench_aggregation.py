@@ -0,0 +1,126 @@
+"""Compare the statistics over several architectures computed with numpy by ArchitectureAggregates against the same
+statistics computed on dictionaries of packages, on synthetic counts of a dozen architectures.
+
+Usage: python benchmarks/bench_aggregation.py [--architectures 12] [--packages 60000] [--specific 0.02] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from aggregation import ArchitectureAggregates  # noqa: E402
+from columnar import ColumnarExport, ColumnarWriter  # noqa: E402
+from contents_parser import top_k_packages  # noqa: E402
+from synthetic_contents import AREAS, SECTIONS  # noqa: E402
+
+PERCENTILES = (50, 90, 99)
+
+
+def synthetic_counts(architectures: int, packages: int, specific: float, seed=0) -> dict:
+    """
+    The files per package and section of synthetic architectures. Most packages are in every architecture with about
+    the same number of files, a fraction of them is only in one architecture.
+    :return: the dictionary containing architecture -> dictionary of section -> Counter of package -> number of files
+    """
+    rng = random.Random(seed)
+    sections = SECTIONS + [f'{area}/{section}' for area in AREAS for section in SECTIONS]
+    package_sections = [rng.choice(sections) for _ in range(packages)]
+    # The files fall off as 1/(i+1) like in synthetic_contents, a few packages own most of the files
+    package_files = [max(1, int(20000 / (i + 1))) for i in range(packages)]
+    files_count_per_section_per_architecture = {}
+    for a in range(architectures):
+        files_count_per_section = defaultdict(Counter)
+        for i in range(packages):
+            if rng.random() < specific and rng.randrange(architectures) != a:
+                continue  # The package is only in some of the architectures
+            files_count_per_section[package_sections[i]][f'package{i}'] = package_files[i] + rng.randint(0, 3)
+        files_count_per_section_per_architecture[f'arch{a}'] = dict(files_count_per_section)
+    return files_count_per_section_per_architecture
+
+
+def percentile(values: list, q: float) -> float:
+    """The percentile of sorted values, interpolated linearly like numpy.percentile"""
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def dict_statistics(files_count_per_section_per_architecture: dict, k: int) -> tuple:
+    """The statistics computed on dictionaries, the way the counts of the parsers are added up by the top command"""
+    totals = Counter()
+    architectures_per_package = defaultdict(list)
+    files_count_per_section = defaultdict(Counter)
+    for architecture, sections in files_count_per_section_per_architecture.items():
+        files_count_per_package = Counter()
+        for section, counts in sections.items():
+            files_count_per_package.update(counts)
+            files_count_per_section[section].update(counts)
+        totals.update(files_count_per_package)
+        for package_name in files_count_per_package:
+            architectures_per_package[package_name].append(architecture)
+    specific = Counter(architectures[0] for architectures in architectures_per_package.values()
+                       if len(architectures) == 1)
+    percentiles = {section: [percentile(sorted(counts.values()), q) for q in PERCENTILES]
+                   for section, counts in sorted(files_count_per_section.items())}
+    return top_k_packages(totals, k), specific, percentiles
+
+
+def numpy_statistics(aggregates: ArchitectureAggregates, k: int) -> tuple:
+    """The same statistics computed by ArchitectureAggregates"""
+    specific = Counter({architecture: len(packages)
+                        for architecture, packages in aggregates.architecture_specific().items() if packages})
+    return aggregates.top_k(k), specific, aggregates.section_percentiles(PERCENTILES)
+
+
+def write_export(folder: str, counts: dict):
+    """Write the counts of the architectures to a columnar export"""
+    with ColumnarWriter(folder) as writer:
+        for architecture, files_count_per_section in counts.items():
+            writer.add(architecture, files_count_per_section)
+
+
+def measure(run, repeat: int) -> tuple:
+    """The best wall time of the run and its result"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return round(min(times) * 1000, 1), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--architectures', type=int, default=12)
+    parser.add_argument('--packages', type=int, default=60_000)
+    parser.add_argument('--specific', type=float, default=0.02,
+                        help='The fraction of the packages missing from some of the architectures')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    counts = synthetic_counts(args.architectures, args.packages, args.specific)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        export_folder = os.path.join(tmp_dir, 'export')
+        export_ms, _ = measure(lambda: write_export(export_folder, counts), 1)
+        load_ms, aggregates = measure(lambda: ArchitectureAggregates.from_export(ColumnarExport(export_folder)),
+                                      args.repeat)
+        dict_ms, dict_result = measure(lambda: dict_statistics(counts, args.k), args.repeat)
+        numpy_ms, numpy_result = measure(lambda: numpy_statistics(aggregates, args.k), args.repeat)
+        rows = sum(len(section) for sections in counts.values() for section in sections.values())
+
+    assert dict_result[0] == numpy_result[0] and dict_result[1] == numpy_result[1]
+    print(json.dumps({'architectures': args.architectures, 'packages': args.packages, 'rows': rows,
+                      'export_ms': export_ms, 'load_ms': load_ms, 'dict_ms': dict_ms, 'numpy_ms': numpy_ms,
+                      'speedup': round(dict_ms / numpy_ms, 1)}))
+
+
+if __name__ == '__main__':
+    main()
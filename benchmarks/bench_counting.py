@@ -0,0 +1,66 @@
+"""Compare the wall time and the peak RSS of finding the top k packages using the file lists
+of each package against counting the files of each package.
+
+Usage: python benchmarks/bench_counting.py [--lines 3000000] [--packages 60000] [--workers 1]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from contents_parser import ContentsParser  # noqa: E402
+from synthetic_contents import write_contents_file  # noqa: E402
+
+
+def run_mode(mode: str, file_path: str, workers: int) -> dict:
+    """Run a single mode in the current process and return its wall time and peak RSS"""
+    content_parser = ContentsParser(file_path, table_header=False, workers=workers)
+    start = time.perf_counter()
+    if mode == 'lists':
+        files_list_per_package = content_parser.get_files_list_per_package()
+        top_k = sorted(((len(files), package_name) for package_name, files in files_list_per_package.items()),
+                       reverse=True)[:10]
+    else:
+        top_k = content_parser.top_k_packages_max_files(10)
+    wall_time = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on linux
+    return {'mode': mode, 'workers': workers, 'wall_s': round(wall_time, 3),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'top': len(top_k)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=3_000_000)
+    parser.add_argument('--packages', type=int, default=60_000)
+    parser.add_argument('--workers', type=int, default=1, help='The number of processes used by the counting mode')
+    parser.add_argument('--run', choices=['lists', 'counts'], help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.file, args.workers)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'Contents-synthetic.gz')
+        write_contents_file(file_path, args.lines, args.packages)
+        # Each mode runs in its own process so that the peak RSS of one does not hide the other
+        modes = [('lists', 1), ('counts', 1)]
+        if args.workers > 1:
+            modes.append(('counts', args.workers))
+        for mode, workers in modes:
+            output = subprocess.run([sys.executable, __file__, '--run', mode, '--file', file_path,
+                                     '--workers', str(workers)],
+                                    check=True, capture_output=True, text=True).stdout
+            print(output.strip())
+
+
+if __name__ == '__main__':
+    main()
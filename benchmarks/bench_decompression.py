@@ -0,0 +1,75 @@
+"""Compare the decompression backends installed on the synthetic contents files compressed with gzip and xz,
+and the gzip.GzipFile reads the backends replaced, in MB/s of decompressed data.
+
+Usage: python benchmarks/bench_decompression.py [--lines 2000000] [--packages 60000] [--repeat 3]
+       [--read_size 262144]
+"""
+import argparse
+import gzip
+import json
+import lzma
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from decompression import BACKENDS, iter_decompressed_file  # noqa: E402
+from synthetic_contents import write_contents_file  # noqa: E402
+
+
+def gzip_file_blocks(file_path: str, read_size: int):
+    """The decompression of ContentsParser before the backends, 1MB blocks read from a gzip.GzipFile"""
+    with gzip.GzipFile(file_path) as contents_file:
+        yield from iter(partial(contents_file.read, 1024*1024), b'')
+
+
+def measure(decompress, repeat: int) -> dict:
+    """The best wall time of reading every block and the throughput in MB/s of decompressed data"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = sum(len(block) for block in decompress())
+        times.append(time.perf_counter() - start)
+    return {'time_s': round(min(times), 3), 'mb_per_s': round(size / 2**20 / min(times), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=2_000_000)
+    parser.add_argument('--packages', type=int, default=60_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--read_size', type=int, default=256*1024, help='The size of the blocks read')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gz_path = os.path.join(tmp_dir, 'Contents-synthetic.gz')
+        write_contents_file(gz_path, args.lines, args.packages, shared=0.05, areas=0.1)
+        # The mirrors compress with the highest levels, the synthetic file is compressed again the same way
+        with gzip.open(gz_path) as f:
+            content = f.read()
+        with open(gz_path, 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9))
+        xz_path = os.path.join(tmp_dir, 'Contents-synthetic.xz')
+        with open(xz_path, 'wb') as f:
+            f.write(lzma.compress(content, preset=6))
+        del content
+        paths = {'gz': gz_path, 'xz': xz_path}
+
+        cases = [('gzip.GzipFile', 'gz', partial(gzip_file_blocks, gz_path, args.read_size))]
+        for name, backend in BACKENDS.items():
+            if backend.available():
+                cases.append((name, backend.compression,
+                              partial(iter_decompressed_file, paths[backend.compression], args.read_size, name)))
+            else:
+                print(json.dumps({'backend': name, 'compression': backend.compression, 'installed': False}))
+        for name, compression, decompress in cases:
+            print(json.dumps({'backend': name, 'compression': compression, 'lines': args.lines,
+                              'compressed_mb': round(os.path.getsize(paths[compression]) / 2**20, 1),
+                              **measure(decompress, args.repeat)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Compare the time and the peak RSS of listing the files of every package of several synthetic contents files
+sorted on disk within a memory budget, against building the files lists of every file in memory.
+
+Usage: python benchmarks/bench_external_sort.py [--files 3] [--lines 1000000] [--packages 60000]
+       [--memory_budget_mb 16 64]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from contents_parser import ContentsParser  # noqa: E402
+from external_sort import iter_files_per_package  # noqa: E402
+from synthetic_contents import write_contents_file  # noqa: E402
+
+
+def files_lists(file_paths: list) -> int:
+    """The files lists of all the files kept in memory, then output sorted by package like the files command"""
+    package_files = [ContentsParser(file_path, table_header=False).get_files_list_per_package()
+                     for file_path in file_paths]
+    lines = 0
+    for package_name in sorted(set().union(*package_files)):
+        paths = set()
+        for files_list_per_package in package_files:
+            paths.update(files_list_per_package.get(package_name, ()))
+        lines += len(paths) + 1
+    return lines
+
+
+def external_sort(file_paths: list, memory_budget: int, folder: str) -> int:
+    """The files of every package sorted on disk by the files command"""
+    lines = 0
+    for _, paths in iter_files_per_package((ContentsParser(file_path, table_header=False).iter_package_file_records()
+                                            for file_path in file_paths), memory_budget, folder):
+        lines += sum(1 for _ in paths) + 1
+    return lines
+
+
+def run(args):
+    """Run one case in this process, so that its peak RSS is its own"""
+    start = time.perf_counter()
+    if args.memory_budget is None:
+        lines = files_lists(args.file_paths)
+    else:
+        lines = external_sort(args.file_paths, args.memory_budget, os.path.dirname(args.file_paths[0]))
+    print(json.dumps({'lines': lines, 'wall_s': round(time.perf_counter() - start, 2),
+                      # ru_maxrss is in kilobytes on linux
+                      'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=3, help='The number of contents files combined')
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    parser.add_argument('--packages', type=int, default=60_000)
+    parser.add_argument('--memory_budget_mb', type=int, nargs='+', default=[16, 64])
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--memory_budget', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--file_paths', nargs='+', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_paths = []
+        for i in range(args.files):
+            file_paths.append(os.path.join(tmp_dir, f'Contents-synthetic{i}.gz'))
+            write_contents_file(file_paths[-1], args.lines, args.packages, seed=i, shared=0.05, areas=0.1)
+        cases = [('files lists', [])] + [(f'external sort {budget}MB', ['--memory_budget', str(budget * 2**20)])
+                                         for budget in args.memory_budget_mb]
+        for name, options in cases:
+            output = subprocess.run([sys.executable, __file__, '--run', '--file_paths', *file_paths, *options],
+                                    check=True, capture_output=True, text=True).stdout
+            print(json.dumps({'case': name, 'files': args.files, **json.loads(output)}))
+
+
+if __name__ == '__main__':
+    main()
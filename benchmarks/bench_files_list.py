@@ -0,0 +1,49 @@
+"""Compare the memory used by the PackageFiles returned by get_files_list_per_package against a
+dictionary of lists of str holding the same files.
+
+Usage: python benchmarks/bench_files_list.py [--lines 2000000] [--packages 60000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from contents_parser import ContentsParser  # noqa: E402
+from synthetic_contents import write_contents_file  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=2_000_000)
+    parser.add_argument('--packages', type=int, default=60_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'Contents-synthetic.gz')
+        write_contents_file(file_path, args.lines, args.packages)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        package_files = ContentsParser(file_path, table_header=False).get_files_list_per_package()
+        parse_time = time.perf_counter() - start
+        compact_bytes = tracemalloc.get_traced_memory()[0]
+        print(json.dumps({'representation': 'PackageFiles', 'memory_mb': round(compact_bytes / 2**20, 1),
+                          'bytes_per_file': round(compact_bytes / args.lines, 1), 'parse_s': round(parse_time, 2)}))
+
+        tracemalloc.reset_peak()
+        start_bytes = tracemalloc.get_traced_memory()[0]
+        files_list_per_package = {package_name: files for package_name, files in package_files.items()}
+        dict_bytes = tracemalloc.get_traced_memory()[0] - start_bytes
+        tracemalloc.stop()
+        print(json.dumps({'representation': 'dict of lists', 'memory_mb': round(dict_bytes / 2**20, 1),
+                          'bytes_per_file': round(dict_bytes / args.lines, 1),
+                          'packages': len(files_list_per_package)}))
+
+
+if __name__ == '__main__':
+    main()
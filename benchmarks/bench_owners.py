@@ -0,0 +1,71 @@
+"""Compare the memory and the lookup latency of finding the packages owning a path with the
+memory mapped ContentsIndex against a dictionary of path -> packages.
+
+Usage: python benchmarks/bench_owners.py [--lines 2000000] [--packages 60000] [--lookups 10000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from contents_index import ContentsIndex  # noqa: E402
+from contents_parser import ContentsParser  # noqa: E402
+from synthetic_contents import write_contents_file  # noqa: E402
+
+
+def time_lookups(lookup, paths: list) -> float:
+    """The mean time of a lookup in microseconds"""
+    start = time.perf_counter()
+    for path in paths:
+        lookup(path)
+    return round((time.perf_counter() - start) / len(paths) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=2_000_000)
+    parser.add_argument('--packages', type=int, default=60_000)
+    parser.add_argument('--lookups', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'Contents-synthetic.gz')
+        write_contents_file(file_path, args.lines, args.packages)
+        content_parser = ContentsParser(file_path, table_header=False)
+
+        # The naive approach, every path decoded as a key of a dictionary
+        tracemalloc.start()
+        packages_per_path = {}
+        for package_name, files in content_parser.get_files_list_per_package().items():
+            for file_name in files:
+                packages_per_path.setdefault(file_name, []).append(package_name)
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        paths = random.Random(0).sample(sorted(packages_per_path), min(args.lookups, len(packages_per_path)))
+        print(json.dumps({'approach': 'dict', 'memory_mb': round(dict_bytes / 2**20, 1),
+                          'lookup_us': time_lookups(packages_per_path.get, paths)}))
+        del packages_per_path
+
+        index_path = os.path.join(tmp_dir, 'Contents-synthetic.index')
+        start = time.perf_counter()
+        content_parser.build_index(index_path).close()
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        with ContentsIndex(index_path) as contents_index:
+            open_time = time.perf_counter() - start
+            print(json.dumps({'approach': 'index', 'file_mb': round(os.path.getsize(index_path) / 2**20, 1),
+                              'build_s': round(build_time, 2), 'open_ms': round(open_time * 1000, 3),
+                              'lookup_us': time_lookups(contents_index.packages_owning, paths),
+                              'prefix_lookup_us': time_lookups(lambda p: next(contents_index.paths_with_prefix(p)),
+                                                               [path.rpartition('/')[0] for path in paths])}))
+
+
+if __name__ == '__main__':
+    main()
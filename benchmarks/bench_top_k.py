@@ -0,0 +1,74 @@
+"""Compare the time and the memory of selecting the top k packages with the streaming TopK against
+heapifying a list of every package, the implementation TopK replaced.
+
+Usage: python benchmarks/bench_top_k.py [--packages 200000] [--k 10] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from heapq import heapify, heappop
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from top_k import TopK  # noqa: E402
+
+
+def heapify_top_k(files_count_per_package: dict, k: int) -> list:
+    """The previous top_k_packages, a heap of every package popped k times"""
+    files_per_package_count_list = [(-count, package_name)
+                                    for package_name, count in files_count_per_package.items()]
+    heapify(files_per_package_count_list)
+    top_k = []
+    for _ in range(k):
+        if files_per_package_count_list:
+            top = heappop(files_per_package_count_list)
+            top_k.append((top[1], -top[0]))
+    return top_k
+
+
+def streaming_top_k(files_count_per_package: dict, k: int) -> list:
+    top_k = TopK(k)
+    top_k.update(files_count_per_package)
+    return top_k.result()
+
+
+def measure(select, files_count_per_package: dict, k: int, repeat: int) -> dict:
+    """The best wall time of the selection and the peak of the memory it allocates"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        select(files_count_per_package, k)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    top_k = select(files_count_per_package, k)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'time_ms': round(min(times) * 1000, 2), 'peak_kb': round(peak_bytes / 1024, 1), 'top_k': top_k}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packages', type=int, default=200_000)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # A long tail of packages with few files and many ties, like the contents files
+    rng = random.Random(0)
+    files_count_per_package = {f'package{i}': int(rng.paretovariate(1.2)) for i in range(args.packages)}
+
+    results = {}
+    for name, select in (('heapify all', heapify_top_k), ('TopK', streaming_top_k)):
+        results[name] = measure(select, files_count_per_package, args.k, args.repeat)
+    assert results['heapify all']['top_k'] == results['TopK']['top_k']
+    for name, result in results.items():
+        print(json.dumps({'implementation': name, 'packages': args.packages, 'k': args.k,
+                          'time_ms': result['time_ms'], 'peak_kb': result['peak_kb']}))
+
+
+if __name__ == '__main__':
+    main()
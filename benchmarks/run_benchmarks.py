@@ -0,0 +1,252 @@
+"""Benchmark suite of the parser, the top k selection, the download and the whole command line tool on a
+synthetic contents file. Writes a JSON report, and compares it against a baseline report to flag regressions.
+
+Usage: python benchmarks/run_benchmarks.py [--lines 1000000] [--packages 60000] [--repeat 3] [--header]
+       [--cases parse,parse_lists,top_k,download,cli,cached_cli] [--output report.json] [--baseline baseline.json]
+       [--tolerance 0.2] [--import_budget_ms 50]
+
+Save a report as the baseline once, for example with --output benchmarks/baseline.json on the reference machine,
+and pass it as --baseline to the next runs. The exit status is 1 if a metric is worse than the baseline by more
+than the tolerance, or if importing package_statistics takes longer than the import budget.
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+SRC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.append(SRC_FOLDER)
+
+from synthetic_contents import write_contents_file  # noqa: E402
+
+CASES = ['parse', 'parse_lists', 'top_k', 'download', 'cli', 'cached_cli']
+ARCHITECTURE = 'synthetic'  # The file is served as the contents file of this architecture
+# The metrics compared against the baseline, higher is worse for all of them
+COMPARED_METRICS = ['wall_s', 'peak_rss_mb', 'allocated_mb', 'import_ms']
+
+
+def bytecode_env(folder: str) -> dict:
+    """
+    The environment of a new python process that caches the compiled modules in folder, so that the imports are
+    measured the way they run once a package is installed, even if PYTHONDONTWRITEBYTECODE is set
+    """
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=os.path.abspath(folder))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def setup_case(case: str, file_path: str, url: str, header: bool):
+    """
+    Prepare a case, everything done here is not measured
+    :return: the function running the measured part of the case
+    """
+    from constants import CHUNK_SIZE, K_VALUE
+    from contents_parser import ContentsParser, top_k_packages
+
+    if case == 'parse':
+        return ContentsParser(file_path, table_header=header).count_files_per_package
+    if case == 'parse_lists':
+        return ContentsParser(file_path, table_header=header).get_files_list_per_package
+    if case == 'top_k':
+        files_count_per_package = ContentsParser(file_path, table_header=header).count_files_per_package()
+        return partial(top_k_packages, files_count_per_package, K_VALUE)
+    if case == 'download':
+        from constants import VALIDATORS_FILE_FORMAT
+        from utils import iter_response, remove_part, request_file
+        # The runs share the working directory, a copy left by a previous run would be revalidated with a 304
+        # instead of downloaded
+        for path in ('download.gz', VALIDATORS_FILE_FORMAT.format('download.gz')):
+            if os.path.isfile(path):
+                os.remove(path)
+        remove_part('download.gz')
+
+        def run_download():
+            # download_file, checking that the whole file was sent
+            r = request_file(f'{url}{os.path.basename(file_path)}', 'download.gz')
+            if r is None or r.status_code != 200:
+                raise RuntimeError(f"The download got {304 if r is None else r.status_code} instead of 200")
+            for _ in iter_response(r, 'download.gz', CHUNK_SIZE):
+                pass
+        return run_download
+    if case == 'cli':
+        import package_statistics
+        package_statistics.URL_BASE = url
+
+        def run_cli():
+            # The downloads folder is created and removed in the working directory, the output is dropped
+            with contextlib.redirect_stdout(io.StringIO()):
+                package_statistics.cli([ARCHITECTURE, f'--table_header={header}'], standalone_mode=False)
+        return run_cli
+    if case == 'cached_cli':
+        # A new process answering from the local file and the cached result, the way a user runs a repeated query
+        command = [sys.executable, os.path.join(SRC_FOLDER, 'package_statistics.py'), ARCHITECTURE,
+                   f'--table_header={header}', '--no_cache=false', f'--mirror={url}']
+        env = bytecode_env('pycache')
+        subprocess.run(command, check=True, capture_output=True, env=env)  # Downloads and caches the result
+        return partial(subprocess.run, command, check=True, capture_output=True, env=env)
+    raise ValueError(f'Unknown case {case}')
+
+
+def run_case(case: str, file_path: str, url: str, header: bool, allocations: bool) -> dict:
+    """Run a case once in the current process and return what was measured"""
+    run = setup_case(case, file_path, url, header)
+    gc.collect()
+    if allocations:
+        # tracemalloc slows the allocations down a lot, so it has its own run which is not timed
+        tracemalloc.start()
+        run()
+        allocated_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'allocated_mb': round(allocated_bytes / 2**20, 1)}
+
+    start, start_cpu = time.perf_counter(), time.process_time()
+    run()
+    wall_time, cpu_time = time.perf_counter() - start, time.process_time() - start_cpu
+    # ru_maxrss is in kilobytes on linux
+    return {'wall_s': round(wall_time, 4), 'cpu_s': round(cpu_time, 4),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+def import_time_ms(repeat: int, work_dir: str) -> float:
+    """The best cumulative time of importing package_statistics in a new process, from python -X importtime"""
+    env = bytecode_env(os.path.join(work_dir, 'pycache'))
+    times = []
+    for _ in range(repeat + 1):  # The first run compiles the modules
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import package_statistics'],
+                                check=True, capture_output=True, text=True, cwd=SRC_FOLDER, env=env).stderr
+        times.extend(int(line.split('|')[1]) for line in stderr.splitlines()
+                     if line.rstrip().endswith('| package_statistics'))
+    return round(min(times) / 1000, 1)
+
+
+def measure(case: str, file_path: str, url: str, header: bool, repeat: int, work_dir: str) -> dict:
+    """Run a case in fresh processes, so that a case does not see the memory of another one"""
+    command = [sys.executable, os.path.abspath(__file__), '--run', case, '--file', file_path, '--url', url]
+    if header:
+        command.append('--header')
+    runs = [json.loads(subprocess.run(command, check=True, capture_output=True, text=True, cwd=work_dir).stdout)
+            for _ in range(repeat)]
+    result = min(runs, key=lambda measured: measured['wall_s'])  # The best run is the least disturbed one
+    result['peak_rss_mb'] = max(measured['peak_rss_mb'] for measured in runs)
+    result.update(json.loads(subprocess.run(command + ['--allocations'], check=True, capture_output=True, text=True,
+                                            cwd=work_dir).stdout))
+    return result
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare the results of a report against a baseline report
+    :return: the list of (case, metric, baseline value, value) tuples worse than the baseline by more than tolerance
+    """
+    regressions = []
+    for case, result in report['results'].items():
+        baseline_result = baseline['results'].get(case, {})
+        for metric in COMPARED_METRICS:
+            if metric in result and baseline_result.get(metric):
+                if result[metric] > baseline_result[metric] * (1 + tolerance):
+                    regressions.append((case, metric, baseline_result[metric], result[metric]))
+    return regressions
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """Serve the files of a folder without logging every request"""
+    def log_message(self, *_):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    parser.add_argument('--packages', type=int, default=60_000)
+    parser.add_argument('--shared', type=float, default=0.05, help='The fraction of rows with several packages')
+    parser.add_argument('--header', action='store_true', help='Write and parse the FILE LOCATION header line')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of timed runs of each case')
+    parser.add_argument('--cases', default=','.join(CASES), help='The comma separated cases to run')
+    parser.add_argument('--output', help='The path where the JSON report is saved')
+    parser.add_argument('--baseline', help='The JSON report of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='The fraction a metric can be worse than the baseline before it is a regression')
+    parser.add_argument('--import_budget_ms', type=float, default=50,
+                        help='The longest time importing package_statistics may take, measured with -X importtime')
+    parser.add_argument('--run', choices=CASES, help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--allocations', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_case(args.run, args.file, args.url, args.header, args.allocations)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mirror_folder = os.path.join(tmp_dir, 'mirror')
+        os.mkdir(mirror_folder)
+        file_path = os.path.join(mirror_folder, f'Contents-{ARCHITECTURE}.gz')
+        size = write_contents_file(file_path, args.lines, args.packages, shared=args.shared, areas=0.1,
+                                   header=args.header)
+        compressed_size = os.path.getsize(file_path)
+
+        # A local HTTP server stands in for the debian mirror, so that the network does not change the results
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHTTPRequestHandler, directory=mirror_folder))
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/'
+
+        results = {}
+        for case in args.cases.split(','):
+            result = measure(case, file_path, url, args.header, args.repeat, tmp_dir)
+            if case in ('parse', 'parse_lists', 'cli'):
+                result['lines_per_s'] = round(args.lines / result['wall_s'])
+                result['mb_per_s'] = round(size / 2**20 / result['wall_s'], 1)  # Of the decompressed file
+            elif case == 'download':
+                result['mb_per_s'] = round(compressed_size / 2**20 / result['wall_s'], 1)
+            elif case == 'cached_cli':
+                result['import_ms'] = import_time_ms(args.repeat, tmp_dir)
+            results[case] = result
+            print(json.dumps({'case': case, **result}))
+        server.shutdown()
+
+    report = {'metadata': {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                           'python': platform.python_version(), 'machine': platform.machine(),
+                           'cpus': os.cpu_count(), 'lines': args.lines, 'packages': args.packages,
+                           'shared': args.shared, 'header': args.header, 'decompressed_mb': round(size / 2**20, 1),
+                           'compressed_mb': round(compressed_size / 2**20, 1)},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    over_budget = 'cached_cli' in results and results['cached_cli']['import_ms'] > args.import_budget_ms
+    if over_budget:
+        print(f"Over the import budget: package_statistics took {results['cached_cli']['import_ms']}ms to import, "
+              f"the budget is {args.import_budget_ms}ms")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['metadata'].get('lines') != args.lines:
+            print(f"Warning: the baseline was run on {baseline['metadata'].get('lines')} lines")
+        regressions = compare(report, baseline, args.tolerance)
+        for case, metric, baseline_value, value in regressions:
+            print(f'Regression: {case} {metric} {baseline_value} -> {value}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regression against {args.baseline}')
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Generator of synthetic debian contents files used by the benchmarks
+
+Usage: python benchmarks/synthetic_contents.py FILE [--lines 2000000] [--packages 60000] [--shared 0.05]
+       [--areas 0.1] [--header] [--seed 0]
+"""
+import argparse
+import gzip
+import random
+
+SECTIONS = ['admin', 'devel', 'doc', 'libs', 'net', 'python', 'utils', 'x11']
+AREAS = ['contrib', 'non-free']
+HEADER = 'This file maps each file available in the Debian GNU/Linux system to\n' \
+         'the package from which it originates.\n\n' \
+         f'{"FILE": <60}LOCATION\n'
+
+
+def write_contents_file(file_path: str, lines: int, packages: int, seed=0, shared=0.0, areas=0.0,
+                        header=False) -> int:
+    """
+    Write a gzip compressed contents file with the given number of lines. The files are spread
+    over the packages with a long tail distribution, like in the real contents files.
+    :param file_path: The path where the file is to be saved
+    :param lines: The number of table rows to be written
+    :param packages: The number of distinct packages
+    :param seed: The seed of the random generator, the same seed always gives the same file
+    :param shared: The fraction of the rows whose file belongs to 2 or 3 packages
+    :param areas: The fraction of the packages in the contrib or non-free $AREA instead of main
+    :param header: Write free form text and the FILE LOCATION header line before the table
+    :return: The size of the decompressed file in bytes
+    """
+    rng = random.Random(seed)
+    names = [f'{rng.choice(SECTIONS)}/package{i}' for i in range(packages)]
+    if areas:
+        names = [f'{rng.choice(AREAS)}/{name}' if rng.random() < areas else name for name in names]
+    # Weight of the i-th package falls off as 1/(i+1), so a few packages own most of the files
+    weights = [1 / (i + 1) for i in range(packages)]
+    size = 0
+    with gzip.open(file_path, 'wb', compresslevel=1) as f:
+        batch = [HEADER] if header else []
+        for i, location in enumerate(rng.choices(names, weights=weights, k=lines)):
+            path = f'usr/share/{location.rpartition("/")[2]}/file{i}.txt'
+            if shared and rng.random() < shared:
+                # Files like the ones of -dev or transitional packages are listed with several packages
+                location = ','.join([location] + rng.sample(names, rng.randint(1, 2)))
+            batch.append(f'{path}{" " * 20}{location}\n')
+            if len(batch) == 10000:
+                data = ''.join(batch).encode('utf-8')
+                size += len(data)
+                f.write(data)
+                batch = []
+        data = ''.join(batch).encode('utf-8')
+        size += len(data)
+        f.write(data)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('file', help='The path of the gzip compressed contents file to write')
+    parser.add_argument('--lines', type=int, default=2_000_000)
+    parser.add_argument('--packages', type=int, default=60_000)
+    parser.add_argument('--shared', type=float, default=0.05, help='The fraction of rows with several packages')
+    parser.add_argument('--areas', type=float, default=0.1, help='The fraction of packages outside of main')
+    parser.add_argument('--header', action='store_true', help='Write the FILE LOCATION header line')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    size = write_contents_file(args.file, args.lines, args.packages, args.seed, args.shared, args.areas, args.header)
+    print(f'Wrote {args.lines} lines, {size / 2**20:.1f}MB decompressed, to {args.file}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Statistics over the contents files of several architectures, computed with numpy on the arrays of a columnar
+export instead of dictionaries of packages.
+
+The number of files of every package in every architecture is held in one int64 matrix of architectures x packages,
+aligned on the package ids of the export, so the totals over the architectures, the packages of a single architecture
+and the top k are a few operations on whole rows or columns. The rows of the export, one per package and section of an
+architecture, are kept for the statistics per section. Needs numpy.
+"""
+import numpy as np
+
+
+class ArchitectureAggregates:
+    """The number of files per package of several architectures, on a vocabulary of package ids shared by all"""
+
+    def __init__(self, architectures: list, package_names: list, section_names: list, rows: dict):
+        """
+        :param architectures: the architectures, the rows of the matrix are in this order
+        :param package_names: the name of every package id
+        :param section_names: the name of every section id
+        :param rows: the dictionary containing architecture -> dictionary of the package_ids, section_ids and files
+        arrays of its rows, see ColumnarExport.columns
+        """
+        self.architectures = list(architectures)
+        self.package_names = list(package_names)
+        self.section_names = list(section_names)
+        packages = len(self.package_names)
+
+        self._row_architectures = np.concatenate([np.full(len(rows[architecture]['files']), i, np.int64)
+                                                  for i, architecture in enumerate(self.architectures)])
+        self._row_packages = np.concatenate([rows[architecture]['package_ids'] for architecture in self.architectures])
+        self._row_packages = self._row_packages.astype(np.int64)
+        self._row_sections = np.concatenate([rows[architecture]['section_ids'] for architecture in self.architectures])
+        self._row_sections = self._row_sections.astype(np.int64)
+        self._row_files = np.concatenate([rows[architecture]['files'] for architecture in self.architectures])
+        self._row_files = self._row_files.astype(np.int64)
+
+        # The rows of a package in several sections of an architecture are added up in its cell of the matrix
+        self.files = np.bincount(self._row_architectures * packages + self._row_packages, weights=self._row_files,
+                                 minlength=len(self.architectures) * packages)
+        self.files = self.files.astype(np.int64).reshape(len(self.architectures), packages)
+        # The rank of every package name in sorted order, the ties on the number of files are broken by the name
+        self._name_ranks = np.empty(packages, np.int64)
+        self._name_ranks[np.argsort(np.array(self.package_names, dtype=str), kind='stable')] = np.arange(packages)
+
+    @classmethod
+    def from_export(cls, export) -> 'ArchitectureAggregates':
+        """
+        Aggregate the architectures of a columnar export
+        :param export: the ColumnarExport
+        :return: the ArchitectureAggregates of all the architectures of the export
+        """
+        return cls(export.architectures, export.package_names, export.section_names,
+                   {architecture: export.columns(architecture) for architecture in export.architectures})
+
+    @classmethod
+    def from_counts(cls, files_count_per_section_per_architecture: dict) -> 'ArchitectureAggregates':
+        """
+        Aggregate the counts of parsed contents files
+        :param files_count_per_section_per_architecture: the dictionary containing architecture -> dictionary of
+        section -> Counter of package -> number of files mappings, see ContentsParser.count_files_per_section
+        :return: the ArchitectureAggregates of the architectures
+        """
+        package_ids, section_ids, rows = {}, {}, {}
+        for architecture, files_count_per_section in files_count_per_section_per_architecture.items():
+            columns = {'package_ids': [], 'section_ids': [], 'files': []}
+            for section, files_count_per_package in files_count_per_section.items():
+                section_id = section_ids.setdefault(section, len(section_ids))
+                for package_name, count in files_count_per_package.items():
+                    columns['package_ids'].append(package_ids.setdefault(package_name, len(package_ids)))
+                    columns['section_ids'].append(section_id)
+                    columns['files'].append(count)
+            rows[architecture] = {name: np.array(values, np.int64) for name, values in columns.items()}
+        return cls(list(rows), list(package_ids), list(section_ids), rows)
+
+    def _ranked(self, package_ids: np.ndarray, counts: np.ndarray) -> list:
+        """
+        Sort packages by most files, then by package name
+        :param package_ids: the ids of the packages
+        :param counts: the number of files of the packages, aligned with package_ids
+        :return: A list (package_name, number of files) of the packages
+        """
+        order = np.lexsort((self._name_ranks[package_ids], -counts))
+        return [(self.package_names[package_id], count)
+                for package_id, count in zip(package_ids[order].tolist(), counts[order].tolist())]
+
+    def totals(self) -> np.ndarray:
+        """The number of files of every package id added up over the architectures"""
+        return self.files.sum(axis=0)
+
+    def top_k(self, k: int, architecture=None) -> list:
+        """
+        The top k packages with the most files, the same as top_k_packages on the counts
+        :param k: the number of packages returned
+        :param architecture: the architecture, None for the files added up over the architectures
+        :return: A list (package_name, number of files) sorted by most files, then by package name, empty if k <= 0
+        """
+        if k <= 0:
+            return []
+        counts = self.totals() if architecture is None else self.files[self.architectures.index(architecture)]
+        package_ids = np.flatnonzero(counts)
+        if k < len(package_ids):
+            # Only the packages with at least the files of the k-th package can be in the top k, ties included
+            kth = np.partition(counts[package_ids], len(package_ids) - k)[len(package_ids) - k]
+            package_ids = package_ids[counts[package_ids] >= kth]
+        return self._ranked(package_ids, counts[package_ids])[:k]
+
+    def architecture_specific(self) -> dict:
+        """
+        The packages that have files in only one of the architectures
+        :return: the dictionary containing architecture -> list (package_name, number of files) of the packages only
+        in this architecture, sorted by most files then by package name
+        """
+        present = self.files > 0
+        specific = present.sum(axis=0) == 1
+        owners = present.argmax(axis=0)
+        specific_packages = {}
+        for i, architecture in enumerate(self.architectures):
+            package_ids = np.flatnonzero(specific & (owners == i))
+            specific_packages[architecture] = self._ranked(package_ids, self.files[i, package_ids])
+        return specific_packages
+
+    def section_percentiles(self, percentiles=(50, 90, 99), architecture=None) -> dict:
+        """
+        The percentiles of the number of files of the packages of every section, interpolated linearly between the
+        closest packages like numpy.percentile
+        :param percentiles: the percentiles, between 0 and 100
+        :param architecture: the architecture, None for the files of a package in a section added up over the
+        architectures
+        :return: the dictionary containing section -> list of the percentiles mappings, sorted by section
+        :raise ValueError: if a percentile is not between 0 and 100
+        """
+        if not all(0 <= percentile <= 100 for percentile in percentiles):
+            raise ValueError(f'The percentiles have to be between 0 and 100: {percentiles}')
+        rows = slice(None)
+        if architecture is not None:
+            rows = self._row_architectures == self.architectures.index(architecture)
+        # The files of a package in a section, a package listed in several sections is counted in each of them
+        keys, inverse = np.unique(self._row_sections[rows] * len(self.package_names) + self._row_packages[rows],
+                                  return_inverse=True)
+        counts = np.bincount(inverse, weights=self._row_files[rows]).astype(np.int64)
+        sections = keys // len(self.package_names)
+
+        # The packages of every section are sorted by their number of files, each section is a run of the array
+        order = np.lexsort((counts, sections))
+        counts, sections = counts[order], sections[order]
+        if not len(counts):
+            return {}  # No package has files, an empty contents file for example
+        starts = np.flatnonzero(np.r_[True, sections[1:] != sections[:-1]])
+        sizes = np.diff(np.r_[starts, len(counts)])
+        values = []
+        for percentile in percentiles:
+            position = starts + (sizes - 1) * (percentile / 100)
+            low, high = np.floor(position).astype(np.int64), np.ceil(position).astype(np.int64)
+            values.append(counts[low] + (counts[high] - counts[low]) * (position - low))
+
+        percentiles_per_section = {self.section_names[section]: [float(value[i]) for value in values]
+                                   for i, section in enumerate(sections[starts].tolist())}
+        return dict(sorted(percentiles_per_section.items()))
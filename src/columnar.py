@@ -0,0 +1,330 @@
+"""Columnar export of the number of files per package of contents files, for analytics that load the counts as
+arrays instead of parsing the text output of the commands.
+
+An export is a folder of NumPy .npy files, written without numpy, that numpy memory maps with
+np.load(path, mmap_mode='r'), see ColumnarExport:
+- packages.npy: uint8 the utf-8 package names joined, package_offsets.npy: uint64[packages + 1] their offsets,
+  the name of the package id i is packages[package_offsets[i]:package_offsets[i + 1]]
+- sections.npy and section_offsets.npy: the $AREA/$SECTION names the same way, the empty section is id 0
+- {architecture}.package_ids.npy: uint32, {architecture}.section_ids.npy: uint32, {architecture}.files.npy: int64
+  the rows of the architecture, the number of files of a package in a section
+- export.json: the architectures and the number of rows of each, written last so an export is never seen half written
+The package and section ids are shared by all the architectures, so the arrays of several architectures are aligned
+on the same vocabulary. The rows are written in batches of EXPORT_BATCH_ROWS as they are produced, the only thing
+kept in memory is the vocabulary.
+
+The same arrays can also be bundled in a single .npz file, and written as an Arrow IPC file or a Parquet file with the
+columns architecture, section, package and files when pyarrow is installed.
+"""
+import ast
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zipfile
+from array import array
+from importlib import import_module
+from constants import EXPORT_BATCH_ROWS
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'  # The magic string of the .npy format and its version 1.0
+NPY_HEADER_SIZE = 128  # The size of the header, large enough for any shape so it can be written again at the end
+NPY_BYTE_ORDER = '<' if sys.byteorder == 'little' else '>'
+# The array typecodes written and their numpy dtype without the byte order
+NPY_TYPES = {'B': 'u1', 'I': 'u4', 'Q': 'u8', 'q': 'i8'}
+MANIFEST_FILE = 'export.json'
+
+
+class ExportFormatNotAvailable(Exception):
+    """Raise if an export format needs a module that is not installed"""
+    pass
+
+
+class InvalidExportFolder(Exception):
+    """Raise if the folder of an export holds something else than a previous export, which it would replace"""
+    pass
+
+
+def check_export_folder(folder: str):
+    """
+    Check that an export can be written to a folder. The folder is replaced by the export, so it has to be missing,
+    empty or a previous export, and it can not be the working directory or one of its parents.
+    :param folder: the folder of the export
+    :raise InvalidExportFolder: if the folder can not be replaced
+    """
+    folder, cwd = os.path.realpath(folder), os.path.realpath(os.getcwd())
+    if cwd == folder or cwd.startswith(folder.rstrip(os.sep) + os.sep):
+        raise InvalidExportFolder(f'{folder} contains the working directory, choose a folder for the export only')
+    if os.path.lexists(folder):
+        if not os.path.isdir(folder) or os.path.islink(folder):
+            raise InvalidExportFolder(f'{folder} is not a folder')
+        if os.listdir(folder) and not os.path.isfile(os.path.join(folder, MANIFEST_FILE)):
+            raise InvalidExportFolder(f'{folder} is not a previous export ({MANIFEST_FILE} not found), '
+                                      f'it is not replaced')
+
+
+def npy_header(typecode: str, length: int) -> bytes:
+    """
+    The header of a .npy file holding a one dimensional array
+    :param typecode: the typecode of the array module of the values, see NPY_TYPES
+    :param length: the number of values
+    :return: the header, NPY_HEADER_SIZE bytes so that the values start 64 byte aligned
+    """
+    descr = f"{'|' if NPY_TYPES[typecode] == 'u1' else NPY_BYTE_ORDER}{NPY_TYPES[typecode]}"
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({length},), }}"
+    header_size = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2  # The uint16 size of the header follows the magic
+    return NPY_MAGIC + struct.pack('<H', header_size) + header.ljust(header_size - 1).encode('latin1') + b'\n'
+
+
+def read_npy(path: str) -> array:
+    """
+    Read a one dimensional .npy file written by NpyWriter without numpy
+    :param path: the path of the file
+    :return: the array of the values
+    :raise ValueError: if the file is not a .npy file of one of the types of NPY_TYPES in the native byte order
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(NPY_MAGIC)) != NPY_MAGIC:
+            raise ValueError(f'{path} is not a .npy file')
+        header_size, = struct.unpack('<H', f.read(2))
+        descr = ast.literal_eval(f.read(header_size).decode('latin1'))['descr']
+        typecodes = {f"{'|' if dtype == 'u1' else NPY_BYTE_ORDER}{dtype}": typecode
+                     for typecode, dtype in NPY_TYPES.items()}
+        if descr not in typecodes:
+            raise ValueError(f'{path} holds {descr} values, which are not read without numpy')
+        values = array(typecodes[descr])
+        values.frombytes(f.read())
+    return values
+
+
+class NpyWriter:
+    """Write a one dimensional .npy file as the values are produced, the number of values is not known in advance"""
+
+    def __init__(self, path: str, typecode: str):
+        """
+        :param path: the path of the file
+        :param typecode: the typecode of the array module of the values, see NPY_TYPES
+        """
+        self.path = path
+        self.typecode = typecode
+        self.length = 0
+        self._values = array(typecode)  # The values waiting to be written
+        self._file = open(path, 'wb')
+        self._file.write(npy_header(typecode, 0))
+
+    def append(self, value):
+        self._values.append(value)
+        if len(self._values) >= EXPORT_BATCH_ROWS:
+            self.flush()
+
+    def extend(self, values):
+        self._values.extend(values)
+        if len(self._values) >= EXPORT_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        self._file.write(self._values.tobytes())
+        self.length += len(self._values)
+        self._values = array(self.typecode)
+
+    def close(self):
+        """Write the remaining values and the header with the final shape"""
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.seek(0)
+        self._file.write(npy_header(self.typecode, self.length))
+        self._file.close()
+
+
+class _Vocabulary:
+    """The names given ids in the order they are first seen, written to a blob and an offsets .npy file"""
+
+    def __init__(self, folder: str, name: str):
+        self.ids = {}  # name -> id
+        self._blob = NpyWriter(os.path.join(folder, f'{name}.npy'), 'B')
+        self._offsets = NpyWriter(os.path.join(folder, f'{name[:-1]}_offsets.npy'), 'Q')
+        self._offsets.append(0)
+        self._size = 0
+
+    def id(self, name: str) -> int:
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.ids)
+            encoded = name.encode('utf-8')
+            self._blob.extend(encoded)
+            self._size += len(encoded)
+            self._offsets.append(self._size)
+        return name_id
+
+    def close(self):
+        self._blob.close()
+        self._offsets.close()
+
+
+class ColumnarWriter:
+    """
+    Write the counts of the files per package and section of several architectures to a columnar export.
+    The export is written to a {folder}.*.part folder next to it and replaces the folder when the writer is closed,
+    the previous export is kept till the new one is complete.
+    """
+
+    def __init__(self, folder: str, formats=()):
+        """
+        :param folder: the folder of the .npy files, the .npz, .arrow and .parquet files are saved next to it with
+        the folder name and their extension
+        :param formats: the formats written along with the .npy files, see EXPORT_FORMATS
+        :raise ExportFormatNotAvailable: if arrow or parquet is asked for and pyarrow is not installed
+        :raise InvalidExportFolder: if the folder exists and is not a previous export, see check_export_folder
+        """
+        check_export_folder(folder)
+        self.folder = os.path.normpath(folder)
+        self.formats = formats
+        self._pyarrow = None
+        if 'arrow' in formats or 'parquet' in formats:
+            try:
+                self._pyarrow = import_module('pyarrow')
+            except ImportError:
+                raise ExportFormatNotAvailable('The arrow and parquet formats need pyarrow, pip install pyarrow')
+        # A new folder next to the export, so that nothing else is overwritten while the export is written
+        parent = os.path.dirname(os.path.abspath(self.folder))
+        os.makedirs(parent, exist_ok=True)
+        self._part = tempfile.mkdtemp(prefix=f'{os.path.basename(self.folder)}.', suffix='.part', dir=parent)
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self._part, 0o777 & ~umask)  # mkdtemp makes the folder private to the user
+        self._packages = _Vocabulary(self._part, 'packages')
+        self._sections = _Vocabulary(self._part, 'sections')
+        self._sections.id('')
+        self.rows_per_architecture = {}
+        self._arrow_writers = []
+
+    def add(self, architecture: str, files_count_per_section: dict):
+        """
+        Write the rows of an architecture
+        :param architecture: the architecture of the contents file
+        :param files_count_per_section: the dictionary containing section -> Counter of package -> number of files
+        mappings, see ContentsParser.count_files_per_section
+        """
+        if architecture in self.rows_per_architecture:
+            raise ValueError(f'The architecture {architecture} is already exported')
+        columns = {name: NpyWriter(os.path.join(self._part, f'{architecture}.{name}.npy'), typecode)
+                   for name, typecode in [('package_ids', 'I'), ('section_ids', 'I'), ('files', 'q')]}
+        arrow_batch = ([], [], [])  # The section, package and files columns of the next Arrow record batch
+        for section, files_count_per_package in files_count_per_section.items():
+            section_id = self._sections.id(section)
+            for package_name, count in files_count_per_package.items():
+                columns['package_ids'].append(self._packages.id(package_name))
+                columns['section_ids'].append(section_id)
+                columns['files'].append(count)
+                if self._pyarrow is not None:
+                    for column, value in zip(arrow_batch, (section, package_name, count)):
+                        column.append(value)
+                    if len(arrow_batch[0]) >= EXPORT_BATCH_ROWS:
+                        self._write_arrow_batch(architecture, arrow_batch)
+                        arrow_batch = ([], [], [])
+        if self._pyarrow is not None and arrow_batch[0]:
+            self._write_arrow_batch(architecture, arrow_batch)
+        for column in columns.values():
+            column.close()
+        self.rows_per_architecture[architecture] = columns['files'].length
+
+    def _write_arrow_batch(self, architecture: str, columns: tuple):
+        """Write the rows to the Arrow and Parquet files, which are opened with the first batch"""
+        pa = self._pyarrow
+        schema = pa.schema([('architecture', pa.string()), ('section', pa.string()), ('package', pa.string()),
+                            ('files', pa.int64())])
+        if not self._arrow_writers:
+            if 'arrow' in self.formats:
+                self._arrow_writers.append(import_module('pyarrow.ipc').new_file(f'{self._part}.arrow', schema))
+            if 'parquet' in self.formats:
+                self._arrow_writers.append(import_module('pyarrow.parquet').ParquetWriter(f'{self._part}.parquet',
+                                                                                         schema))
+        batch = pa.record_batch([pa.array([architecture] * len(columns[0]), pa.string()), *map(pa.array, columns)],
+                                schema=schema)
+        for writer in self._arrow_writers:
+            writer.write_batch(batch)
+
+    def close(self):
+        """Write the vocabularies and the manifest, and replace the previous export"""
+        self._packages.close()
+        self._sections.close()
+        with open(os.path.join(self._part, MANIFEST_FILE), 'w') as f:
+            json.dump({'architectures': self.rows_per_architecture, 'packages': len(self._packages.ids),
+                       'sections': len(self._sections.ids)}, f)
+        for writer in self._arrow_writers:
+            writer.close()
+
+        if 'npz' in self.formats:
+            # The members are stored without compression, like the .npy files they are copied from
+            with zipfile.ZipFile(f'{self._part}.npz', 'w', zipfile.ZIP_STORED) as npz:
+                for file_name in sorted(os.listdir(self._part)):
+                    if file_name.endswith('.npy'):
+                        npz.write(os.path.join(self._part, file_name), file_name)
+        for extension in ['npz', 'arrow', 'parquet']:
+            if os.path.isfile(f'{self._part}.{extension}'):
+                os.replace(f'{self._part}.{extension}', f'{self.folder}.{extension}')
+        # The previous export is moved aside before it is removed, the folder is checked again in case it changed
+        check_export_folder(self.folder)
+        previous = None
+        if os.path.exists(self.folder):
+            previous = f'{self._part}.previous'
+            os.replace(self.folder, previous)
+        os.replace(self._part, self.folder)
+        if previous is not None:
+            shutil.rmtree(previous)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            for writer in self._arrow_writers:
+                writer.close()
+            for extension in ['npz', 'arrow', 'parquet']:
+                if os.path.isfile(f'{self._part}.{extension}'):
+                    os.remove(f'{self._part}.{extension}')
+            shutil.rmtree(self._part, ignore_errors=True)
+
+
+class ColumnarExport:
+    """
+    A columnar export opened with numpy, the arrays are memory mapped so only the pages read are loaded and several
+    processes share them. Needs numpy.
+    """
+
+    def __init__(self, folder: str, mmap_mode='r'):
+        """
+        :param folder: the folder of the export
+        :param mmap_mode: the mmap_mode of np.load, None to read the arrays in memory
+        """
+        self._np = import_module('numpy')
+        self.folder = folder
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(folder, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        self.architectures = list(manifest['architectures'])
+        self.package_names = self._names('packages')
+        self.section_names = self._names('sections')
+
+    def _load(self, file_name: str):
+        return self._np.load(os.path.join(self.folder, f'{file_name}.npy'), mmap_mode=self.mmap_mode)
+
+    def _names(self, name: str) -> list:
+        """Decode a vocabulary, the name of id i is at index i"""
+        blob, offsets = self._load(name).tobytes(), self._load(f'{name[:-1]}_offsets').tolist()
+        return [blob[start:end].decode('utf-8') for start, end in zip(offsets, offsets[1:])]
+
+    def columns(self, architecture: str) -> dict:
+        """
+        The rows of an architecture
+        :param architecture: the architecture of the contents file
+        :return: the dictionary of the package_ids, section_ids and files numpy arrays, aligned on the rows
+        :raise KeyError: if the architecture is not in the export
+        """
+        if architecture not in self.architectures:
+            raise KeyError(architecture)
+        return {name: self._load(f'{architecture}.{name}') for name in ['package_ids', 'section_ids', 'files']}
@@ -1,7 +1,26 @@
 """The constants used by package_statistics"""
 
 DOWNLOAD_FOLDER = "./downloads/"
-FILE_NAME_FORMAT = 'Contents-{0}.gz'
+FILE_NAME_FORMAT = 'Contents-{0}.{1}'  # The contents file of an architecture, compressed with one of COMPRESSIONS
+COMPRESSIONS = ['gz', 'xz']  # The compressions of the contents files published by the mirrors
 URL_BASE = "http://ftp.uk.debian.org/debian/dists/stable/main/"
 CHUNK_SIZE = 1024*1024
 K_VALUE = 10  # The number of maximum packages to be returned
+# The size of the blocks read from the compressed contents file, or from the output of a decompression command
+READ_BLOCK_SIZE = 256*1024
+PARALLEL_CHUNK_SIZE = 8*1024*1024  # The size of the chunks handed to each worker process when parsing in parallel
+# The architectures of the contents files published by the mirror, "all" is for architecture independent packages
+ARCHITECTURES = ['all', 'amd64', 'arm64', 'armel', 'armhf', 'i386', 'mips64el', 'mipsel', 'ppc64el', 's390x']
+VALIDATORS_FILE_FORMAT = '{0}.headers'  # The file keeping the ETag and Last-Modified headers of a downloaded file
+DIGEST_FILE_FORMAT = '{0}.sha256'  # The file keeping the SHA256 of a downloaded file, see ResultCache.file_digest
+RESULT_CACHE_FOLDER = "./downloads/results/"  # The parsed counts are cached here, it is removed with the downloads
+RESULT_CACHE_MAX_BYTES = 32*1024*1024  # The least recently used results are evicted above this size
+INDEX_FILE_FORMAT = 'Contents-{0}.index'  # The index of the packages and files of a contents file
+# The snapshots compared by the diff command, kept outside of the downloads so that they are not removed with them
+SNAPSHOT_FOLDER = "./snapshots/"
+SNAPSHOT_FILE_FORMAT = 'Contents-{0}.snapshot.gz'
+SOCKET_PATH = "./package_statistics.sock"  # The Unix socket of the query server, outside of the downloads folder
+EXPORT_FOLDER = "./export/"  # The columnar export of the export command, see columnar.py
+EXPORT_FORMATS = ['npz', 'arrow', 'parquet']  # The formats written along with the .npy files of an export
+EXPORT_BATCH_ROWS = 64*1024  # The rows kept in memory before they are written to the columnar export
+FILES_MEMORY_BUDGET = 64*1024*1024  # The records of the files command sorted in memory before they are spilled to disk
@@ -0,0 +1,301 @@
+"""On disk index of the packages and files of a contents file.
+The index is built once from a contents file and memory mapped when it is opened, so a lookup only
+touches the few pages it needs and the contents file is never parsed again.
+
+Layout of the index file, every array is 8 byte aligned and in the byte order given in the header
+- header: magic, byte order, number of packages, number of paths, number of (package, path) links, PATH_BLOCK_SIZE
+- package_name_offsets: uint64[packages + 1] offsets of the sorted package names in the package name blob
+- package_link_offsets: uint64[packages + 1] offsets of the files of each package in package_links
+- package_links: uint32[links] the path ids of the files of each package
+- path_block_offsets: uint64[blocks + 1] offsets of the blocks of PATH_BLOCK_SIZE sorted paths in the path blob
+- path_link_offsets: uint64[paths + 1] offsets of the packages of each path in path_links
+- path_links: uint32[links] the package ids owning each path
+- the package name blob and the path blob
+
+The paths are front coded, sorted paths share long prefixes like usr/share/doc/. A block of the path blob
+starts with a full path (uint16 length, bytes), every other path of the block is stored as the length of the
+prefix it shares with the previous path and the rest of it (uint16 shared length, uint16 length, bytes).
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b'PSI2'
+# magic, byte order (0 little, 1 big), number of packages, number of paths, number of links, paths per block
+HEADER = struct.Struct('<4sB3xQQQI4x')
+BYTE_ORDER = 0 if sys.byteorder == 'little' else 1
+PATH_BLOCK_SIZE = 16  # The number of front coded paths in a block, a lookup decodes one block
+FULL_PATH = struct.Struct('<H')  # The length of the full path starting a block
+CODED_PATH = struct.Struct('<HH')  # The prefix shared with the previous path and the length of the rest
+
+
+class InvalidIndexFormat(Exception):
+    """Raise if the file is not an index or was built on a machine with another byte order"""
+    pass
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def write_index(index_path: str, rows):
+    """
+    Build the index from the rows of a contents file
+    :param index_path: the path where the index is to be saved
+    :param rows: an iterable of (file, comma separated list of qualified package names) tuples of raw bytes
+    """
+    location_per_path = {}
+    for path, location in rows:
+        path = path.lstrip(b'/')
+        # A path listed in several rows belongs to the packages of all the rows
+        known_location = location_per_path.get(path)
+        location_per_path[path] = location if known_location is None else known_location + b',' + location
+
+    # Most paths share their location with many other paths, so every distinct location is split only once.
+    # A qualified package name has the form [[$AREA/]$SECTION/]$NAME, only $NAME is indexed.
+    names_per_location = {location: {qualified_package_name.rpartition(b'/')[2]
+                                     for qualified_package_name in location.split(b',')}
+                          for location in set(location_per_path.values())}
+    package_names = sorted(set().union(*names_per_location.values()))
+    package_ids = {package_name: i for i, package_name in enumerate(package_names)}
+    ids_per_location = {location: sorted(package_ids[package_name] for package_name in names)
+                        for location, names in names_per_location.items()}
+    del names_per_location
+
+    # The path ids are given in sorted order, so the files of every package are also sorted
+    paths = sorted(location_per_path)
+    path_link_offsets, path_links = array('Q', [0]), array('I')
+    files_per_package = [array('I') for _ in package_names]
+    for path_id, path in enumerate(paths):
+        for package_id in ids_per_location[location_per_path[path]]:
+            path_links.append(package_id)
+            files_per_package[package_id].append(path_id)
+        path_link_offsets.append(len(path_links))
+    del location_per_path
+
+    package_link_offsets, package_links = array('Q', [0]), array('I')
+    for path_ids in files_per_package:
+        package_links.extend(path_ids)
+        package_link_offsets.append(len(package_links))
+
+    path_block_offsets, path_blob = _front_code(paths)
+    sections = [_blob_offsets(package_names), package_link_offsets, package_links,
+                path_block_offsets, path_link_offsets, path_links]
+    with open(f'{index_path}.part', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, BYTE_ORDER, len(package_names), len(paths), len(path_links), PATH_BLOCK_SIZE))
+        for section in sections:
+            f.write(section.tobytes())
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+        f.write(b''.join(package_names))
+        f.write(path_blob)
+    os.replace(f'{index_path}.part', index_path)  # An index is never seen half written
+
+
+def _blob_offsets(values: list) -> array:
+    """The offsets of the values when they are joined in a blob, the value i is blob[offsets[i]:offsets[i + 1]]"""
+    offsets = array('Q', [0])
+    for value in values:
+        offsets.append(offsets[-1] + len(value))
+    return offsets
+
+
+def _front_code(paths: list):
+    """
+    Front code the sorted paths in blocks of PATH_BLOCK_SIZE paths
+    :return: the offsets of the blocks in the blob and the blob
+    """
+    block_offsets, blob = array('Q', [0]), bytearray()
+    previous = b''
+    for i, path in enumerate(paths):
+        if i % PATH_BLOCK_SIZE == 0:
+            if i:
+                block_offsets.append(len(blob))
+            blob += FULL_PATH.pack(len(path))
+            blob += path
+        else:
+            shared = len(os.path.commonprefix((previous, path)))
+            blob += CODED_PATH.pack(shared, len(path) - shared)
+            blob += path[shared:]
+        previous = path
+    if paths:
+        block_offsets.append(len(blob))
+    return block_offsets, blob
+
+
+class ContentsIndex:
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path  # The path of the index built by write_index
+        with open(index_path, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # An empty file can not be mapped
+                raise InvalidIndexFormat(index_path)
+        try:
+            magic, byte_order, packages, paths, links, self.path_block_size = HEADER.unpack_from(self._mmap)
+        except struct.error:
+            magic = byte_order = None
+        if magic != MAGIC or byte_order != BYTE_ORDER or not self.path_block_size:
+            self._invalid()
+
+        self.packages = packages  # The number of packages in the index
+        self.paths = paths  # The number of paths in the index
+        # The arrays are views on the memory map, nothing is copied
+        self._view = memoryview(self._mmap)
+        offset = HEADER.size
+        self._sections = []
+        self.blocks = -(-paths // self.path_block_size)  # The number of blocks of front coded paths
+        for item_format, length in (('Q', packages + 1), ('Q', packages + 1), ('I', links),
+                                    ('Q', self.blocks + 1), ('Q', paths + 1), ('I', links)):
+            size = length * struct.calcsize(item_format)
+            if offset + size > len(self._view):  # The counts of the header do not match the size of the file
+                self._invalid()
+            self._sections.append(self._view[offset:offset + size].cast(item_format))
+            offset = _aligned(offset + size)
+        (self._package_name_offsets, self._package_link_offsets, self._package_links,
+         self._path_block_offsets, self._path_link_offsets, self._path_links) = self._sections
+        self._package_name_start = offset  # The offset of the package name blob in the file
+        self._path_start = offset + self._package_name_offsets[-1]  # The offset of the path blob in the file
+        if self._path_start + self._path_block_offsets[-1] > len(self._view):  # The blobs are truncated
+            self._invalid()
+
+    def _invalid(self):
+        """Close the index and raise InvalidIndexFormat"""
+        self.close()
+        raise InvalidIndexFormat(self.index_path)
+
+    def close(self):
+        """Release the memory map"""
+        for section in getattr(self, '_sections', []):
+            section.release()
+        if hasattr(self, '_view'):
+            self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _value(self, start: int, offsets, i: int) -> bytes:
+        """The i-th value of the blob at start in the file"""
+        return self._mmap[start + offsets[i]:start + offsets[i + 1]]
+
+    def package_name(self, package_id: int) -> str:
+        """The name of the package with the given id, the ids are in sorted order of the names"""
+        return self._value(self._package_name_start, self._package_name_offsets, package_id).decode('utf-8')
+
+    def _path_block(self, block: int) -> list:
+        """Decode the paths of a block of front coded paths"""
+        offset = self._path_start + self._path_block_offsets[block]
+        end = self._path_start + self._path_block_offsets[block + 1]
+        length, = FULL_PATH.unpack_from(self._mmap, offset)
+        offset += FULL_PATH.size
+        path = self._mmap[offset:offset + length]
+        offset += length
+        paths = [path]
+        while offset < end:
+            shared, length = CODED_PATH.unpack_from(self._mmap, offset)
+            offset += CODED_PATH.size
+            path = path[:shared] + self._mmap[offset:offset + length]
+            offset += length
+            paths.append(path)
+        return paths
+
+    def _first_path(self, block: int) -> bytes:
+        """The full path starting a block"""
+        offset = self._path_start + self._path_block_offsets[block]
+        length, = FULL_PATH.unpack_from(self._mmap, offset)
+        return self._mmap[offset + FULL_PATH.size:offset + FULL_PATH.size + length]
+
+    def path(self, path_id: int) -> str:
+        """The path with the given id, the ids are in sorted order of the paths"""
+        return self._path_block(path_id // self.path_block_size)[path_id % self.path_block_size].decode('utf-8')
+
+    def _bisect_left(self, start: int, offsets, count: int, key: bytes) -> int:
+        """Binary search of the first value of a sorted blob that is not smaller than the key"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._value(start, offsets, middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _find(self, start: int, offsets, count: int, key: bytes) -> int:
+        """The id of the key in a sorted blob, -1 if it is not there"""
+        i = self._bisect_left(start, offsets, count, key)
+        if i < count and self._value(start, offsets, i) == key:
+            return i
+        return -1
+
+    def _packages_of(self, path_id: int) -> list:
+        """The sorted names of the packages owning the path with the given id"""
+        start, end = self._path_link_offsets[path_id], self._path_link_offsets[path_id + 1]
+        return [self.package_name(package_id) for package_id in self._path_links[start:end]]
+
+    def _iter_paths_from(self, key: bytes):
+        """
+        Iterate over the sorted paths starting with the first path that is not smaller than the key
+        :return: a generator of (path id, path) tuples, the paths are raw bytes
+        """
+        # Find the last block starting before the key, the paths from the key on start in that block
+        low, high = 0, self.blocks
+        while low < high:
+            middle = (low + high) // 2
+            if self._first_path(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        block = max(low - 1, 0)
+        for block in range(block, self.blocks):
+            for i, path in enumerate(self._path_block(block)):
+                if path >= key:
+                    yield block * self.path_block_size + i, path
+
+    def files_of(self, package_name: str) -> list:
+        """
+        Find the files of a package
+        :param package_name: the name of the package, without $AREA/$SECTION/
+        :return: the sorted list of the files of the package, empty if the package is not in the index
+        """
+        package_id = self._find(self._package_name_start, self._package_name_offsets, self.packages,
+                                package_name.encode('utf-8'))
+        if package_id < 0:
+            return []
+        start, end = self._package_link_offsets[package_id], self._package_link_offsets[package_id + 1]
+        files, block, paths = [], None, None
+        for path_id in self._package_links[start:end]:
+            # The path ids are sorted, so a block is decoded only once for all the files of the package in it
+            if path_id // self.path_block_size != block:
+                block = path_id // self.path_block_size
+                paths = self._path_block(block)
+            files.append(paths[path_id % self.path_block_size].decode('utf-8'))
+        return files
+
+    def packages_owning(self, path: str) -> list:
+        """
+        Find the packages owning a file
+        :param path: the path of the file, with or without the leading /
+        :return: the sorted list of the packages owning the file, empty if the file is not in the index
+        """
+        key = path.lstrip('/').encode('utf-8')
+        for path_id, found_path in self._iter_paths_from(key):
+            return self._packages_of(path_id) if found_path == key else []
+        return []
+
+    def paths_with_prefix(self, prefix: str):
+        """
+        Find the files under a directory, or more generally the files whose path starts with the prefix
+        :param prefix: the start of the paths, with or without the leading /
+        :return: a generator of (path, sorted list of the packages owning it) tuples in sorted order of the paths
+        """
+        key = prefix.lstrip('/').encode('utf-8')
+        for path_id, path in self._iter_paths_from(key):
+            if not path.startswith(key):
+                break
+            yield path.decode('utf-8'), self._packages_of(path_id)
@@ -1,9 +1,55 @@
 """Class to parse the contents of the debian content file.
 File format can be found t https://wiki.debian.org/RepositoryFormat#A.22Contents.22_indices
 """
-import gzip
-from collections import defaultdict
-from heapq import heapify, heappop
+import re
+from collections import Counter, defaultdict
+from itertools import islice, repeat
+from operator import itemgetter
+from constants import READ_BLOCK_SIZE, PARALLEL_CHUNK_SIZE
+from decompression import inflate_chunks, iter_decompressed_file
+from package_files import PackageFiles
+from timings import iter_stage, stage
+from top_k import TopK
+
+# The table header line, FILE and LOCATION separated by whitespace
+HEADER_PATTERN = re.compile(rb'^[ \t]*FILE[ \t]+LOCATION[ \t\r]*\n', re.MULTILINE)
+
+
+def row_locations(block: bytes):
+    """
+    Pick the LOCATION column of every row in a block of raw bytes, without decoding the rows
+    :param block: the block of table rows
+    :return: an iterable of locations, blank rows give an empty location
+    """
+    lines = block.splitlines()
+    if b'\t' in block or b' \n' in block or b' \r' in block:
+        # Tabs or trailing whitespace are rare, such blocks are split the slower way which strips the rows
+        return [line.rsplit(None, 1)[-1] if line.strip() else b'' for line in lines]
+    # The location is everything after the last space of the row. map and itemgetter keep the loop in C.
+    return map(itemgetter(2), map(bytes.rpartition, lines, repeat(b' ')))
+
+
+def count_rows_per_location(chunk: bytes) -> Counter:
+    """
+    Count the rows of every location in a chunk of table rows. This is the work done by each worker process
+    when the contents file is parsed in parallel.
+    :param chunk: the chunk of table rows, it has to end at a line break
+    :return: the Counter containing location -> number of rows mappings
+    """
+    return Counter(row_locations(chunk))
+
+
+def top_k_packages(files_count_per_package: dict, k: int) -> list:
+    """
+    Find the top k packages with most files associated with it.
+    :param files_count_per_package: the dictionary containing package -> number of files mappings
+    :param k: The value k gives the number of top packages that needs to be returned
+    :return: A list (package_name, number of files) containing the k top packages
+    """
+    # Only the k best packages are kept while going over the packages, see TopK
+    top_k = TopK(k)
+    top_k.update(files_count_per_package)
+    return top_k.result()
 
 
 class InvalidContentFileFormat(Exception):
@@ -13,45 +59,281 @@ class InvalidContentFileFormat(Exception):
 
 class ContentsParser:
 
-    def __init__(self, filepath, table_header=True):
+    def __init__(self, filepath, table_header=True, workers=1, cache=None, timings=None, decompressor=None):
         self.filepath = filepath  # The path to the file that is to be parsed
         self.table_header = table_header
+        self.workers = workers  # The number of processes counting the rows, 1 counts in the calling process
+        self.cache = cache  # The ResultCache the counts are loaded from and stored to, None to always parse
+        self._files_count_per_package = None  # The counts are kept once parsed, so the file is parsed only once
+        self._files_count_ranked = False  # The counts are sorted by most files, they were loaded from the cache
+        self._rows_count_per_location = None  # The rows counted per location, kept for the counts per section
+        self.compressed_chunks = None  # The chunks of the gzip file, used instead of the filepath when streaming
+        self.timings = timings  # The StageTimings the stages of the parsing are recorded in, None to not time them
+        # The name of the decompression backend, see decompression.BACKENDS, None to use the fastest one installed
+        self.decompressor = decompressor
 
-    def get_files_list_per_package(self) -> defaultdict:
+    @classmethod
+    def from_stream(cls, compressed_chunks, table_header=True, workers=1, cache=None, timings=None,
+                    decompressor=None):
         """
-        Parse the contents file and create a dictionary of package -> list of files
-        :return: the dictionary containing package -> list of files mappings
-        """
-        files_list_per_package = defaultdict(list)
-
-        table_started = False
-        with gzip.GzipFile(self.filepath) as lines:
-            for i, line in enumerate(lines):
-                line = line.decode('utf-8')
-
-                left, _, right = line.strip().rpartition(' ')
-                left = left.strip()
-                right = right.strip()
-                # Loop over the lines till FILE and LOCATION is found if table_header is true
-                if self.table_header and not table_started:
-                    if left == 'FILE' and right == 'LOCATION':
-                        table_started = True
-                    continue
+        Create a parser that parses the chunks of a gzip or xz compressed contents file as they arrive, for example
+        from a download in progress. The chunks can be consumed only once, the counts are kept once parsed.
+        The counts of a stream are not cached since there is no file to compute the key from.
+        :param compressed_chunks: an iterable of the chunks of the compressed file
+        :return: the ContentsParser of the stream
+        """
+        content_parser = cls(None, table_header=table_header, workers=workers, timings=timings,
+                             decompressor=decompressor)
+        content_parser.compressed_chunks = compressed_chunks
+        return content_parser
+
+    def _iter_decompressed(self):
+        """
+        Decompress the contents file, compressed with gzip or xz
+        :return: a generator of decompressed bytes, the pieces can end anywhere in a line
+        """
+        if self.compressed_chunks is not None:
+            decompressed = inflate_chunks(self.compressed_chunks, self.decompressor)
+        else:
+            decompressed = iter_decompressed_file(self.filepath, READ_BLOCK_SIZE, self.decompressor)
+        yield from iter_stage(self.timings, 'inflate', decompressed)
 
-                # Once the table starts the right value contains list of qualified package names, separated by comma.
-                qualified_package_names = right.split(',')
+    def _iter_blocks(self):
+        """
+        Read the decompressed contents file in large blocks that always end at a line break
+        :return: a generator of blocks of raw bytes
+        """
+        tail = b''
+        for block in self._iter_decompressed():
+            block = tail + block
+            # Keep the incomplete last line of the block, it is completed by the next block
+            cut = block.rfind(b'\n') + 1
+            tail = block[cut:]
+            if cut:
+                yield block[:cut]
+        if tail:
+            yield tail + b'\n'
 
-                for qualified_package_name in qualified_package_names:
-                    # A qualified package name has the form [[$AREA/]$SECTION/]$NAME, where $AREA is the archive area,
-                    # $SECTION the package section, and $NAME the name of the package.
-                    _, _, package_name = qualified_package_name.rpartition('/')
-                    files_list_per_package[package_name].append(left)  # Append left to file list of the package
+    def _iter_table_blocks(self):
+        """
+        Read the blocks of the contents file, dropping everything up to the table header if table_header is true
+        :return: a generator of blocks of raw bytes containing only table rows
+        """
+        table_started = not self.table_header
+        for block in self._iter_blocks():
+            # Skip the blocks till FILE and LOCATION is found if table_header is true
+            if not table_started:
+                header = HEADER_PATTERN.search(block)
+                if header is None:
+                    continue
+                table_started = True
+                block = block[header.end():]
+            yield block
 
-        if self.table_header and not table_started:
+        if not table_started:
             # The table header containing FILE LOCATION was not detected in the file even though table header exists
             raise InvalidContentFileFormat
 
-        return files_list_per_package
+    def _iter_table_rows(self):
+        """
+        Parse the contents file and yield the rows of the table
+        :return: a generator of (file, comma separated list of qualified package names) tuples of raw bytes
+        """
+        for block in self._iter_table_blocks():
+            yield from self._block_rows(block)
+
+    @staticmethod
+    def _block_rows(block: bytes):
+        """
+        Split a block of table rows into its rows
+        :param block: the block of raw bytes ending at a line break
+        :return: a generator of (file, comma separated list of qualified package names) tuples of raw bytes
+        """
+        for line in block.splitlines():
+            columns = line.rsplit(None, 1)  # FILE may contain spaces, LOCATION is the last column
+            if len(columns) == 2:
+                yield columns[0].strip(), columns[1]
+            elif columns:
+                yield b'', columns[0]
+
+    @staticmethod
+    def _package_names(location: bytes) -> list:
+        """
+        Extract the package names from the LOCATION column of a row
+        :param location: the comma separated list of qualified package names
+        :return: the list of decoded package names
+        """
+        # The location contains list of qualified package names, separated by comma. A qualified package name has
+        # the form [[$AREA/]$SECTION/]$NAME, where $AREA is the archive area, $SECTION the package section, and
+        # $NAME the name of the package.
+        return [qualified_package_name.rpartition(b'/')[2].decode('utf-8')
+                for qualified_package_name in location.split(b',')]
+
+    def get_files_list_per_package(self) -> PackageFiles:
+        """
+        Parse the contents file and create a dictionary of package -> list of files
+        :return: the read only dictionary containing package -> list of files mappings, see PackageFiles
+        """
+        files_list_per_package = PackageFiles()
+
+        with stage(self.timings, 'files_list') as counters:
+            rows = 0
+            for rows, (left, right) in enumerate(self._iter_table_rows(), 1):
+                files_list_per_package.add(left, self._package_names(right))  # Add left to file list of the packages
+            counters['lines'] += rows
+
+            return files_list_per_package.freeze()
+
+    def iter_package_file_records(self):
+        """
+        Parse the contents file and yield a record for every file of every package, without keeping them. The records
+        are sorted by package in a bounded amount of memory by external_sort.iter_files_per_package, for the files
+        lists that do not fit in memory.
+        :return: a generator of the package name and the path separated by a tab, as a line of raw bytes
+        """
+        # The records of a block of rows are produced in the stage and yielded after it, so the time the caller takes
+        # with them is not counted. A stage per block rather than per row keeps the timing cheap.
+        blocks = iter(self._iter_table_blocks())
+        while True:
+            with stage(self.timings, 'records') as counters:
+                block = next(blocks, None)
+                if block is None:
+                    return
+                records = []
+                for left, right in self._block_rows(block):
+                    records.extend(qualified_package_name.rpartition(b'/')[2] + b'\t' + left + b'\n'
+                                   for qualified_package_name in right.split(b','))
+                    counters['lines'] += 1
+                counters['bytes'] += len(block)
+            yield from records
+
+    def _iter_table_chunks(self, chunk_size: int):
+        """
+        Join the blocks of table rows into chunks of at least chunk_size bytes
+        :param chunk_size: the minimum size of a chunk, the last chunk can be smaller
+        :return: a generator of chunks of raw bytes ending at a line break
+        """
+        blocks, size = [], 0
+        for block in self._iter_table_blocks():
+            blocks.append(block)
+            size += len(block)
+            if size >= chunk_size:
+                yield b''.join(blocks)
+                blocks, size = [], 0
+        if blocks:
+            yield b''.join(blocks)
+
+    def _count_rows_per_location_parallel(self, counters: dict) -> Counter:
+        """
+        Count the rows of every location using a pool of worker processes. The file is decompressed once in the
+        calling process and the chunks are handed to the workers in memory.
+        :param counters: the counters of the stage, the bytes handed to the workers are added to them
+        :return: the Counter containing location -> number of rows mappings
+        """
+        # Imported here, multiprocessing is not needed when the file is parsed in the calling process
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+        rows_count_per_location = Counter()
+        pending = set()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for chunk in self._iter_table_chunks(PARALLEL_CHUNK_SIZE):
+                counters['bytes'] += len(chunk)
+                # Limit the chunks waiting for a worker, so that memory does not grow with the file size
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rows_count_per_location.update(future.result())
+                pending.add(executor.submit(count_rows_per_location, chunk))
+            for future in pending:
+                rows_count_per_location.update(future.result())
+        return rows_count_per_location
+
+    def count_rows_per_location(self) -> Counter:
+        """
+        Parse the contents file and count the rows of each distinct value of the LOCATION column. The rows
+        are never decoded, the locations are picked from whole blocks of raw bytes.
+        :return: the Counter containing location -> number of rows mappings, the locations are raw bytes
+        """
+        if self._rows_count_per_location is not None:
+            return self._rows_count_per_location
+
+        with stage(self.timings, 'count') as counters:
+            if self.workers > 1:
+                rows_count_per_location = self._count_rows_per_location_parallel(counters)
+            else:
+                rows_count_per_location = Counter()
+                for block in self._iter_table_blocks():
+                    counters['bytes'] += len(block)
+                    rows_count_per_location.update(row_locations(block))
+            rows_count_per_location.pop(b'', None)  # Blank rows do not belong to any package
+            counters['lines'] += sum(rows_count_per_location.values())
+        self._rows_count_per_location = rows_count_per_location
+        return rows_count_per_location
+
+    def count_files_per_package(self) -> Counter:
+        """
+        Parse the contents file and count the files associated with each package. Unlike
+        get_files_list_per_package the file names are never stored, so the memory used
+        grows with the number of packages and not with the number of files.
+        :return: the Counter containing package -> number of files mappings
+        """
+        if self._files_count_per_package is not None:
+            return self._files_count_per_package
+
+        cache_key = None
+        if self.cache is not None and self.filepath is not None:
+            with stage(self.timings, 'cache'):
+                cache_key = self.cache.key(self.filepath, self.table_header)
+                self._files_count_per_package = self.cache.get(cache_key)
+            if self._files_count_per_package is not None:
+                self._files_count_ranked = True
+                return self._files_count_per_package
+
+        # Most of the rows share their location with many other rows, so count the rows of each distinct location
+        # first and split the locations into package names only once per distinct location.
+        rows_count_per_location = self.count_rows_per_location()
+
+        files_count_per_package = Counter()
+        with stage(self.timings, 'packages') as counters:
+            for location, count in rows_count_per_location.items():
+                for package_name in self._package_names(location):
+                    files_count_per_package[package_name] += count
+            counters['lines'] += len(rows_count_per_location)
+
+        if cache_key is not None:
+            with stage(self.timings, 'cache'):
+                self.cache.put(cache_key, files_count_per_package)
+        self._files_count_per_package = files_count_per_package
+        return files_count_per_package
+
+    def count_files_per_section(self) -> dict:
+        """
+        Parse the contents file and count the files associated with each package in each section. The section of
+        a qualified package name [[$AREA/]$SECTION/]$NAME is its $AREA/$SECTION prefix, for example utils or
+        non-free/libs. The counts per section are not cached, the file is parsed if it was not parsed yet.
+        :return: the dictionary containing section -> Counter of package -> number of files mappings, sorted by
+        section. The section of the packages without a prefix is the empty string.
+        """
+        rows_count_per_location = self.count_rows_per_location()
+        files_count_per_section = defaultdict(Counter)
+        with stage(self.timings, 'sections') as counters:
+            for location, count in rows_count_per_location.items():
+                for qualified_package_name in location.decode('utf-8').split(','):
+                    section, _, package_name = qualified_package_name.rpartition('/')
+                    files_count_per_section[section][package_name] += count
+            counters['lines'] += len(rows_count_per_location)
+        return dict(sorted(files_count_per_section.items()))
+
+    def build_index(self, index_path: str) -> 'ContentsIndex':
+        """
+        Parse the contents file once and save an index of its packages and files, that answers
+        lookups of the files of a package or the packages of a file without parsing the file again.
+        :param index_path: The path where the index is to be saved
+        :return: the ContentsIndex opened on the saved index
+        """
+        from contents_index import ContentsIndex, write_index
+        with stage(self.timings, 'index'):
+            write_index(index_path, self._iter_table_rows())
+        return ContentsIndex(index_path)
 
     def top_k_packages_max_files(self, k: int) -> list:
         """
@@ -59,20 +341,22 @@ class ContentsParser:
         :param k: The value k gives the number of top packages that needs to be returned
         :return: A list (package_name, number of files) containing the k top packages
         """
-        # parse the file to create the files_list_per_package dictionary
-        files_list_per_package = self.get_files_list_per_package()
-
-        # Convert the dictionary to list of tuples of the form (# of files, package name)
-        # negate the number of files since we are going to use max heap
-        files_per_package_count_list = [(-len(files), package_name)
-                                        for package_name, files in files_list_per_package.items()]
-
-        heapify(files_per_package_count_list)  # Heapify the list of tuples
+        # parse the file to count the files of each package, the file names themselves are not needed here
+        files_count_per_package = self.count_files_per_package()
+        with stage(self.timings, 'top_k'):
+            if self._files_count_ranked:
+                # The cached results are sorted the same way as top_k_packages, see ResultCache.put
+                return list(islice(files_count_per_package.items(), k))
+            return top_k_packages(files_count_per_package, k)
 
-        top_k = []
-        for _ in range(k):  # top k packages can be found by calling heappop() on the heap k times
-            if files_per_package_count_list:
-                top = heappop(files_per_package_count_list)
-                top_k.append((top[1], -top[0]))
-
-        return top_k
+    def top_k_packages_per_section(self, k: int) -> dict:
+        """
+        Parse the contents file and return the top k packages with most files of every section.
+        :param k: The value k gives the number of top packages that needs to be returned for each section
+        :return: the dictionary containing section -> list (package_name, number of files) of the k top packages
+        mappings, sorted by section
+        """
+        files_count_per_section = self.count_files_per_section()
+        with stage(self.timings, 'top_k'):
+            return {section: top_k_packages(files_count_per_package, k)
+                    for section, files_count_per_package in files_count_per_section.items()}
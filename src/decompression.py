@@ -0,0 +1,201 @@
+"""Decompression of the contents files, which the mirrors publish compressed with gzip (.gz) or xz (.xz).
+A backend decompresses one format, and the first backend of BACKENDS that is installed is used for a format:
+- gz: the python bindings of ISA-L (isal) and zlib-ng when they are installed, then the igzip and pigz commands when
+  they are on the PATH, then the zlib module of the standard library.
+- xz: the xz command, which decompresses the blocks of a multi block file on several threads, then the lzma module.
+The format of a file is told by its first bytes, so the file name does not matter. The modules of a backend are
+imported when it is first checked.
+"""
+from functools import partial
+from importlib import import_module
+from itertools import chain
+
+XZ_MAGIC = b'\xfd7zXZ\x00'  # The first bytes of an xz file, any other file is decompressed as gzip
+GZIP_MAGIC = b'\x1f\x8b'  # The first bytes of a gzip file
+
+
+def gzip_decompressor(module):
+    """A decompressor of gzip members from a module with the API of zlib"""
+    return module.decompressobj(wbits=module.MAX_WBITS | 16)  # 16 expects the gzip header and trailer
+
+
+def xz_decompressor(module):
+    """A decompressor of xz streams from the lzma module"""
+    return module.LZMADecompressor(module.FORMAT_XZ)
+
+
+class ModuleBackend:
+    """Decompress in the calling process with the decompressors of a python module"""
+    streaming = True  # The compressed data can be fed as it arrives, see inflate
+
+    def __init__(self, name: str, compression: str, module_name: str, new_decompressor):
+        """
+        :param name: the name the backend is selected by
+        :param compression: the format decompressed, gz or xz
+        :param module_name: the module imported when the backend is first used
+        :param new_decompressor: the function creating a decompressor from the module
+        """
+        self.name = name
+        self.compression = compression
+        self.module_name = module_name
+        self._new_decompressor = new_decompressor
+        self._module = None
+
+    def available(self) -> bool:
+        if self._module is None:
+            try:
+                self._module = import_module(self.module_name)
+            except ImportError:
+                return False
+        return True
+
+    def inflate(self, compressed_chunks):
+        """
+        Decompress the chunks of a file as they arrive, without the whole file being available
+        :param compressed_chunks: an iterable of the chunks of the file, cut anywhere
+        :return: a generator of decompressed bytes
+        :raise EOFError: if the file ends in the middle of a gzip member or xz stream
+        """
+        self.available()
+        decompressor = None
+        for chunk in compressed_chunks:
+            while chunk:
+                if decompressor is None:
+                    chunk = chunk.lstrip(b'\x00')  # The members or streams can be padded with zeros
+                    if not chunk:
+                        break
+                    decompressor = self._new_decompressor(self._module)
+                data = decompressor.decompress(chunk)
+                if data:
+                    yield data
+                chunk = b''
+                if decompressor.eof:
+                    # A file can be several members or streams one after the other, the next one starts in the
+                    # unused data
+                    chunk = decompressor.unused_data
+                    decompressor = None
+        if decompressor is not None:
+            raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+
+    def iter_file(self, filepath: str, read_size: int):
+        """
+        Decompress a file
+        :param filepath: the path of the compressed file
+        :param read_size: the size of the blocks read from the compressed file
+        :return: a generator of decompressed bytes
+        """
+        with open(filepath, 'rb') as f:
+            yield from self.inflate(iter(partial(f.read, read_size), b''))
+
+
+class CommandBackend:
+    """Decompress in a child process running a command, the decompressed file is read from its output"""
+    streaming = False
+
+    def __init__(self, name: str, compression: str, command: list):
+        """
+        :param name: the name the backend is selected by
+        :param compression: the format decompressed, gz or xz
+        :param command: the command writing the decompressed file given as last argument to its output
+        """
+        self.name = name
+        self.compression = compression
+        self.command = command
+        self._available = None
+
+    def available(self) -> bool:
+        if self._available is None:
+            import shutil
+            self._available = shutil.which(self.command[0]) is not None
+        return self._available
+
+    def iter_file(self, filepath: str, read_size: int):
+        """
+        Decompress a file
+        :param filepath: the path of the compressed file
+        :param read_size: the size of the blocks read from the output of the command
+        :return: a generator of decompressed bytes
+        :raise OSError: if the command fails, with the error output of the command
+        """
+        import subprocess
+        with subprocess.Popen(self.command + [filepath], stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+            try:
+                yield from iter(partial(process.stdout.read, read_size), b'')
+                error = process.stderr.read().decode('utf-8', 'replace').strip()
+                if process.wait():
+                    raise OSError(f'{self.name} could not decompress {filepath}: {error}')
+            finally:
+                if process.poll() is None:
+                    process.kill()  # The caller stopped reading before the end of the file
+
+
+# The backends in order of preference for each format
+BACKENDS = {backend.name: backend for backend in [
+    ModuleBackend('isal', 'gz', 'isal.isal_zlib', gzip_decompressor),
+    ModuleBackend('zlib-ng', 'gz', 'zlib_ng.zlib_ng', gzip_decompressor),
+    CommandBackend('igzip', 'gz', ['igzip', '-d', '-c']),
+    CommandBackend('pigz', 'gz', ['pigz', '-d', '-c']),
+    ModuleBackend('zlib', 'gz', 'zlib', gzip_decompressor),
+    CommandBackend('xz', 'xz', ['xz', '-d', '-c', '-T0']),
+    ModuleBackend('lzma', 'xz', 'lzma', xz_decompressor),
+]}
+
+
+def detect_compression(head: bytes) -> str:
+    """
+    Tell the format of a compressed file
+    :param head: the first bytes of the file
+    :return: xz or gz
+    """
+    return 'xz' if head.startswith(XZ_MAGIC) else 'gz'
+
+
+def select_backend(compression: str, name=None, streaming=False):
+    """
+    Select the backend decompressing a format
+    :param compression: the format, gz or xz
+    :param name: the name of the backend, None to select the first one of BACKENDS that is installed
+    :param streaming: select a backend that decompresses the data as it arrives, see ModuleBackend.inflate
+    :return: the backend
+    :raise ValueError: if the backend named does not decompress the format or is not installed
+    """
+    if name is not None:
+        backend = BACKENDS.get(name)
+        if backend is None or backend.compression != compression or (streaming and not backend.streaming):
+            raise ValueError(f"The decompression backend {name} can not decompress this {compression} file")
+        if not backend.available():
+            raise ValueError(f"The decompression backend {name} is not installed")
+        return backend
+    return next(backend for backend in BACKENDS.values() if backend.compression == compression and
+                (backend.streaming or not streaming) and backend.available())
+
+
+def iter_decompressed_file(filepath: str, read_size: int, backend=None):
+    """
+    Decompress a gzip or xz file
+    :param filepath: the path of the compressed file
+    :param read_size: the size of the blocks read from the file, or from the output of a command
+    :param backend: the name of the backend, None to select the fastest one installed
+    :return: a generator of decompressed bytes, the pieces can end anywhere in a line
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(len(XZ_MAGIC))
+    yield from select_backend(detect_compression(head), backend).iter_file(filepath, read_size)
+
+
+def inflate_chunks(compressed_chunks, backend=None):
+    """
+    Decompress the chunks of a gzip or xz file as they arrive, without the whole file being available
+    :param compressed_chunks: an iterable of the chunks of the file
+    :param backend: the name of the backend, None to select the fastest one installed that decompresses a stream
+    :return: a generator of decompressed bytes
+    """
+    compressed_chunks = iter(compressed_chunks)
+    head = b''
+    for chunk in compressed_chunks:
+        head += chunk
+        if len(head) >= len(XZ_MAGIC):
+            break
+    if head:
+        backend = select_backend(detect_compression(head), backend, streaming=True)
+        yield from backend.inflate(chain([head], compressed_chunks))
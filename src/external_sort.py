@@ -0,0 +1,157 @@
+"""Sort of the (package, file) records of contents files in a bounded amount of memory, for the complete list of the
+files of every package when it does not fit in memory, like the lists of several architectures or areas combined.
+
+A record is a line of raw bytes, the package name and the path separated by a tab. A tab sorts before any character
+of a package name, so sorting the lines sorts the records by package name then by path. The records are collected till
+they take the memory budget, then sorted and written to a run file. The runs are merged with heapq.merge, at most
+MERGE_FAN_IN at once, reading each run in blocks of MERGE_READ_SIZE, and the merged records are grouped by package.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from heapq import merge
+from itertools import groupby
+from timings import stage
+
+MERGE_FAN_IN = 64  # The most runs merged at once, more runs are merged in several passes
+MERGE_READ_SIZE = 64*1024  # The size of the blocks read from every run while merging
+LIST_ITEM_SIZE = 8  # The pointer of a record in the list of records waiting to be sorted
+
+
+class ExternalSorter:
+    """
+    Sort records that may not fit in memory. The records are added one at a time, and iterating over the sorter
+    yields them sorted once they are all added. The run files are removed when the sorter is closed.
+    """
+
+    def __init__(self, memory_budget: int, folder=None, unique=True, timings=None):
+        """
+        :param memory_budget: the bytes the records waiting to be sorted may take, and the most read buffers of the
+        merge. The records are spilled to a run file once they take more.
+        :param folder: the folder of the temporary folder holding the runs, None for the temporary folder of the system
+        :param unique: drop the records equal to the previous one, like a file listed by several architectures
+        :param timings: the StageTimings the spills and merges are recorded in, None to not time them
+        """
+        self.memory_budget = memory_budget
+        self.unique = unique
+        self.timings = timings
+        self.runs = 0  # The number of run files written, merged runs included
+        self._folder = tempfile.mkdtemp(prefix='package_files.', dir=folder)
+        self._run_paths = []  # The runs not merged yet
+        self._records = []
+        self._size = 0  # The memory taken by the records
+
+    def add(self, record: bytes):
+        """Add a record, it has to end with a line break and contain no other"""
+        self._records.append(record)
+        self._size += sys.getsizeof(record) + LIST_ITEM_SIZE
+        if self._size >= self.memory_budget:
+            self._spill()
+
+    def _new_run_path(self) -> str:
+        self.runs += 1
+        return os.path.join(self._folder, f'run{self.runs}')
+
+    def _spill(self):
+        """Sort the records in memory and write them to a run"""
+        with stage(self.timings, 'spill') as counters:
+            self._records.sort()
+            run_path = self._new_run_path()
+            with open(run_path, 'wb') as f:
+                f.writelines(self._records)
+                counters['bytes'] += f.tell()
+            counters['lines'] += len(self._records)
+        self._run_paths.append(run_path)
+        self._records = []
+        self._size = 0
+
+    def _merge_runs(self, run_paths: list):
+        """
+        Merge sorted runs
+        :param run_paths: the paths of the runs
+        :return: a generator of the records of all the runs, sorted
+        """
+        runs = [open(run_path, 'rb', buffering=MERGE_READ_SIZE) for run_path in run_paths]
+        try:
+            yield from merge(*runs)
+        finally:
+            for run in runs:
+                run.close()
+
+    def _fan_in(self) -> int:
+        """The most runs merged at once, so that their read buffers stay within the memory budget"""
+        return max(2, min(MERGE_FAN_IN, self.memory_budget // MERGE_READ_SIZE))
+
+    def __iter__(self):
+        """
+        The records added, sorted. The iteration can be done once.
+        :return: a generator of records
+        """
+        if self._run_paths:
+            if self._records:
+                self._spill()  # The last records are merged with the runs, so the memory is free for the merge
+            # The runs are merged in passes of at most _fan_in runs till the last pass merges them all
+            while len(self._run_paths) > self._fan_in():
+                run_paths, self._run_paths = self._run_paths[:self._fan_in()], self._run_paths[self._fan_in():]
+                run_path = self._new_run_path()
+                with stage(self.timings, 'merge') as counters, open(run_path, 'wb') as f:
+                    f.writelines(self._unique(self._merge_runs(run_paths)))
+                    counters['bytes'] += f.tell()
+                for merged_path in run_paths:
+                    os.remove(merged_path)
+                self._run_paths.append(run_path)
+            records = self._merge_runs(self._run_paths)
+        else:
+            # Everything fits in the memory budget, nothing is written to disk
+            self._records.sort()
+            records, self._records = iter(self._records), []
+        # The last merge is read by the caller record by record, its stage includes the time the caller takes
+        with stage(self.timings, 'merge') as counters:
+            for record in self._unique(records):
+                counters['lines'] += 1
+                yield record
+
+    def _unique(self, records):
+        if not self.unique:
+            return records
+        return (record for record, _ in groupby(records))
+
+    def close(self):
+        shutil.rmtree(self._folder, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def group_package_files(records):
+    """
+    Group the sorted records by package
+    :param records: an iterable of records sorted by package name, see ExternalSorter
+    :return: a generator of (package_name, generator of the paths of the files of the package) tuples, decoded. The
+    paths of a package have to be read before the next package.
+    """
+    for package_name, package_records in groupby(records, key=lambda record: record[:record.index(b'\t')]):
+        yield package_name.decode('utf-8'), (record[len(package_name) + 1:-1].decode('utf-8')
+                                             for record in package_records)
+
+
+def iter_files_per_package(record_iterables, memory_budget: int, folder=None, timings=None):
+    """
+    List the files of every package of contents files in a bounded amount of memory
+    :param record_iterables: the iterables of the records of the contents files, see
+    ContentsParser.iter_package_file_records
+    :param memory_budget: the bytes the records sorted in memory may take, see ExternalSorter
+    :param folder: the folder the runs are written to, None for the temporary folder of the system
+    :param timings: the StageTimings the spills and merges are recorded in, None to not time them
+    :return: a generator of (package_name, generator of paths) tuples sorted by package name, with the paths of a
+    package sorted and listed once
+    """
+    with ExternalSorter(memory_budget, folder, timings=timings) as sorter:
+        for records in record_iterables:
+            for record in records:
+                sorter.add(record)
+        yield from group_package_files(sorter)
@@ -0,0 +1,153 @@
+"""Asyncio download layer over a list of debian mirrors.
+The downloads go through the shared requests session of utils.get_session, which keeps the connections to the
+mirrors alive, and run in a thread pool of the client with max_concurrency threads since requests is blocking. A
+semaphore caps the number of downloads at once, a failed download is tried on the next mirror, and once every mirror
+failed the round is retried with an exponential backoff.
+The module is imported on every run of the command line tool, asyncio and requests are imported by the first download.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from constants import CHUNK_SIZE
+from utils import download_file
+
+
+def is_retryable(error: 'RequestException') -> bool:
+    """
+    Check if a failed download may succeed when tried again
+    :param error: the exception raised by the download
+    :return: False if the mirror answered that the file does not exist or can not be sent, True otherwise
+    """
+    from requests.exceptions import ChunkedEncodingError, ConnectionError, HTTPError, Timeout
+    if isinstance(error, HTTPError):
+        status = error.response.status_code if error.response is not None else None
+        return status is not None and (status >= 500 or status in (408, 429))  # Server errors, too many requests
+    return isinstance(error, (ConnectionError, Timeout, ChunkedEncodingError))
+
+
+class MirrorClient:
+    """
+    Download files from the first mirror of a list that has them. The coroutine fetch can be awaited by asyncio
+    callers, and download runs it from any thread in an event loop of the client.
+    """
+
+    def __init__(self, mirrors: list, max_concurrency=4, retries=2, backoff=0.5, download=download_file):
+        """
+        :param mirrors: the urls of the folders of the mirrors holding the files, tried in order
+        :param max_concurrency: the maximum number of downloads at once
+        :param retries: the number of times every mirror is tried again once all of them failed
+        :param backoff: the seconds waited before the first retry, doubled before every next retry
+        :param download: the function downloading an url to a file, download_file by default
+        """
+        if not mirrors:
+            raise ValueError('At least one mirror is needed')
+        self.mirrors = list(mirrors)
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._download = download
+        # The semaphore of every event loop running downloads, with the number of fetches using it. A semaphore is
+        # bound to the loop it is first used in, it is dropped once its fetches are done.
+        self._semaphores = {}
+        self._loop = None  # The event loop of download, started with the first download
+        self._loop_thread = None  # The thread running the event loop of download
+        self._loop_lock = Lock()
+        # The threads running the blocking downloads, as many as the downloads at once. The default executor of a
+        # loop has min(32, cpus + 4) threads, which would cap max_concurrency on a small machine.
+        self._executor = None
+        self._executor_lock = Lock()
+
+    async def fetch(self, file_name: str, file_path: str) -> str:
+        """
+        Download a file from the mirrors
+        :param file_name: the name of the file in the folders of the mirrors
+        :param file_path: the path where the file is to be saved
+        :return: the mirror the file was downloaded from
+        :raise RequestException: the error of the last try if the file could not be downloaded from any mirror
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        semaphore, fetches = self._semaphores.get(loop, (None, 0))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+        # The entries of a loop are only changed in its thread
+        self._semaphores[loop] = (semaphore, fetches + 1)
+        try:
+            async with semaphore:
+                return await self._fetch_from_mirrors(file_name, file_path)
+        finally:
+            semaphore, fetches = self._semaphores[loop]
+            if fetches == 1:
+                del self._semaphores[loop]
+            else:
+                self._semaphores[loop] = (semaphore, fetches - 1)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix='MirrorClient')
+            return self._executor
+
+    async def _fetch_from_mirrors(self, file_name: str, file_path: str) -> str:
+        """Try the mirrors in order, then again with a growing delay, see fetch"""
+        import asyncio
+        from requests.exceptions import RequestException
+        loop, executor = asyncio.get_running_loop(), self._get_executor()
+        mirrors, last_error = list(self.mirrors), None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            for mirror in list(mirrors):
+                try:
+                    await loop.run_in_executor(executor, self._download, f'{mirror}{file_name}', file_path,
+                                               CHUNK_SIZE)
+                    return mirror
+                except RequestException as e:
+                    last_error = e
+                    if not is_retryable(e):
+                        mirrors.remove(mirror)  # The mirror does not have the file, it is not asked again
+            if not mirrors:
+                break
+        raise last_error
+
+    async def fetch_all(self, files: list) -> list:
+        """
+        Download files concurrently, at most max_concurrency at once
+        :param files: a list of (file name, file path) tuples
+        :return: the list of the mirrors the files were downloaded from, in the order of the files
+        """
+        import asyncio
+        return await asyncio.gather(*(self.fetch(file_name, file_path) for file_name, file_path in files))
+
+    def download(self, file_name: str, file_path: str) -> str:
+        """
+        Download a file from the mirrors, blocking the calling thread till it is done. The downloads of all the
+        threads share the event loop of the client, so max_concurrency holds across the threads.
+        :return: the mirror the file was downloaded from, see fetch
+        """
+        import asyncio
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = Thread(target=self._loop.run_forever, daemon=True)
+                self._loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(self.fetch(file_name, file_path), self._loop).result()
+
+    def close(self):
+        """Stop the event loop of download and wait for its thread to end, then for the threads of the downloads"""
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop_thread.join()
+                self._loop.close()
+                self._loop, self._loop_thread = None, None
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -0,0 +1,134 @@
+"""Compact representation of the files of every package of a contents file.
+A dictionary of lists of str spends 50-100 bytes of overhead on every file. Here the package names are
+interned to ids and every directory is stored once in a table, so a file of a package is a uint32 directory
+id and its file name in a blob of bytes. Once frozen the files of all the packages are packed one after the
+other, with an array of offsets giving the files of each package.
+"""
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from itertools import accumulate
+
+
+class _Table:
+    """A list of bytes packed in one blob, which saves the overhead of a bytes object per value"""
+
+    def __init__(self, values: list):
+        self._blob = b''.join(values)
+        self._offsets = array('Q', [0])
+        self._offsets.extend(accumulate(len(value) for value in values))
+
+    def __getitem__(self, i: int) -> bytes:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]]
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+class PackageFiles(Mapping):
+    """
+    Read only mapping of package name -> list of files of the package, in the order the files appear in the
+    contents file. The lists are decoded when a package is looked up. A package that is not in the contents file
+    has no files, like with the defaultdict(list) the files lists were, but it is not added by the lookup.
+    """
+
+    def __init__(self):
+        self._package_ids = {}  # package name -> package id
+        self._package_names = []  # package id -> package name
+        self._directory_ids = {}  # directory, with the trailing /, -> directory id
+        self._directories = []  # directory id -> directory as raw bytes, packed in a _Table once frozen
+        # While adding, every package has an array of the directory ids of its files and a bytearray of
+        # their names, each name ending with a newline which can not be part of a path in a contents file
+        self._directories_per_package = []
+        self._names_per_package = []
+        self._file_directories = array('I')  # the directory ids of the files of all the packages once frozen
+        self._file_names = b''  # the names of the files of all the packages once frozen
+        self._file_offsets = array('Q', [0])  # package id -> start of its files in _file_directories
+        self._name_offsets = array('Q', [0])  # package id -> start of the names of its files in _file_names
+        self._frozen = False
+
+    def add(self, path: bytes, package_names: list):
+        """
+        Add a file to packages, used while parsing the contents file
+        :param path: the path of the file as raw bytes
+        :param package_names: the names of the packages owning the file
+        """
+        directory, slash, name = path.rpartition(b'/')
+        directory += slash
+        directory_id = self._directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self._directory_ids[directory] = len(self._directories)
+            self._directories.append(directory)
+        name += b'\n'
+
+        for package_name in package_names:
+            package_id = self._package_ids.get(package_name)
+            if package_id is None:
+                package_id = self._package_ids[package_name] = len(self._package_names)
+                self._package_names.append(package_name)
+                self._directories_per_package.append(array('I'))
+                self._names_per_package.append(bytearray())
+            self._directories_per_package[package_id].append(directory_id)
+            self._names_per_package[package_id] += name
+
+    def freeze(self):
+        """
+        Pack the files of all the packages one after the other once every file is added, this drops the
+        overhead of the arrays of every package. The lookup table of the directories is not needed anymore either.
+        :return: the PackageFiles itself
+        """
+        for directory_ids in self._directories_per_package:
+            self._file_directories.extend(directory_ids)
+            self._file_offsets.append(len(self._file_directories))
+        self._directories_per_package = []
+        self._name_offsets.extend(accumulate(len(names) for names in self._names_per_package))
+        self._file_names = b''.join(self._names_per_package)
+        self._names_per_package = []
+        self._directory_ids = {}
+        self._directories = _Table(self._directories)
+        self._frozen = True
+        return self
+
+    def _files(self, package_id: int):
+        """The directory ids of the files of a package and their names separated by newlines"""
+        if not self._frozen:
+            return self._directories_per_package[package_id], bytes(self._names_per_package[package_id])
+        return (self._file_directories[self._file_offsets[package_id]:self._file_offsets[package_id + 1]],
+                self._file_names[self._name_offsets[package_id]:self._name_offsets[package_id + 1]])
+
+    def __getitem__(self, package_name: str) -> list:
+        package_id = self._package_ids.get(package_name)
+        if package_id is None:
+            return []
+        directory_ids, names = self._files(package_id)
+        directories = self._directories
+        return [(directories[directory_id] + name).decode('utf-8')
+                for directory_id, name in zip(directory_ids, names.split(b'\n'))]
+
+    def __iter__(self):
+        return iter(self._package_names)
+
+    def __len__(self) -> int:
+        return len(self._package_names)
+
+    def __contains__(self, package_name) -> bool:
+        return package_name in self._package_ids
+
+    def get(self, package_name, default=None):
+        """The files of a package, default if it is not in the contents file like dict.get"""
+        return self[package_name] if package_name in self._package_ids else default
+
+    def _count(self, package_id: int) -> int:
+        if not self._frozen:
+            return len(self._directories_per_package[package_id])
+        return self._file_offsets[package_id + 1] - self._file_offsets[package_id]
+
+    def count(self, package_name: str) -> int:
+        """The number of files of a package, without decoding them, 0 if it is not in the contents file"""
+        package_id = self._package_ids.get(package_name)
+        return 0 if package_id is None else self._count(package_id)
+
+    def counts(self) -> Counter:
+        """The Counter containing package -> number of files mappings"""
+        return Counter({package_name: self._count(package_id)
+                        for package_id, package_name in enumerate(self._package_names)})
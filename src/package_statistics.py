@@ -1,51 +1,112 @@
-""" CLI tool to download that takes the architecture as
-an argument, downloads the compressed Contents file associated with
-it parse the file and output the statistics of the top 10 packages
-that have the most files associated with them"""
+""" CLI tool to download that takes the architectures as
+arguments, downloads the compressed Contents files associated with
+them parse the files and output the statistics of the top 10 packages
+that have the most files associated with them.
+The modules needed by a few code paths only, like requests for the downloads or the query server, are imported on
+these paths, so that a query answered from the local files and the cached results starts fast.
+"""
 import sys
 import shutil
 import click
 import os
-from utils import download_file
-from constants import DOWNLOAD_FOLDER, URL_BASE, CHUNK_SIZE, FILE_NAME_FORMAT, K_VALUE
-from contents_parser import ContentsParser, InvalidContentFileFormat
-from requests.exceptions import HTTPError, ConnectionError
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from utils import download_file, stream_file
+from constants import DOWNLOAD_FOLDER, URL_BASE, CHUNK_SIZE, FILE_NAME_FORMAT, K_VALUE, ARCHITECTURES, \
+    RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES, INDEX_FILE_FORMAT, SNAPSHOT_FOLDER, SNAPSHOT_FILE_FORMAT, \
+    SOCKET_PATH, EXPORT_FOLDER, EXPORT_FORMATS, FILES_MEMORY_BUDGET, COMPRESSIONS
+from contents_parser import ContentsParser, InvalidContentFileFormat, top_k_packages
+from mirror_client import MirrorClient
+from result_cache import ResultCache
+from snapshots import InvalidSnapshot, SnapshotDiff, iter_snapshot, write_snapshot
+from timings import Profiler, StageTimings, iter_stage, stage
 
 
-@click.command()
-@click.option('--no_cache', default=True, help='If set to true, the downloaded files are not deleted.')
-@click.option('--debug', default=False, help='Print the exception to the console for more info.')
-@click.option('--force', default=False, help='Force download the content file even if it exists locally')
-@click.option('--table_header', default=False,
-              help='Specifies if the table structure of the contents file has a header')
-@click.argument('architecture')
-def package_statistics(architecture, table_header, force, debug, no_cache):
+def mirror_client(mirrors: tuple, retries: int, concurrency=len(ARCHITECTURES)) -> MirrorClient:
+    """
+    Create the client downloading the contents files of a command
+    :param mirrors: The urls of the mirrors given with --mirror, URL_BASE if none was given
+    :param retries: The number of times the mirrors are tried again once all of them failed
+    :param concurrency: The maximum number of files downloaded at once
+    """
+    return MirrorClient(list(mirrors) or [URL_BASE], concurrency, retries, download=download_file)
+
+
+def load_contents(architecture: str, force: bool, stream: bool, keep_file: bool, client: MirrorClient,
+                  compression='gz', **parser_options) -> ContentsParser:
+    """
+    Get the ContentsParser of the contents file of the architecture, downloading the file if needed.
+    :param architecture: The architecture of the contents file
+    :param force: Download the file even if it exists locally
+    :param stream: Parse the file while it downloads, the parser returned has already counted the files
+    :param keep_file: Save the streamed file locally, it is not saved otherwise
+    :param client: The MirrorClient the file is downloaded with. A streamed file is read from the first mirror only,
+    a download can not be tried on another mirror once the parser has read a part of it.
+    :param compression: The compression of the contents file downloaded, one of COMPRESSIONS
+    :param parser_options: The options passed to the ContentsParser, the download is timed in its timings
+    :return: The ContentsParser of the contents file
+    """
+    timings = parser_options.get('timings')
+    gz_filename = FILE_NAME_FORMAT.format(architecture, compression)  # Format the filename using the architecture
+    gz_filepath = os.path.join(DOWNLOAD_FOLDER, gz_filename)
+    url = f'{client.mirrors[0]}{gz_filename}'  # Form the url by adding the filename with the base url
+
+    # Download the file again only is the file not present locally or if the force option is set
+    if os.path.isfile(gz_filepath) and not force:
+        click.echo(f"Using the local copy of the file - {gz_filename}")
+    elif stream:
+        click.echo(f"Streaming {gz_filename} from {url}")
+        compressed_chunks = iter_stage(timings, 'download',
+                                       stream_file(url, gz_filepath if keep_file else None, CHUNK_SIZE))
+        content_parser = ContentsParser.from_stream(compressed_chunks, **parser_options)
+        content_parser.count_files_per_package()  # The files are counted while the file is downloading
+        return content_parser
+    else:
+        click.echo(f"Downloading {gz_filename} from {url}")
+        with stage(timings, 'download') as counters:
+            mirror = client.download(gz_filename, gz_filepath)  # Download the file, from the next mirror if it fails
+            if timings is not None:
+                counters['bytes'] += os.path.getsize(gz_filepath)
+        if mirror != client.mirrors[0]:
+            click.echo(f"Downloaded {gz_filename} from {mirror}")
+
+    return ContentsParser(gz_filepath, **parser_options)
+
+
+def echo_top_k(top_k: list):
+    """Print the (package_name, number of files) tuples as a numbered table"""
+    for i, data in enumerate(top_k):
+        click.echo(f"{i+1}. {data[0]: <35}\t{data[1]}")
+
+
+def requests_exceptions():
+    """The requests.exceptions module, it is imported once a command fails and not at startup"""
+    import requests.exceptions
+    return requests.exceptions
+
+
+@contextmanager
+def command_errors(debug: bool, no_cache: bool):
+    """
+    Create the download folder for a command, output the errors of the command with a hint of what went wrong
+    and exit. The downloaded files are deleted afterwards if no_cache is set.
+    :param debug: Print the exception to the console for more info
+    :param no_cache: Delete the download folder once the command is done
+    """
     try:
         # Check if the download folder exists and c
         if not os.path.exists(DOWNLOAD_FOLDER):
             os.mkdir(DOWNLOAD_FOLDER)
 
-        gz_filename = FILE_NAME_FORMAT.format(architecture)  # Format the filename prefix using the architecture
-        gz_filepath = os.path.join(DOWNLOAD_FOLDER, gz_filename)
-        url = f'{URL_BASE}{gz_filename}'  # Form the url by adding the filename with the base url
-
-        # Download the file again only is the file not present locally or if the force option is set
-        if os.path.isfile(gz_filepath) and not force:
-            click.echo(f"Using the local copy of the file - {gz_filename}")
-        else:
-            click.echo(f"Downloading {gz_filename} from {url}")
-            download_file(url, gz_filepath, CHUNK_SIZE)  # Download the file
-
-        content_parser = ContentsParser(gz_filepath, table_header=table_header)  # Initialize the ContentsParser class
-        top_10 = content_parser.top_k_packages_max_files(K_VALUE)  # Get the top 10 elements
-        for i, data in enumerate(top_10):
-            click.echo(f"{i+1}. {data[0]: <35}\t{data[1]}")
-    except HTTPError as e:
+        yield
+    except requests_exceptions().HTTPError as e:
         click.echo("\nError: Couldn't download the contents file!! Please check the architecture name")
         if debug:
             click.echo(e)
         sys.exit(1)
-    except ConnectionError as e:
+    except requests_exceptions().ConnectionError as e:
         click.echo("\nError: Couldn't connect to the server!! Please check your network connection")
         if debug:
             click.echo(e)
@@ -56,11 +117,390 @@ def package_statistics(architecture, table_header, force, debug, no_cache):
         if debug:
             click.echo(e)
         sys.exit(1)
+    except InvalidSnapshot as e:
+        click.echo(f"\nError: The previous snapshot is broken! Delete it from {SNAPSHOT_FOLDER} to start again.")
+        if debug:
+            click.echo(e)
+        sys.exit(1)
 
     finally:
         if no_cache:
             shutil.rmtree(DOWNLOAD_FOLDER)
 
 
+@contextmanager
+def command_profile(timings: bool, profile: str, profile_memory: str):
+    """
+    Time the stages of a command and profile it, the timings are output and the profiles written once it is done
+    :param timings: Output the wall time, CPU time, bytes and lines processed and peak memory of every stage
+    :param profile: The path where the cProfile stats of the command are written, None to not profile it
+    :param profile_memory: The path where the tracemalloc snapshot taken at the end of the command is written, None
+    to not trace the allocations. The peak of the allocations of every stage is also added to the timings.
+    :return: a context manager yielding the StageTimings (None if timings is false) and the Profiler (None if profile
+    is None) of the command
+    """
+    stage_timings = StageTimings() if timings else None
+    profiler = Profiler() if profile else None
+    if profile_memory:
+        import tracemalloc
+        tracemalloc.start()
+    try:
+        with profiler.profile() if profiler else nullcontext():
+            yield stage_timings, profiler
+    finally:
+        if profile_memory:
+            tracemalloc.take_snapshot().dump(profile_memory)
+            tracemalloc.stop()
+            click.echo(f"\nAllocations written to {profile_memory}")
+        if profiler:
+            profiler.dump(profile)
+            click.echo(f"\nProfile written to {profile}")
+        if stage_timings:
+            click.echo("\nTimings")
+            for line in stage_timings.report():
+                click.echo(line)
+
+
+def profile_options(command):
+    """Add the options of command_profile"""
+    for option in reversed([
+        click.option('--timings', default=False,
+                     help='Output the time, bytes and lines processed and peak memory of every stage.'),
+        click.option('--profile', type=click.Path(dir_okay=False),
+                     help='Write the cProfile stats of the run to this file, to be read with pstats.'),
+        click.option('--profile_memory', type=click.Path(dir_okay=False),
+                     help='Trace the allocations and write the tracemalloc snapshot to this file.'),
+    ]):
+        command = option(command)
+    return command
+
+
+def download_options(command):
+    """Add the options shared by the commands that download the contents files"""
+    for option in reversed([
+        click.option('--no_cache', default=True, help='If set to true, the downloaded files are not deleted.'),
+        click.option('--debug', default=False, help='Print the exception to the console for more info.'),
+        click.option('--force', default=False, help='Force download the content file even if it exists locally'),
+        click.option('--table_header', default=False,
+                     help='Specifies if the table structure of the contents file has a header'),
+        click.option('--mirror', 'mirrors', multiple=True,
+                     help='The url of a mirror folder holding the contents files, can be given several times. A file '
+                          'is downloaded from the next mirror if a mirror fails.'),
+        click.option('--retries', default=2, type=click.IntRange(min=0),
+                     help='The number of times the mirrors are tried again, with a growing delay, once all failed.'),
+        click.option('--compression', default='gz', type=click.Choice(COMPRESSIONS),
+                     help='The compression of the contents files downloaded, some mirrors only publish xz files.'),
+    ]):
+        command = option(command)
+    return command
+
+
+class DefaultCommandGroup(click.Group):
+    """
+    A group of commands that runs the default command when the first argument is not the name of one of the
+    commands, so that the statistics are still output by `package_statistics amd64`.
+    """
+
+    def __init__(self, *args, default_command: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command  # The name of the command run when no command is named
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] not in ctx.help_option_names):
+            args.insert(0, self.default_command)
+        return super().parse_args(ctx, args)
+
+
+@click.command()
+@download_options
+@profile_options
+@click.option('--workers', default=1, type=click.IntRange(min=1),
+              help='The number of processes used to parse the contents file.')
+@click.option('--stream', default=False,
+              help='Parse the contents file while it downloads. It is saved locally only if no_cache is false.')
+@click.option('--sections', default=False,
+              help='Also output the top packages of every $AREA/$SECTION of the contents files.')
+@click.option('--concurrency', default=len(ARCHITECTURES), type=click.IntRange(min=1),
+              help='The maximum number of contents files downloaded at once.')
+@click.argument('architectures', nargs=-1, required=True)
+def package_statistics(architectures, table_header, force, debug, no_cache, mirrors, retries, compression, workers,
+                       stream, sections, concurrency, timings, profile, profile_memory):
+    """Output the top packages with the most files of the ARCHITECTURES, or all of them"""
+    with command_errors(debug, no_cache), command_profile(timings, profile, profile_memory) as (stage_timings,
+                                                                                              profiler), \
+            mirror_client(mirrors, retries, concurrency) as client:
+        # all is expanded to every architecture, duplicates are dropped keeping the order of the arguments
+        architectures = list(dict.fromkeys(ARCHITECTURES if 'all' in architectures else architectures))
+
+        # The files are downloaded concurrently and each file is parsed as soon as it is available
+        top_k_per_architecture = {}
+        top_k_per_section = {}
+        files_count_all_architectures = Counter()
+        with ThreadPoolExecutor(max_workers=len(architectures)) as executor:
+            # The parsed counts are cached along with the local copies of the files
+            cache = None if no_cache else ResultCache(RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES)
+            # The threads are profiled separately, a cProfile only sees the thread it was started in
+            submit = partial(executor.submit, profiler.call) if profiler else executor.submit
+            futures = {submit(load_contents, architecture, force, stream, not no_cache, client, compression,
+                              table_header=table_header, workers=workers, cache=cache,
+                              timings=stage_timings): architecture
+                       for architecture in architectures}
+            for future in as_completed(futures):
+                content_parser = future.result()
+                top_k_per_architecture[futures[future]] = content_parser.top_k_packages_max_files(K_VALUE)
+                if sections:
+                    top_k_per_section[futures[future]] = content_parser.top_k_packages_per_section(K_VALUE)
+                if len(architectures) > 1:
+                    files_count_all_architectures.update(content_parser.count_files_per_package())
+
+        if len(architectures) == 1 and not sections:
+            echo_top_k(top_k_per_architecture[architectures[0]])
+            return
+
+        for architecture in architectures:
+            click.echo(f"\nTop {K_VALUE} packages of {architecture}")
+            echo_top_k(top_k_per_architecture[architecture])
+            for section, top_k in top_k_per_section.get(architecture, {}).items():
+                click.echo(f"\nTop {K_VALUE} packages of {architecture} in section {section or '(none)'}")
+                echo_top_k(top_k)
+        if len(architectures) > 1:
+            click.echo(f"\nTop {K_VALUE} packages of all the architectures")
+            echo_top_k(top_k_packages(files_count_all_architectures, K_VALUE))
+
+
+@click.command()
+@download_options
+@profile_options
+@click.option('--prefix', default=False,
+              help='List every file whose path starts with PATH, for example all the files under a directory.')
+@click.argument('architecture')
+@click.argument('path')
+def owners(architecture, path, prefix, table_header, force, debug, no_cache, mirrors, retries, compression, timings,
+           profile, profile_memory):
+    """Output the packages of ARCHITECTURE that own the file PATH"""
+    with command_errors(debug, no_cache), command_profile(timings, profile, profile_memory) as (stage_timings, _), \
+            mirror_client(mirrors, retries) as client:
+        content_parser = load_contents(architecture, force, False, True, client, compression,
+                                       table_header=table_header, timings=stage_timings)
+
+        # The index is built again only when the contents file is newer than the index
+        index_path = os.path.join(DOWNLOAD_FOLDER, INDEX_FILE_FORMAT.format(architecture))
+        if os.path.isfile(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(content_parser.filepath):
+            from contents_index import ContentsIndex
+            contents_index = ContentsIndex(index_path)
+        else:
+            click.echo(f"Indexing {content_parser.filepath}")
+            contents_index = content_parser.build_index(index_path)
+
+        with contents_index, stage(stage_timings, 'lookup'):
+            if prefix:
+                found = list(contents_index.paths_with_prefix(path))
+            else:
+                packages = contents_index.packages_owning(path)
+                found = [(path.lstrip('/'), packages)] if packages else []
+        for found_path, packages in found:
+            click.echo(f"{found_path: <60}\t{', '.join(packages)}")
+        if not found:
+            click.echo(f"No package owns {path}")
+            sys.exit(1)
+
+
+@click.command()
+@download_options
+@profile_options
+@click.argument('architecture')
+def diff(architecture, table_header, force, debug, no_cache, mirrors, retries, compression, timings, profile,
+         profile_memory):
+    """Output the changes of the packages of ARCHITECTURE since the previous snapshot and save a new snapshot"""
+    with command_errors(debug, no_cache), command_profile(timings, profile, profile_memory) as (stage_timings, _), \
+            mirror_client(mirrors, retries) as client:
+        cache = None if no_cache else ResultCache(RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES)
+        content_parser = load_contents(architecture, force, False, not no_cache, client, compression,
+                                       table_header=table_header, cache=cache, timings=stage_timings)
+        files_count_per_package = content_parser.count_files_per_package()
+
+        os.makedirs(SNAPSHOT_FOLDER, exist_ok=True)
+        snapshot_path = os.path.join(SNAPSHOT_FOLDER, SNAPSHOT_FILE_FORMAT.format(architecture))
+        if not os.path.isfile(snapshot_path):
+            write_snapshot(snapshot_path, files_count_per_package)
+            click.echo(f"No previous snapshot of {architecture}, saved the snapshot {snapshot_path}")
+            return
+
+        # The previous snapshot is read as it is merged, only the new counts are in memory
+        snapshot_diff = SnapshotDiff(iter_snapshot(snapshot_path), sorted(files_count_per_package.items()), K_VALUE)
+        click.echo(f"Changes of {architecture} since the previous snapshot")
+        with stage(stage_timings, 'diff') as counters:
+            for package_name, old_count, new_count in snapshot_diff:
+                if old_count is None:
+                    click.echo(f"+ {package_name: <35}\t{new_count}")
+                elif new_count is None:
+                    click.echo(f"- {package_name: <35}\t{old_count}")
+                else:
+                    click.echo(f"~ {package_name: <35}\t{old_count} -> {new_count} ({new_count - old_count:+d})")
+                counters['lines'] += 1
+        click.echo(f"{snapshot_diff.added} added, {snapshot_diff.removed} removed, {snapshot_diff.changed} changed")
+
+        movement, left_top_k = snapshot_diff.top_k_movement()
+        click.echo(f"\nTop {K_VALUE} packages of {architecture}")
+        for i, (package_name, count, old_rank) in enumerate(movement):
+            move = 'new' if old_rank is None else f'was {old_rank}' if old_rank != i + 1 else '='
+            click.echo(f"{i+1}. {package_name: <35}\t{count}\t({move})")
+        if left_top_k:
+            click.echo(f"Left the top {K_VALUE}: {', '.join(left_top_k)}")
+        write_snapshot(snapshot_path, files_count_per_package)
+
+
+@click.command()
+@download_options
+@profile_options
+@click.option('--memory_budget', default=FILES_MEMORY_BUDGET // 2**20, type=click.IntRange(min=1),
+              help='The MB of records sorted in memory, the records above it are sorted in runs on disk and merged.')
+@click.argument('architectures', nargs=-1, required=True)
+def files(architectures, memory_budget, table_header, force, debug, no_cache, mirrors, retries, compression, timings,
+          profile, profile_memory):
+    """Output the files of every package of the ARCHITECTURES, sorted in a bounded amount of memory"""
+    with command_errors(debug, no_cache), command_profile(timings, profile, profile_memory) as (stage_timings, _), \
+            mirror_client(mirrors, retries) as client:
+        architectures = list(dict.fromkeys(ARCHITECTURES if 'all' in architectures else architectures))
+        with ThreadPoolExecutor(max_workers=len(architectures)) as executor:
+            content_parsers = list(executor.map(partial(load_contents, force=force, stream=False,
+                                                        keep_file=not no_cache, client=client,
+                                                        compression=compression, table_header=table_header,
+                                                        timings=stage_timings),
+                                                architectures))
+
+        # The files of a package in several architectures are listed once, the runs are written to the downloads
+        from external_sort import iter_files_per_package
+        output = click.get_text_stream('stdout')
+        for package_name, paths in iter_files_per_package(
+                (content_parser.iter_package_file_records() for content_parser in content_parsers),
+                memory_budget * 2**20, DOWNLOAD_FOLDER, stage_timings):
+            output.write(f"{package_name}\n")
+            output.writelines(f"  {path}\n" for path in paths)
+        output.flush()
+
+
+@click.command()
+@download_options
+@profile_options
+@click.option('--output', default=EXPORT_FOLDER, type=click.Path(file_okay=False),
+              help='The folder of the .npy files, the other formats are saved next to it with its name.')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(EXPORT_FORMATS),
+              help='A format written along with the .npy files, can be given several times. arrow and parquet need '
+                   'pyarrow.')
+@click.argument('architectures', nargs=-1, required=True)
+def export(architectures, output, formats, table_header, force, debug, no_cache, mirrors, retries, compression,
+           timings, profile, profile_memory):
+    """Export the number of files per package and section of the ARCHITECTURES to columnar files"""
+    with command_errors(debug, no_cache), command_profile(timings, profile, profile_memory) as (stage_timings, _), \
+            mirror_client(mirrors, retries) as client:
+        architectures = list(dict.fromkeys(ARCHITECTURES if 'all' in architectures else architectures))
+        from columnar import ColumnarWriter, ExportFormatNotAvailable, InvalidExportFolder
+        try:
+            writer = ColumnarWriter(output, formats)
+        except ExportFormatNotAvailable as e:
+            click.echo(f"\nError: {e}")
+            sys.exit(1)
+        except InvalidExportFolder as e:
+            raise click.BadParameter(str(e), param_hint='--output')
+
+        with writer, ThreadPoolExecutor(max_workers=len(architectures)) as executor:
+            # The files are downloaded concurrently, the rows are written in the order of the architectures
+            content_parsers = executor.map(partial(load_contents, force=force, stream=False, keep_file=not no_cache,
+                                                   client=client, compression=compression,
+                                                   table_header=table_header, timings=stage_timings),
+                                           architectures)
+            for architecture, content_parser in zip(architectures, content_parsers):
+                files_count_per_section = content_parser.count_files_per_section()
+                with stage(stage_timings, 'export') as counters:
+                    writer.add(architecture, files_count_per_section)
+                    counters['lines'] += writer.rows_per_architecture[architecture]
+        click.echo(f"Exported {sum(writer.rows_per_architecture.values())} rows of {', '.join(architectures)} "
+                   f"to {writer.folder}")
+
+
+def parse_percentiles(ctx, param, value: str) -> list:
+    """The callback of --percentiles, the comma separated percentiles as floats between 0 and 100"""
+    try:
+        percentiles = [float(percentile) for percentile in value.split(',')]
+    except ValueError:
+        raise click.BadParameter(f'{value} is not a comma separated list of numbers')
+    if not all(0 <= percentile <= 100 for percentile in percentiles):
+        raise click.BadParameter(f'{value} has a percentile outside of 0 to 100')
+    return percentiles
+
+
+@click.command()
+@click.option('--input', 'folder', default=EXPORT_FOLDER, type=click.Path(file_okay=False, exists=True),
+              help='The folder of the columnar export, written by the export command.')
+@click.option('--percentiles', default='50,90,99', callback=parse_percentiles,
+              help='The comma separated percentiles of the files per section, between 0 and 100.')
+@click.option('--specific', default=K_VALUE, type=click.IntRange(min=0),
+              help='The number of packages output for every architecture among the packages only in it.')
+def aggregate(folder, percentiles, specific):
+    """Output the statistics of all the architectures of a columnar export, computed with numpy"""
+    try:
+        from aggregation import ArchitectureAggregates
+        from columnar import ColumnarExport
+    except ImportError as e:
+        click.echo(f"\nError: The aggregate command needs numpy, pip install numpy ({e})")
+        sys.exit(1)
+    try:
+        aggregates = ArchitectureAggregates.from_export(ColumnarExport(folder))
+    except (OSError, EOFError, ValueError, KeyError) as e:
+        # No export.json, or a .npy file of the export missing or corrupt
+        raise click.BadParameter(f'{folder} is not a complete export written by the export command ({e!r})',
+                                 param_hint='--input')
+
+    click.echo(f"Top {K_VALUE} packages of {', '.join(aggregates.architectures)}")
+    echo_top_k(aggregates.top_k(K_VALUE))
+    for architecture, packages in aggregates.architecture_specific().items():
+        click.echo(f"\n{len(packages)} packages only in {architecture}")
+        echo_top_k(packages[:specific])
+    click.echo(f"\nPercentiles {', '.join(f'{percentile:g}' for percentile in percentiles)} of the files per section")
+    for section, values in aggregates.section_percentiles(percentiles).items():
+        click.echo(f"{section or '(none)': <35}\t{'  '.join(f'{value:g}' for value in values)}")
+
+
+@click.command()
+@click.option('--debug', default=False, help='Print the exception to the console for more info.')
+@click.option('--table_header', default=False,
+              help='Specifies if the table structure of the contents file has a header')
+@click.option('--workers', default=1, type=click.IntRange(min=1),
+              help='The number of processes used to parse the contents file.')
+@click.option('--refresh', default=3600, type=click.IntRange(min=0),
+              help='The seconds between two checks of the mirror for new contents files, 0 to never check.')
+@click.option('--socket', 'socket_path', default=SOCKET_PATH, help='The Unix socket the queries are answered on.')
+@click.option('--mirror', 'mirrors', multiple=True,
+              help='The url of a mirror folder holding the contents files, can be given several times. A file '
+                   'is downloaded from the next mirror if a mirror fails.')
+@click.option('--retries', default=2, type=click.IntRange(min=0),
+              help='The number of times the mirrors are tried again, with a growing delay, once all failed.')
+@click.option('--compression', default='gz', type=click.Choice(COMPRESSIONS),
+              help='The compression of the contents files downloaded, some mirrors only publish xz files.')
+@click.argument('architectures', nargs=-1, required=True)
+def serve(architectures, debug, table_header, workers, refresh, socket_path, mirrors, retries, compression):
+    """Keep the contents files of the ARCHITECTURES parsed in memory and answer the queries of src/query.py"""
+    # The downloaded files are kept, they are revalidated with the mirror when refreshing
+    with command_errors(debug, no_cache=False):
+        architectures = list(dict.fromkeys(ARCHITECTURES if 'all' in architectures else architectures))
+        import logging
+        from query_server import QueryServer
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+        with QueryServer(socket_path, architectures, table_header, workers, refresh,
+                         mirror_client(mirrors, retries), compression) as server:
+            click.echo(f"Loading {', '.join(architectures)}, the queries are answered on {socket_path} once loaded")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                click.echo("Stopped")
+
+
+cli = DefaultCommandGroup(commands={'top': package_statistics, 'owners': owners, 'files': files, 'diff': diff,
+                                   'export': export, 'aggregate': aggregate, 'serve': serve},
+                          default_command='top',
+                          help='Statistics of the packages and files in the contents files of a debian mirror.')
+
+
 if __name__ == '__main__':
-    package_statistics()
+    cli()
@@ -0,0 +1,93 @@
+"""Thin client of the query server started by `package_statistics serve`, see query_server.py. Only the standard
+library is imported, so a query costs the python startup and a round trip on the socket instead of a parse.
+
+Usage: python src/query.py top ARCHITECTURE [-k 10]
+       python src/query.py files ARCHITECTURE PACKAGE
+       python src/query.py owners ARCHITECTURE PATH [--prefix]
+       python src/query.py status
+All the commands take --socket PATH, the default is SOCKET_PATH.
+"""
+import argparse
+import json
+import socket
+import sys
+from constants import SOCKET_PATH, K_VALUE
+
+
+def non_negative_int(value: str) -> int:
+    """The argparse type of -k, an integer that is 0 or more"""
+    k = int(value)
+    if k < 0:
+        raise argparse.ArgumentTypeError(f'{value} is negative')
+    return k
+
+
+class ServerError(Exception):
+    """Raise if the server could not answer a query, the message is the error sent by the server"""
+    pass
+
+
+def query(request: dict, socket_path=SOCKET_PATH):
+    """
+    Send a query to the server
+    :param request: the query, for example {"query": "top", "architecture": "amd64", "k": 10}
+    :param socket_path: the Unix socket of the server
+    :return: the result of the query decoded from JSON
+    :raise ServerError: if the server answered an error, or closed the connection without answering
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ServerError('The server closed the connection without answering, see the log of the server')
+    answer = json.loads(line)
+    if not answer['ok']:
+        raise ServerError(answer['error'])
+    return answer['result']
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', default=SOCKET_PATH, help='The Unix socket of the query server')
+    commands = parser.add_subparsers(dest='query', required=True)
+    top = commands.add_parser('top', help='The top packages with the most files')
+    top.add_argument('architecture')
+    top.add_argument('-k', type=non_negative_int, default=K_VALUE)
+    files = commands.add_parser('files', help='The files of a package')
+    files.add_argument('architecture')
+    files.add_argument('package')
+    owners = commands.add_parser('owners', help='The packages owning a file, or the files under a path')
+    owners.add_argument('architecture')
+    owners.add_argument('path')
+    owners.add_argument('--prefix', action='store_true', help='List every file whose path starts with PATH')
+    commands.add_parser('status', help='The architectures loaded by the server')
+    args = vars(parser.parse_args(args))
+    socket_path = args.pop('socket')
+
+    try:
+        result = query(args, socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"Error: The query server is not running on {socket_path}, start it with package_statistics serve")
+        sys.exit(1)
+    except ServerError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if args['query'] == 'top':
+        for i, (package_name, count) in enumerate(result):
+            print(f"{i+1}. {package_name: <35}\t{count}")
+    elif args['query'] == 'files':
+        print('\n'.join(result))
+    elif args['query'] == 'owners':
+        for path, packages in result:
+            print(f"{path: <60}\t{', '.join(packages)}")
+    else:
+        print(json.dumps(result, indent=2))
+    if not result:
+        sys.exit(1)  # No such package or file, like the owners command
+
+
+if __name__ == '__main__':
+    main()
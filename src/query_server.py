@@ -0,0 +1,186 @@
+"""Server keeping the parsed contents files of some architectures in memory and answering queries about them over
+a Unix socket, see query.py for the client. A query is a line of JSON and so is its answer:
+- {"query": "top", "architecture": "amd64", "k": 10} -> {"ok": true, "result": [[package_name, number of files], ...]}
+- {"query": "files", "architecture": "amd64", "package": "bash"} -> {"ok": true, "result": [file, ...]}
+- {"query": "owners", "architecture": "amd64", "path": "usr/bin/bash", "prefix": false}
+  -> {"ok": true, "result": [[path, [package_name, ...]], ...]}
+- {"query": "status"} -> {"ok": true, "result": {architecture: {"loaded": time, "packages": ..., "paths": ...}}}
+A query that can not be answered gets {"ok": false, "error": message}.
+"""
+import json
+import logging
+import os
+import socketserver
+import time
+from threading import Event, Lock, Thread
+from constants import DOWNLOAD_FOLDER, URL_BASE, FILE_NAME_FORMAT, INDEX_FILE_FORMAT, K_VALUE, \
+    RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES
+from contents_index import ContentsIndex
+from contents_parser import ContentsParser
+from mirror_client import MirrorClient
+from result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class QueryError(Exception):
+    """Raise if a query can not be answered, the message is sent back to the client"""
+    pass
+
+
+class ArchitectureData:
+    """The parsed contents file of an architecture: the packages sorted by most files and the index of the files"""
+
+    def __init__(self, gz_filepath: str, index_path: str, table_header: bool, workers: int, cache: ResultCache):
+        self.modified = os.stat(gz_filepath).st_mtime_ns  # The version of the contents file the data was parsed from
+        content_parser = ContentsParser(gz_filepath, table_header=table_header, workers=workers, cache=cache)
+        # Sorted the same way as top_k_packages, so the top k packages for any k are the first k
+        self.ranking = sorted(content_parser.count_files_per_package().items(), key=lambda item: (-item[1], item[0]))
+        if os.path.isfile(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(gz_filepath):
+            self.index = ContentsIndex(index_path)
+        else:
+            self.index = content_parser.build_index(index_path)
+        self.loaded = time.time()
+
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Load the contents files of the architectures and answer the queries of the clients. Every connection is
+    served in its own thread, and the contents files are downloaded again and parsed in a background thread
+    every refresh_interval seconds if they changed on the mirror.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, architectures: list, table_header=False, workers=1, refresh_interval=3600,
+                 client=None, compression='gz'):
+        # The contents files are downloaded from the mirrors of the client, closed with the server
+        self.client = client or MirrorClient([URL_BASE])
+        self.architectures = architectures  # The architectures whose contents files are loaded
+        self.table_header = table_header
+        self.workers = workers  # The number of processes used to parse a contents file
+        self.refresh_interval = refresh_interval  # The seconds between two checks of the mirror, 0 to never check
+        self.compression = compression  # The compression of the contents files downloaded, gz or xz
+        self.cache = ResultCache(RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES)
+        self._data = {}  # architecture -> ArchitectureData, replaced as a whole when a file is parsed again
+        self._data_lock = Lock()
+        self._stopped = Event()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # The socket of a server that did not stop cleanly
+        super().__init__(socket_path, QueryHandler)
+
+    def load(self, architecture: str):
+        """
+        Download the contents file of an architecture if it changed on the mirror and parse it. The queries are
+        answered from the previous data till the new data is ready.
+        """
+        os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+        gz_filename = FILE_NAME_FORMAT.format(architecture, self.compression)
+        gz_filepath = os.path.join(DOWNLOAD_FOLDER, gz_filename)
+        # The local copy is kept if the file did not change on the mirror, it is not parsed again then
+        self.client.download(gz_filename, gz_filepath)
+
+        previous = self._data.get(architecture)
+        if previous is not None and previous.modified == os.stat(gz_filepath).st_mtime_ns:
+            return
+        data = ArchitectureData(gz_filepath, os.path.join(DOWNLOAD_FOLDER, INDEX_FILE_FORMAT.format(architecture)),
+                                self.table_header, self.workers, self.cache)
+        with self._data_lock:
+            self._data[architecture] = data
+        # The previous index is not closed, a query may still be reading it. It is unmapped once it is not used.
+        logger.info('Loaded %s, %d packages and %d paths', architecture, len(data.ranking), data.index.paths)
+
+    def _refresh(self):
+        """Check the mirror every refresh_interval seconds till the server stops"""
+        while not self._stopped.wait(self.refresh_interval):
+            for architecture in self.architectures:
+                try:
+                    self.load(architecture)
+                except Exception:  # The server keeps answering from the data it has
+                    logger.exception('Could not refresh %s', architecture)
+
+    def serve_forever(self, poll_interval=0.5):
+        """Load every architecture, then answer the queries till shutdown is called"""
+        for architecture in self.architectures:
+            self.load(architecture)
+        if self.refresh_interval:
+            Thread(target=self._refresh, daemon=True).start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self._stopped.set()
+
+    def server_close(self):
+        super().server_close()
+        self.client.close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+    @staticmethod
+    def _field(query: dict, name: str, field_type: type, default=None):
+        """
+        Get a field of a query
+        :param query: the query
+        :param name: the name of the field
+        :param field_type: the type the value of the field has to be
+        :param default: the value of a missing field, None if the field is required
+        :return: the value of the field
+        :raise QueryError: if the field is missing or its value is not of field_type
+        """
+        value = query.get(name, default)
+        # bool is a subclass of int, true is not a number of packages
+        if not isinstance(value, field_type) or (isinstance(value, bool) and field_type is not bool):
+            raise QueryError(f'Invalid query, {name} has to be a {field_type.__name__}: {value!r}')
+        return value
+
+    def _architecture(self, query: dict) -> ArchitectureData:
+        architecture = self._field(query, 'architecture', str)
+        with self._data_lock:
+            data = self._data.get(architecture)
+        if data is None:
+            raise QueryError(f"Architecture {architecture} is not loaded, the server has "
+                             f"{', '.join(self.architectures)}")
+        return data
+
+    def answer(self, query: dict):
+        """
+        Answer a query
+        :param query: the decoded JSON of the query
+        :return: the result of the query, it is encoded as JSON
+        :raise QueryError: if the query is not a JSON object or a field of the query is missing or invalid
+        """
+        if not isinstance(query, dict):
+            raise QueryError(f'Invalid query, a JSON object is expected: {query!r}')
+        kind = query.get('query')
+        if kind == 'top':
+            k = self._field(query, 'k', int, K_VALUE)
+            if k < 0:
+                raise QueryError(f'Invalid query, k has to be 0 or more: {k}')
+            return self._architecture(query).ranking[:k]
+        if kind == 'files':
+            return self._architecture(query).index.files_of(self._field(query, 'package', str))
+        if kind == 'owners':
+            index = self._architecture(query).index
+            path = self._field(query, 'path', str)
+            if query.get('prefix'):
+                return list(index.paths_with_prefix(path))
+            packages = index.packages_owning(path)
+            return [[path.lstrip('/'), packages]] if packages else []
+        if kind == 'status':
+            with self._data_lock:
+                return {architecture: {'loaded': data.loaded, 'packages': len(data.ranking),
+                                       'paths': data.index.paths}
+                        for architecture, data in self._data.items()}
+        raise QueryError(f'Unknown query {kind}')
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    """Answer the queries of a connection, one line of JSON each, till the client closes it"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                answer = {'ok': True, 'result': self.server.answer(json.loads(line))}
+            except (QueryError, KeyError, ValueError) as e:
+                answer = {'ok': False, 'error': str(e) if isinstance(e, QueryError) else f'Invalid query: {e!r}'}
+            self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+            self.wfile.flush()
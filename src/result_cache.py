@@ -0,0 +1,158 @@
+"""On disk cache of the number of files per package parsed from the contents files.
+A result is stored in a compact binary file, keyed by the SHA256 of the contents file and the
+ETag/Last-Modified headers of the response it was downloaded from. The SHA256 of a contents file is saved next to
+it, so that a cached result is found without reading the whole file again.
+"""
+import hashlib
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+from constants import DIGEST_FILE_FORMAT
+from utils import read_validators
+
+MAGIC = b'PSC1'
+# magic, number of packages, length of the compressed package names
+HEADER = struct.Struct('<4sII')
+
+
+class ResultCache:
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder  # The folder where the results are stored, created on the first store
+        self.max_bytes = max_bytes  # The least recently used results are evicted when the folder grows above this
+
+    @staticmethod
+    def file_digest(filepath: str) -> str:
+        """
+        Compute the SHA256 of a file. It is saved in DIGEST_FILE_FORMAT along with the size, modification time and
+        inode of the file, and computed again only if one of them changed. A downloaded file is always replaced
+        with a new file, which changes its inode.
+        :param filepath: the path of the file
+        :return: the SHA256 as a hex string
+        """
+        stat = os.stat(filepath)
+        version = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        digest_path = DIGEST_FILE_FORMAT.format(filepath)
+        try:
+            with open(digest_path) as f:
+                saved = json.load(f)
+            if saved['file'] == version:
+                return saved['sha256']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # Not computed yet or broken, it is computed again
+
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024*1024), b''):
+                digest.update(chunk)
+        try:
+            with open(digest_path, 'w') as f:
+                json.dump({'file': version, 'sha256': digest.hexdigest()}, f)
+        except OSError:
+            pass  # The digest is computed again the next time
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(filepath: str, table_header: bool) -> str:
+        """
+        Compute the key of the result of parsing a contents file
+        :param filepath: the path of the gzip compressed contents file
+        :param table_header: the table_header option of the parser, it changes the result
+        :return: the key as a hex string
+        """
+        validators = read_validators(filepath)
+        digest = hashlib.sha256(ResultCache.file_digest(filepath).encode('ascii'))
+        digest.update(json.dumps([validators['etag'], validators['last_modified'], bool(table_header)])
+                      .encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f'{key}.bin')
+
+    def get(self, key: str):
+        """
+        Load a cached result
+        :param key: the key of the result
+        :return: the Counter containing package -> number of files mappings, None if the result is not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            magic, packages, names_size = HEADER.unpack_from(data)
+            if magic != MAGIC:
+                raise ValueError(f'Not a cached result: {path}')
+            counts = array('I')
+            counts.frombytes(data[HEADER.size:HEADER.size + 4 * packages])
+            if sys.byteorder == 'big':
+                counts.byteswap()  # The counts are stored little endian
+            names_start = HEADER.size + 4 * packages
+            names = zlib.decompress(data[names_start:names_start + names_size]).decode('utf-8').split('\n')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error, zlib.error):
+            # A broken result is dropped and parsed again
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)  # The modification time orders the results for the LRU eviction
+        except FileNotFoundError:
+            return None  # Evicted by another thread storing a result since it was read
+        # The results are stored sorted by most files, so the Counter keeps that order
+        return Counter(dict(zip(names, counts)))
+
+    def put(self, key: str, files_count_per_package: dict):
+        """
+        Store a result and evict the least recently used results above max_bytes
+        :param key: the key of the result
+        :param files_count_per_package: the dictionary containing package -> number of files mappings
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        # Sort the same way as top_k_packages, so the first k packages of the result are its top k packages
+        ordered = sorted(files_count_per_package.items(), key=lambda item: (-item[1], item[0]))
+        counts = array('I', (count for _, count in ordered))
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        names = zlib.compress('\n'.join(package_name for package_name, _ in ordered).encode('utf-8'))
+
+        path = self._path(key)
+        with open(f'{path}.part', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(ordered), len(names)))
+            f.write(counts.tobytes())
+            f.write(names)
+        os.replace(f'{path}.part', path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used results till the results use at most max_bytes
+        :param keep: a result that is never removed, usually the one just stored
+        """
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith('.bin'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # Evicted by another thread storing a result at the same time
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            if path != keep:
+                self._remove(path)
+                total_size -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
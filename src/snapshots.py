@@ -0,0 +1,118 @@
+"""Snapshots of the number of files per package of a contents file, and the diff between two snapshots.
+A snapshot is a gzip compressed text file with a "package_name number_of_files" line per package, sorted by
+package name. The snapshots being sorted, two of them are compared in a single pass over both (a merge-join),
+without loading either of them in memory.
+"""
+import gzip
+import os
+import zlib
+from top_k import TopK
+
+
+class InvalidSnapshot(Exception):
+    """Raise if a snapshot file is broken or not sorted by package name"""
+    pass
+
+
+def write_snapshot(path: str, files_count_per_package: dict):
+    """
+    Save the snapshot of a contents file
+    :param path: the path where the snapshot is to be saved
+    :param files_count_per_package: the dictionary containing package -> number of files mappings
+    """
+    with gzip.open(f'{path}.part', 'wt', encoding='utf-8') as f:
+        for package_name, count in sorted(files_count_per_package.items()):
+            f.write(f'{package_name} {count}\n')
+    os.replace(f'{path}.part', path)  # The previous snapshot is kept till the new one is complete
+
+
+def iter_snapshot(path: str):
+    """
+    Read a snapshot line by line
+    :param path: the path of the snapshot
+    :return: a generator of (package_name, number of files) tuples sorted by package name
+    :raise InvalidSnapshot: if the snapshot is truncated, is not gzip compressed utf-8 or has a broken line
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        while True:
+            try:
+                line = f.readline()
+            except (EOFError, gzip.BadGzipFile, zlib.error, UnicodeDecodeError) as e:
+                raise InvalidSnapshot(f'{path}: {e}') from e
+            if not line:
+                return
+            package_name, _, count = line.rpartition(' ')
+            try:
+                count = int(count)
+            except ValueError:
+                raise InvalidSnapshot(f'{path}: {line!r}')
+            yield package_name, count
+
+
+def _sorted(rows, name: str):
+    """Pass the rows through, checking that they are sorted by package name which the merge-join needs"""
+    previous = None
+    for package_name, count in rows:
+        if previous is not None and package_name <= previous:
+            raise InvalidSnapshot(f'The {name} rows are not sorted by package name: {package_name}')
+        previous = package_name
+        yield package_name, count
+
+
+class SnapshotDiff:
+    """
+    The changes between two snapshots. Iterating over the diff merges the two snapshots and yields the packages
+    whose number of files changed, the top k packages of both snapshots are available once the iteration is done.
+    """
+
+    def __init__(self, old_rows, new_rows, k: int):
+        """
+        :param old_rows: the (package_name, number of files) tuples of the previous snapshot sorted by package name
+        :param new_rows: the (package_name, number of files) tuples of the new snapshot sorted by package name
+        :param k: the number of top packages whose movement is reported
+        """
+        self._old_rows = _sorted(old_rows, 'previous')
+        self._new_rows = _sorted(new_rows, 'new')
+        self.added = 0  # The number of packages only in the new snapshot
+        self.removed = 0  # The number of packages only in the previous snapshot
+        self.changed = 0  # The number of packages in both snapshots whose number of files changed
+        self._old_top_k = TopK(k)
+        self._new_top_k = TopK(k)
+
+    def __iter__(self):
+        """
+        Merge the two snapshots
+        :return: a generator of (package_name, previous number of files, new number of files) tuples sorted by
+        package name. The previous number is None for an added package and the new number None for a removed one.
+        """
+        old_row, new_row = next(self._old_rows, None), next(self._new_rows, None)
+        while old_row is not None or new_row is not None:
+            if new_row is None or (old_row is not None and old_row[0] < new_row[0]):
+                self.removed += 1
+                self._old_top_k.push(*old_row)
+                yield old_row[0], old_row[1], None
+                old_row = next(self._old_rows, None)
+            elif old_row is None or new_row[0] < old_row[0]:
+                self.added += 1
+                self._new_top_k.push(*new_row)
+                yield new_row[0], None, new_row[1]
+                new_row = next(self._new_rows, None)
+            else:
+                self._old_top_k.push(*old_row)
+                self._new_top_k.push(*new_row)
+                if old_row[1] != new_row[1]:
+                    self.changed += 1
+                    yield old_row[0], old_row[1], new_row[1]
+                old_row, new_row = next(self._old_rows, None), next(self._new_rows, None)
+
+    def top_k_movement(self) -> tuple:
+        """
+        The movement of the top k packages, to be called once the diff was iterated over
+        :return: a list (package_name, number of files, previous rank or None if the package was not in the previous
+        top k) of the top k packages of the new snapshot, and the list of the packages that left the top k
+        """
+        old_ranks = {package_name: rank for rank, (package_name, _) in enumerate(self._old_top_k.result(), 1)}
+        new_top_k = self._new_top_k.result()
+        new_names = {package_name for package_name, _ in new_top_k}
+        movement = [(package_name, count, old_ranks.get(package_name)) for package_name, count in new_top_k]
+        return movement, [package_name for package_name in old_ranks if package_name not in new_names]
@@ -0,0 +1,157 @@
+"""Instrumentation of the stages of a run: the download, the decompression, the counting and so on.
+StageTimings records the wall time, CPU time, bytes and lines processed and the peak memory of every stage. It is
+passed to the ContentsParser, or used directly by a library caller, and the stages are timed with the stage()
+context manager or the iter_stage() generator. Profiler collects a cProfile of the run across threads.
+"""
+import resource
+import time
+from contextlib import contextmanager, nullcontext
+from threading import Lock, local
+
+
+class StageTimings:
+    """
+    The time spent in each stage. A stage entered while another stage is running is nested: its time is counted
+    in the nested stage only, so the times of the stages add up to the time of the run. The CPU time is the time
+    of the thread running the stage, the worker processes of the parallel parser are not included.
+    """
+
+    def __init__(self):
+        self.stages = {}  # stage name -> the dictionary of the metrics of the stage, in the order the stages started
+        self._lock = Lock()
+        self._running = local()  # The stack of the stages running in the current thread
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a stage, the stage can be entered several times and the metrics are added up
+        :param name: the name of the stage
+        :return: a context manager yielding a dictionary where the bytes and lines processed are to be added
+        """
+        import tracemalloc  # Imported once a stage is timed, not by every run of the command line tool
+        counters = {'bytes': 0, 'lines': 0}
+        with self._lock:
+            metrics = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'bytes': 0, 'lines': 0,
+                                                    'peak_rss_mb': 0.0, 'allocated_peak_mb': None})
+        running = getattr(self._running, 'stack', None)
+        if running is None:
+            running = self._running.stack = []
+        # The time of the stages nested in this one
+        nested = {'name': name, 'wall_s': 0.0, 'cpu_s': 0.0, 'allocated_peak': 0}
+        running.append(nested)
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield counters
+        finally:
+            wall_time, cpu_time = time.perf_counter() - start, time.thread_time() - start_cpu
+            running.pop()
+            # The peak of the allocations can only be reset, so the peak of a stage includes its nested stages
+            allocated_peak = max(tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0,
+                                 nested['allocated_peak'])
+            if running:
+                running[-1]['wall_s'] += wall_time
+                running[-1]['cpu_s'] += cpu_time
+                running[-1]['allocated_peak'] = max(running[-1]['allocated_peak'], allocated_peak)
+            with self._lock:
+                metrics['calls'] += 1
+                metrics['wall_s'] += wall_time - nested['wall_s']
+                metrics['cpu_s'] += cpu_time - nested['cpu_s']
+                metrics['bytes'] += counters['bytes']
+                metrics['lines'] += counters['lines']
+                # ru_maxrss is in kilobytes on linux, it is the peak of the process so far
+                metrics['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                if tracemalloc.is_tracing():
+                    metrics['allocated_peak_mb'] = max(metrics['allocated_peak_mb'] or 0, allocated_peak / 2**20)
+
+    def running(self) -> list:
+        """The names of the stages running in the current thread, the innermost one last"""
+        return [nested['name'] for nested in getattr(self._running, 'stack', [])]
+
+    def iter_stage(self, name: str, iterable):
+        """
+        Time the production of the items of an iterable as a stage, for example the decompression of the blocks
+        read by the parser. The length of every item is added to the bytes of the stage.
+        :param name: the name of the stage
+        :param iterable: an iterable of bytes
+        :return: a generator of the items of the iterable
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as counters:
+                item = next(iterator, None)
+                if item is None:
+                    return
+                counters['bytes'] += len(item)
+            yield item
+
+    def report(self) -> list:
+        """
+        The lines of a table of the metrics of every stage
+        :return: the list of lines, the last one is the total of the stages
+        """
+        lines = [f"{'Stage': <12}{'Calls': >8}{'Wall s': >10}{'CPU s': >10}{'MB': >10}{'Lines': >12}"
+                 f"{'Peak RSS MB': >13}{'Allocated MB': >14}"]
+        for name, metrics in self.stages.items():
+            allocated = '-' if metrics['allocated_peak_mb'] is None else f"{metrics['allocated_peak_mb']:.1f}"
+            lines.append(f"{name: <12}{metrics['calls']: >8}{metrics['wall_s']: >10.3f}{metrics['cpu_s']: >10.3f}"
+                         f"{metrics['bytes'] / 2**20: >10.1f}{metrics['lines']: >12}{metrics['peak_rss_mb']: >13.1f}"
+                         f"{allocated: >14}")
+        lines.append(f"{'total': <12}{'': >8}{sum(metrics['wall_s'] for metrics in self.stages.values()): >10.3f}"
+                     f"{sum(metrics['cpu_s'] for metrics in self.stages.values()): >10.3f}")
+        return lines
+
+
+def stage(timings, name: str):
+    """
+    The stage of a StageTimings that can be None, so that the callers do not check whether they are timed
+    :return: the timings.stage(name) context manager, or a context manager doing nothing if timings is None
+    """
+    if timings is None:
+        return nullcontext({'bytes': 0, 'lines': 0})
+    return timings.stage(name)
+
+
+def iter_stage(timings, name: str, iterable):
+    """The timings.iter_stage(name, iterable) generator, or the iterable itself if timings is None"""
+    if timings is None:
+        return iterable
+    return timings.iter_stage(name, iterable)
+
+
+class Profiler:
+    """
+    cProfile of the functions of a run, including the ones running in other threads. A cProfile.Profile only
+    sees the thread it was enabled in, so every thread has its own profile and the profiles are merged in the dump.
+    """
+
+    def __init__(self):
+        self._profiles = []
+        self._lock = Lock()
+
+    def _new_profile(self) -> 'cProfile.Profile':
+        import cProfile
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    @contextmanager
+    def profile(self):
+        """Profile the calling thread while the context is entered"""
+        profile = self._new_profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def call(self, function, *args, **kwargs):
+        """Call a function with its own profile, used to profile the functions running in a thread pool"""
+        return self._new_profile().runcall(function, *args, **kwargs)
+
+    def dump(self, path: str):
+        """Write the merged profiles to a file, which can be read with pstats.Stats(path)"""
+        import pstats
+        pstats.Stats(*self._profiles).dump_stats(path)
@@ -0,0 +1,65 @@
+"""Streaming selection of the top k packages with the most files.
+Only the k best packages seen so far are kept in a min-heap, so the memory used does not grow with the
+number of packages and the counts can be pushed as they are produced, by a parser, by the worker processes
+or from a cached result.
+"""
+from collections.abc import Mapping
+from heapq import heappush, heapreplace
+
+
+class _Descending:
+    """A package name that compares in reverse order, so that the worst of the top k is at the top of the heap"""
+    __slots__ = ('name',)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __lt__(self, other) -> bool:
+        return self.name > other.name
+
+    def __eq__(self, other) -> bool:
+        return self.name == other.name
+
+
+class TopK:
+    """
+    The top k packages with the most files, ties are broken by the package name so the result does not
+    depend on the order the counts are pushed in. Every package has to be pushed once with its total count.
+    """
+
+    def __init__(self, k: int):
+        self.k = k  # The number of packages kept
+        # A min-heap of (number of files, _Descending(package name)), the top of the heap is the package
+        # with the fewest files and the greatest name, the first one to be replaced by a better package
+        self._heap = []
+
+    def push(self, package_name: str, count: int):
+        """Offer a package with its number of files"""
+        self.update(((package_name, count),))
+
+    def update(self, files_count_per_package):
+        """
+        Offer many packages at once
+        :param files_count_per_package: a dictionary of package -> number of files or an iterable of
+        (package_name, number of files) tuples
+        """
+        if isinstance(files_count_per_package, Mapping):
+            files_count_per_package = files_count_per_package.items()
+        heap, k = self._heap, self.k
+        for package_name, count in files_count_per_package:
+            if len(heap) < k:
+                heappush(heap, (count, _Descending(package_name)))
+            elif heap and count >= heap[0][0]:
+                # Most packages have fewer files than the top k, they are dropped by the comparison above
+                if count > heap[0][0] or package_name < heap[0][1].name:
+                    heapreplace(heap, (count, _Descending(package_name)))
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def result(self) -> list:
+        """
+        The top k packages seen so far
+        :return: A list (package_name, number of files) sorted by most files, then by package name
+        """
+        return [(package_name.name, count) for count, package_name in sorted(self._heap, reverse=True)]
@@ -1,54 +1,238 @@
-"""A collection of utility files used by the command line tool"""
+"""A collection of utility files used by the command line tool.
+requests and tqdm are imported by the first download, they are not needed when the local copy of a file is used.
+"""
 
 import os
-import requests
-import shutil
-import gzip
-from tqdm import tqdm
+import json
+from contextlib import nullcontext
+from threading import Lock
+from constants import VALIDATORS_FILE_FORMAT, ARCHITECTURES, READ_BLOCK_SIZE
+from decompression import GZIP_MAGIC, XZ_MAGIC, iter_decompressed_file
 
+_session = None  # The session shared by the downloads, see get_session
+_session_lock = Lock()
 
-def download_file(file_url: str, file_name: str, chunk_size=1024*1024) -> bool:
+
+def get_session() -> 'requests.Session':
+    """
+    Get the session shared by all the downloads. The session keeps the connections to the mirror
+    alive between requests, with a pool large enough for every architecture to be downloaded at once.
+    :return: the shared requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=len(ARCHITECTURES))
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
+
+def read_validators(file_name: str) -> dict:
+    """
+    Read the ETag and Last-Modified headers of the response a file was downloaded from.
+
+    :param file_name: The downloaded file.
+    :return: the dictionary with the etag and last_modified values, which are None if not known
+    """
+    try:
+        with open(VALIDATORS_FILE_FORMAT.format(file_name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'etag': None, 'last_modified': None}
+
+
+def write_validators(file_name: str, headers):
+    """
+    Save the ETag and Last-Modified headers of the response a file is downloaded from.
+
+    :param file_name: The downloaded file.
+    :param headers: The headers of the response.
+    """
+    with open(VALIDATORS_FILE_FORMAT.format(file_name), 'w') as f:
+        json.dump({'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}, f)
+
+
+def iter_file(file_name: str, chunk_size=1024*1024):
+    """
+    Read a local file chunk by chunk.
+
+    :param file_name: The file to be read.
+    :param chunk_size: The chunk_size in bytes.
+    :return: a generator of the chunks of the file
     """
-    Downloads the file from the given url and saves it to the path.
+    with open(file_name, 'rb') as f:
+        yield from iter(lambda: f.read(chunk_size), b'')
+
+
+def conditional_headers(file_name=None) -> dict:
+    """
+    The headers of a request that revalidates the local copy of a file and resumes the download of its part file.
+
+    :param file_name: The filename the file is saved to, None if it is not saved.
+    :return: the dictionary of the headers
+    """
+    headers = {}
+    if not file_name:
+        return headers
+    if os.path.isfile(file_name):
+        # Ask the server to answer 304 Not Modified if the local copy is the latest version
+        validators = read_validators(file_name)
+        if validators['etag']:
+            headers['If-None-Match'] = validators['etag']
+        if validators['last_modified']:
+            headers['If-Modified-Since'] = validators['last_modified']
+    part_name = f'{file_name}.part'
+    part_size = os.path.getsize(part_name) if os.path.isfile(part_name) else 0
+    if part_size:
+        # Ask only for the rest of the file, the server sends the whole file if it changed since the part was saved
+        validators = read_validators(part_name)
+        if validators['etag'] or validators['last_modified']:
+            headers['Range'] = f'bytes={part_size}-'
+            headers['If-Range'] = validators['etag'] or validators['last_modified']
+    return headers
+
+
+def remove_part(file_name: str):
+    """Remove the part file of a download and its validators"""
+    part_name = f'{file_name}.part'
+    for path in (part_name, VALIDATORS_FILE_FORMAT.format(part_name)):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def request_file(file_url: str, file_name=None) -> 'requests.Response':
+    """
+    Send the request of a file, conditional on its local copy and resuming its part file, see conditional_headers.
 
     :param file_url: The url of the file to be downloaded.
-    :param file_name: The filename to save the downloaded file.
+    :param file_name: The filename to save the downloaded file, None to not save it.
+    :return: the streamed response, None if the local copy is the same as the file on the server
+    :raise: requests.HTTPError if the response has an error status code
+    """
+    headers = conditional_headers(file_name)
+    r = get_session().get(file_url, stream=True, headers=headers)
+    if r.status_code == 416 and 'Range' in headers:
+        # The part is not shorter than the file on the server, a complete part of an interrupted rename for example,
+        # it is downloaded again from the first byte
+        r.close()
+        remove_part(file_name)
+        del headers['Range'], headers['If-Range']
+        r = get_session().get(file_url, stream=True, headers=headers)
+    if r.status_code == 304:  # The local copy is the same as the file on the server
+        r.close()
+        return None
+    try:
+        r.raise_for_status()  # Raise an exception if the response has an error status code
+    except Exception:
+        r.close()
+        raise
+    return r
+
+
+def iter_response(r: 'requests.Response', file_name=None, chunk_size=1024*1024):
+    """
+    Yield the content of a response of request_file chunk by chunk as it arrives, saving it to file_name.part and
+    renaming it to file_name once complete.
+
+    :param r: The response, it is closed once read.
+    :param file_name: The filename to save the downloaded file, None to not save it.
     :param chunk_size: The chunk_size in bytes that should be used while downloading.
-    :return: True if file was successfully downloaded false otherwise
+    :return: a generator of the chunks of the file, always from its first byte
     """
+    part_name = f'{file_name}.part'
+    with r:
+        resumed = r.status_code == 206
+        if resumed:
+            yield from iter_file(part_name, chunk_size)  # The file starts with the part downloaded before
+        elif file_name:
+            write_validators(part_name, r.headers)
 
-    with requests.get(file_url, stream=True) as r:  # Send a GET request to the URL with streaming enabled
-        r.raise_for_status()  # Raise an exception if the response has an error status code
+        from tqdm import tqdm
         total_size_in_bytes = int(r.headers.get('content-length', 0))
         progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True)
-        with open(file_name, "wb") as f:  # Open the file in binary mode for writing
+        with open(part_name, "ab" if resumed else "wb") if file_name else nullcontext() as f:
             for chunk in r.iter_content(chunk_size=chunk_size):  # Iterate over the response content in chunks
                 progress_bar.update(len(chunk))
-                f.write(chunk)  # Write each chunk to the file
+                if f:
+                    f.write(chunk)  # Write each chunk to the file
+                yield chunk
+
+    if file_name:
+        # Rename in one step, so a partial file is never used
+        os.replace(part_name, file_name)
+        os.replace(VALIDATORS_FILE_FORMAT.format(part_name), VALIDATORS_FILE_FORMAT.format(file_name))
+
+
+def stream_file(file_url: str, file_name=None, chunk_size=1024*1024):
+    """
+    Downloads the file from the given url and yields its content chunk by chunk as it arrives.
+
+    If file_name is given the chunks are also saved to this file. The file only appears once the download is
+    complete, till then the chunks are written to file_name.part. The ETag and Last-Modified headers of the
+    response are saved next to it and are used to
+    - revalidate an existing file_name, the local copy is read if the file on the server has not changed.
+    - resume an interrupted download from the end of file_name.part, if the file on the server has not changed.
+
+    :param file_url: The url of the file to be downloaded.
+    :param file_name: The filename to save the downloaded file, None to not save it.
+    :param chunk_size: The chunk_size in bytes that should be used while downloading.
+    :return: a generator of the chunks of the file, always from its first byte
+    """
+    r = request_file(file_url, file_name)
+    if r is None:
+        yield from iter_file(file_name, chunk_size)
+    else:
+        yield from iter_response(r, file_name, chunk_size)
+
+
+def download_file(file_url: str, file_name: str, chunk_size=1024*1024) -> bool:
+    """
+    Downloads the file from the given url and saves it to the path. An existing copy is kept, and not read, if the
+    file on the server has not changed and an interrupted download is resumed, see stream_file.
+
+    :param file_url: The url of the file to be downloaded.
+    :param file_name: The filename to save the downloaded file.
+    :param chunk_size: The chunk_size in bytes that should be used while downloading.
+    :return: True if file was successfully downloaded false otherwise
+    """
+    r = request_file(file_url, file_name)
+    if r is not None:
+        for _ in iter_response(r, file_name, chunk_size):
+            pass
 
     return os.path.isfile(file_name)  # Returns true if the file was downloaded successfully
 
 
 def unzip_gz_file(gz_file_path: str, output_file: str) -> bool:
     """
-    Unzips the gzip file to the specified directory
-    :param gz_file_path: The path to the file which is to be unzipped
+    Unzips the gzip or xz file to the specified directory, with the fastest decompression backend installed. The
+    compression is told by the first bytes of the file, like the contents files parsed by ContentsParser.
+    :param gz_file_path: The path to the .gz or .xz file which is to be unzipped
     :param output_file: The path where the file is to be saved
     :return: True if the file was unzipped successfully
+    :raise ValueError: if the file is not named or does not start like a gzip or xz file
     """
-    # Check that the input file is a .gz file
-    if not gz_file_path.endswith('.gz'):
-        raise ValueError('file is not a .gz file')
+    # Check that the input file is a .gz or .xz file
+    if not gz_file_path.endswith(('.gz', '.xz')):
+        raise ValueError('file is not a .gz or .xz file')
 
     # Check that the input file exists
     if not os.path.isfile(gz_file_path):
         raise FileNotFoundError(f'File not found: {gz_file_path}')
 
+    with open(gz_file_path, 'rb') as f:
+        head = f.read(len(XZ_MAGIC))
+    if not head.startswith((GZIP_MAGIC, XZ_MAGIC)):
+        raise ValueError(f'{gz_file_path} is not a gzip or xz file')
+
     try:
-        # Open the .gz file for reading and the output file for writing
-        with gzip.open(gz_file_path, 'rb') as gz_file, open(output_file, 'wb') as out_file:
-            # Read the contents of the .gz file and write them to the output file
-            shutil.copyfileobj(gz_file, out_file)  # Shuttle allows copy without loading the entire file
+        # Decompress the .gz file block by block and write the blocks to the output file
+        with open(output_file, 'wb') as out_file:
+            for block in iter_decompressed_file(gz_file_path, READ_BLOCK_SIZE):
+                out_file.write(block)
     except Exception as e:
         raise Exception(f'Error unzipping file {gz_file_path}: {str(e)}')
 
@@ -0,0 +1,29 @@
+import gzip
+import pytest
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """Serve the files of a folder without logging every request"""
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    # Serve the contents files of two architectures from a local HTTP server standing in for the debian mirror
+    mirror_folder = tmp_path / 'mirror'
+    mirror_folder.mkdir()
+    with gzip.open(mirror_folder / 'Contents-amd64.gz', 'wb') as f:
+        f.write(b"file1  pkgA\nfile2  pkgA\nfile3  admin/pkgA,pkgB\n")
+    with gzip.open(mirror_folder / 'Contents-arm64.gz', 'wb') as f:
+        f.write(b"file1  pkgB\nfile2  pkgB\nfile3  pkgB\nfile4  pkgC\n")
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHTTPRequestHandler, directory=str(mirror_folder)))
+    Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.chdir(tmp_path)  # The downloads folder is created in the working directory
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
@@ -0,0 +1,73 @@
+import pytest
+
+from collections import Counter
+from src.contents_parser import top_k_packages
+
+np = pytest.importorskip('numpy')
+
+from src.aggregation import ArchitectureAggregates  # noqa: E402
+from src.columnar import ColumnarExport, ColumnarWriter  # noqa: E402
+
+FILES_COUNT_PER_SECTION_PER_ARCHITECTURE = {
+    'amd64': {'': Counter({'pkgA': 2, 'pkgB': 1}), 'admin': Counter({'pkgA': 1, 'pkgD': 5})},
+    'arm64': {'': Counter({'pkgB': 3, 'pkgC': 1}), 'utils': Counter({'pkgE': 4, 'pkgF': 9})},
+    'i386': {'': Counter({'pkgB': 2, 'pkgC': 1})},
+}
+
+
+@pytest.fixture(params=['counts', 'export'])
+def aggregates(request, tmp_path):
+    # The same aggregates from the parsed counts and from the memory mapped arrays of a columnar export
+    if request.param == 'counts':
+        return ArchitectureAggregates.from_counts(FILES_COUNT_PER_SECTION_PER_ARCHITECTURE)
+    with ColumnarWriter(str(tmp_path / 'export')) as writer:
+        for architecture, files_count_per_section in FILES_COUNT_PER_SECTION_PER_ARCHITECTURE.items():
+            writer.add(architecture, files_count_per_section)
+    return ArchitectureAggregates.from_export(ColumnarExport(str(tmp_path / 'export')))
+
+
+def test_totals(aggregates):
+    totals = dict(zip(aggregates.package_names, aggregates.totals().tolist()))
+    assert totals == {'pkgA': 3, 'pkgB': 6, 'pkgC': 2, 'pkgD': 5, 'pkgE': 4, 'pkgF': 9}
+    assert aggregates.files.shape == (3, 6)
+
+
+def test_top_k(aggregates):
+    # The ties are broken by the package name, like top_k_packages
+    assert aggregates.top_k(3) == [('pkgF', 9), ('pkgB', 6), ('pkgD', 5)]
+    assert aggregates.top_k(2, 'i386') == [('pkgB', 2), ('pkgC', 1)]
+    assert aggregates.top_k(10, 'amd64') == [('pkgD', 5), ('pkgA', 3), ('pkgB', 1)]
+    assert aggregates.top_k(0) == [] and aggregates.top_k(-1, 'amd64') == []
+
+
+def test_top_k_same_as_top_k_packages():
+    rng = np.random.default_rng(0)
+    counts = {architecture: {'': Counter({f'package{i}': int(count) for i, count in
+                                          enumerate(rng.integers(0, 20, 500)) if count})}
+              for architecture in ['amd64', 'arm64', 'armel']}
+    aggregates = ArchitectureAggregates.from_counts(counts)
+    totals = Counter()
+    for files_count_per_section in counts.values():
+        totals.update(files_count_per_section[''])
+    for k in [1, 10, 50, 1000]:
+        assert aggregates.top_k(k) == top_k_packages(totals, k)
+
+
+def test_architecture_specific(aggregates):
+    assert aggregates.architecture_specific() == {'amd64': [('pkgD', 5), ('pkgA', 3)],
+                                                  'arm64': [('pkgF', 9), ('pkgE', 4)], 'i386': []}
+
+
+def test_section_percentiles(aggregates):
+    percentiles = aggregates.section_percentiles((0, 50, 90))
+    assert list(percentiles) == ['', 'admin', 'utils']
+    # The packages of the empty section have 2, 6 and 2 files over the architectures
+    assert percentiles[''] == pytest.approx(np.percentile([2, 6, 2], [0, 50, 90]).tolist())
+    assert percentiles['admin'] == pytest.approx([1, 3, 4.6])
+    assert aggregates.section_percentiles((50,), 'i386') == {'': [1.5]}
+    with pytest.raises(ValueError):
+        aggregates.section_percentiles((50, 101))
+
+
+def test_section_percentiles_without_rows():
+    assert ArchitectureAggregates.from_counts({'amd64': {}}).section_percentiles() == {}
@@ -0,0 +1,103 @@
+import json
+import os
+import pytest
+
+from collections import Counter
+from unittest.mock import patch
+from src.columnar import ColumnarExport, ColumnarWriter, ExportFormatNotAvailable, InvalidExportFolder, read_npy
+
+AMD64_SECTIONS = {'': Counter({'pkgA': 2, 'pkgB': 1}), 'admin': Counter({'pkgA': 1})}
+ARM64_SECTIONS = {'': Counter({'pkgB': 3, 'pkgC': 1})}
+
+
+def write_export(folder, formats=()):
+    with ColumnarWriter(str(folder), formats) as writer:
+        writer.add('amd64', AMD64_SECTIONS)
+        writer.add('arm64', ARM64_SECTIONS)
+
+
+def test_export_npy_read_without_numpy(tmp_path):
+    # The package and section ids are shared by the architectures, in the order the names are first seen
+    write_export(tmp_path / 'export')
+
+    assert bytes(read_npy(str(tmp_path / 'export' / 'packages.npy'))) == b'pkgApkgBpkgC'
+    assert list(read_npy(str(tmp_path / 'export' / 'package_offsets.npy'))) == [0, 4, 8, 12]
+    assert list(read_npy(str(tmp_path / 'export' / 'amd64.package_ids.npy'))) == [0, 1, 0]
+    assert list(read_npy(str(tmp_path / 'export' / 'amd64.section_ids.npy'))) == [0, 0, 1]
+    assert list(read_npy(str(tmp_path / 'export' / 'amd64.files.npy'))) == [2, 1, 1]
+    assert list(read_npy(str(tmp_path / 'export' / 'arm64.package_ids.npy'))) == [1, 2]
+    assert list(read_npy(str(tmp_path / 'export' / 'arm64.files.npy'))) == [3, 1]
+    with open(tmp_path / 'export' / 'export.json') as f:
+        assert json.load(f) == {'architectures': {'amd64': 3, 'arm64': 2}, 'packages': 3, 'sections': 2}
+    assert os.listdir(tmp_path) == ['export']
+
+
+@patch('src.columnar.EXPORT_BATCH_ROWS', 2)
+def test_export_memory_mapped_with_numpy(tmp_path):
+    # The rows written in several batches are loaded as memory mapped arrays, and from the .npz bundle
+    np = pytest.importorskip('numpy')
+    write_export(tmp_path / 'export', ['npz'])
+
+    export = ColumnarExport(str(tmp_path / 'export'))
+    assert export.architectures == ['amd64', 'arm64']
+    assert export.package_names == ['pkgA', 'pkgB', 'pkgC']
+    assert export.section_names == ['', 'admin']
+    columns = export.columns('amd64')
+    assert isinstance(columns['files'], np.memmap)
+    assert columns['files'].dtype == np.int64 and columns['package_ids'].dtype == np.uint32
+    assert np.bincount(columns['package_ids'], weights=columns['files']).tolist() == [3, 1]
+    with pytest.raises(KeyError):
+        export.columns('i386')
+
+    with np.load(tmp_path / 'export.npz') as npz:
+        assert npz['arm64.files'].tolist() == [3, 1]
+        assert npz['packages'].tobytes() == b'pkgApkgBpkgC'
+
+
+def test_export_replaces_the_previous_export_once_complete(tmp_path):
+    write_export(tmp_path / 'export')
+    with pytest.raises(RuntimeError):
+        with ColumnarWriter(str(tmp_path / 'export')) as writer:
+            writer.add('i386', ARM64_SECTIONS)
+            raise RuntimeError
+    with open(tmp_path / 'export' / 'export.json') as f:
+        assert list(json.load(f)['architectures']) == ['amd64', 'arm64']
+    assert os.listdir(tmp_path) == ['export']
+
+
+def test_export_does_not_replace_other_folders(tmp_path, monkeypatch):
+    # A folder holding other files than an export is kept, and so is the working directory and its parents
+    (tmp_path / 'mydata').mkdir()
+    (tmp_path / 'mydata' / 'notes.txt').write_text('notes')
+    with pytest.raises(InvalidExportFolder):
+        ColumnarWriter(str(tmp_path / 'mydata'))
+    assert os.listdir(tmp_path / 'mydata') == ['notes.txt']
+
+    monkeypatch.chdir(tmp_path / 'mydata')
+    for folder in ['.', str(tmp_path), '..']:
+        with pytest.raises(InvalidExportFolder):
+            ColumnarWriter(folder)
+    assert sorted(os.listdir(tmp_path)) == ['mydata'] and os.listdir(tmp_path / 'mydata') == ['notes.txt']
+
+    # An empty folder and a previous export are replaced
+    (tmp_path / 'empty').mkdir()
+    write_export(tmp_path / 'empty')
+    write_export(tmp_path / 'empty')
+    assert (tmp_path / 'empty' / 'export.json').is_file()
+
+
+def test_export_arrow_and_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    import pyarrow.parquet
+    write_export(tmp_path / 'export', ['arrow', 'parquet'])
+
+    with pyarrow.memory_map(str(tmp_path / 'export.arrow')) as source:
+        table = pyarrow.ipc.open_file(source).read_all()
+    assert table.column('package').to_pylist() == ['pkgA', 'pkgB', 'pkgA', 'pkgB', 'pkgC']
+    assert pyarrow.parquet.read_table(tmp_path / 'export.parquet').column('files').to_pylist() == [2, 1, 1, 3, 1]
+
+
+def test_export_arrow_without_pyarrow(tmp_path):
+    with patch('src.columnar.import_module', side_effect=ImportError), pytest.raises(ExportFormatNotAvailable):
+        ColumnarWriter(str(tmp_path / 'export'), ['parquet'])
@@ -0,0 +1,98 @@
+import gzip
+import pytest
+from unittest.mock import patch
+from src.contents_index import HEADER, ContentsIndex, InvalidIndexFormat
+from src.contents_parser import ContentsParser
+
+CONTENTS = b"FILE  LOCATION\n" \
+           b"usr/bin/tool  utils/tool,admin/tool-extra\n" \
+           b"usr/share/doc/tool/copyright  utils/tool\n" \
+           b"usr/lib/libfoo.so  non-free/libs/libfoo\n" \
+           b"usr/share/doc/a file  doc/tool\n"
+
+
+@pytest.fixture
+def contents_index(tmp_path):
+    file_path = str(tmp_path / 'Contents-amd64.gz')
+    with gzip.open(file_path, 'wb') as f:
+        f.write(CONTENTS)
+    with ContentsParser(file_path, table_header=True).build_index(str(tmp_path / 'amd64.index')) as index:
+        yield index
+
+
+def test_files_of_successful(contents_index):
+    # The files of a package are sorted, the $AREA/$SECTION/ prefix is not part of the package name
+    assert contents_index.files_of('tool') == ['usr/bin/tool', 'usr/share/doc/a file', 'usr/share/doc/tool/copyright']
+    assert contents_index.files_of('libfoo') == ['usr/lib/libfoo.so']
+    assert contents_index.files_of('tool-extra') == ['usr/bin/tool']
+    assert contents_index.files_of('missing') == []
+
+
+def test_packages_owning_successful(contents_index):
+    assert contents_index.packages_owning('usr/bin/tool') == ['tool', 'tool-extra']
+    assert contents_index.packages_owning('/usr/lib/libfoo.so') == ['libfoo']
+    assert contents_index.packages_owning('usr/bin') == []
+    assert contents_index.packages_owning('zzz') == []
+    assert (contents_index.packages, contents_index.paths) == (3, 4)
+
+
+def test_open_existing_index(contents_index):
+    # The saved index is opened again without the contents file
+    with ContentsIndex(contents_index.index_path) as index:
+        assert index.packages_owning('usr/share/doc/a file') == ['tool']
+
+
+def test_empty_index(tmp_path):
+    file_path = str(tmp_path / 'Contents-amd64.gz')
+    with gzip.open(file_path, 'wb') as f:
+        f.write(b"")
+    with ContentsParser(file_path, table_header=False).build_index(str(tmp_path / 'amd64.index')) as index:
+        assert index.files_of('tool') == []
+        assert index.packages_owning('usr/bin/tool') == []
+
+
+@pytest.mark.parametrize('content', [b'', b'not an index at all, not an index at all'])
+def test_invalid_index(tmp_path, content):
+    (tmp_path / 'broken.index').write_bytes(content)
+    with pytest.raises(InvalidIndexFormat):
+        ContentsIndex(str(tmp_path / 'broken.index'))
+
+
+def test_truncated_index(contents_index, tmp_path):
+    # The counts of the header are checked against the size of the file, at every length it can be cut to
+    with open(contents_index.index_path, 'rb') as f:
+        content = f.read()
+    for size in range(HEADER.size, len(content)):
+        (tmp_path / 'truncated.index').write_bytes(content[:size])
+        with pytest.raises(InvalidIndexFormat):
+            ContentsIndex(str(tmp_path / 'truncated.index'))
+
+
+def test_paths_with_prefix_successful(contents_index):
+    assert list(contents_index.paths_with_prefix('/usr/share/doc/')) == [('usr/share/doc/a file', ['tool']),
+                                                                        ('usr/share/doc/tool/copyright', ['tool'])]
+    assert [path for path, _ in contents_index.paths_with_prefix('usr/')] == \
+           ['usr/bin/tool', 'usr/lib/libfoo.so', 'usr/share/doc/a file', 'usr/share/doc/tool/copyright']
+    assert list(contents_index.paths_with_prefix('usr/lib/libfoo.so')) == [('usr/lib/libfoo.so', ['libfoo'])]
+    assert list(contents_index.paths_with_prefix('var/')) == []
+
+
+@patch('contents_index.PATH_BLOCK_SIZE', 3)
+def test_front_coded_blocks_successful(tmp_path):
+    # The lookups should find the paths in every block, whatever block they fall in
+    package_per_path = {f'usr/share/doc/package{i:02}/file{j}': f'package{i:02}' for i in range(10) for j in range(3)}
+    paths = sorted(package_per_path)
+    file_path = str(tmp_path / 'Contents-amd64.gz')
+    with gzip.open(file_path, 'wb') as f:
+        f.write(''.join(f'{path}  doc/{package_name}\n' for path, package_name in package_per_path.items())
+                .encode('utf-8'))
+
+    with ContentsParser(file_path, table_header=False).build_index(str(tmp_path / 'amd64.index')) as index:
+        assert index.blocks == 10
+        assert [index.path(path_id) for path_id in range(index.paths)] == paths
+        for path, package_name in package_per_path.items():
+            assert index.packages_owning(path) == [package_name]
+        assert index.files_of('package04') == [f'usr/share/doc/package04/file{j}' for j in range(3)]
+        assert [path for path, _ in index.paths_with_prefix('usr/share/doc/package0')] == paths
+        assert [path for path, _ in index.paths_with_prefix('usr/share/doc/package05/file2')] == \
+               ['usr/share/doc/package05/file2']
@@ -1,7 +1,12 @@
+import gzip
+import lzma
+import time
 from src.contents_parser import ContentsParser, InvalidContentFileFormat
+from src.timings import StageTimings
 from unittest import mock
-from unittest.mock import patch, mock_open
-from collections import defaultdict
+from unittest.mock import patch
+from collections import Counter, defaultdict
+from functools import partial
 import pytest
 
 GZ_CONTENT_WITHOUT_HEADER = b"file1  package1\n" \
@@ -18,6 +23,16 @@ GZ_CONTENT_WITH_HEADER = b"FILE  LOCATION\n" \
                          b"file3  package2"
 
 
+@pytest.fixture
+def contents_file(tmp_path):
+    # Write the content as a compressed contents file, the parser is tested on real files
+    def write(content: bytes, compress=gzip.compress) -> str:
+        file_path = tmp_path / 'Contents-test'
+        file_path.write_bytes(compress(content))
+        return str(file_path)
+    return write
+
+
 def mock_parse_file(*_):
     """Mock the parse_file function from the ContentsParser class"""
     files_list_per_package = defaultdict(list)
@@ -32,9 +47,14 @@ def mock_parse_file(*_):
     return files_list_per_package
 
 
+def mock_count_files(*_):
+    """Mock the count_files_per_package function from the ContentsParser class"""
+    return Counter({package_name: len(files) for package_name, files in mock_parse_file().items()})
+
+
 def test_top_k_packages_max_files_successful():
     # mock the parse file function and check if the top k function is working
-    with mock.patch.object(ContentsParser, 'get_files_list_per_package', new=mock_parse_file):
+    with mock.patch.object(ContentsParser, 'count_files_per_package', new=mock_count_files):
         content_parser = ContentsParser("file_path")
         top_k = content_parser.top_k_packages_max_files(2)
         assert len(top_k), 2
@@ -44,19 +64,18 @@ def test_top_k_packages_max_files_successful():
 def test_top_k_packages_max_files_k_greater_than_files_successful():
     # mock the parse file function and check if the top k function is working
     # with k greater than the # of packages
-    with mock.patch.object(ContentsParser, 'get_files_list_per_package', new=mock_parse_file):
+    with mock.patch.object(ContentsParser, 'count_files_per_package', new=mock_count_files):
         content_parser = ContentsParser("file_path")
         top_k = content_parser.top_k_packages_max_files(5)
         assert len(top_k) == 4
         assert top_k[0] == ('package2', 3)
 
 
-@patch('gzip.GzipFile', mock_open(read_data=GZ_CONTENT_WITHOUT_HEADER))
-def test_parse_file_without_header_successful():
+def test_parse_file_without_header_successful(contents_file):
     # Test if the ContentsParser.parse_file is working for files without Header row.
     # Header row is the line containing value "FILE LOCATION".
     # Call the parse_file function to get the returned files_list_per_package
-    content_parser = ContentsParser("file_path", table_header=False)
+    content_parser = ContentsParser(contents_file(GZ_CONTENT_WITHOUT_HEADER), table_header=False)
     files_list_per_package_returned = content_parser.get_files_list_per_package()
 
     # assert that the returned dict is as expected
@@ -64,12 +83,11 @@ def test_parse_file_without_header_successful():
     assert files_list_per_package_returned['package2'] == ['file1', 'file2', 'file3']
 
 
-@patch('gzip.GzipFile', mock_open(read_data=GZ_CONTENT_WITH_HEADER))
-def test_parse_file_with_header_successful():
+def test_parse_file_with_header_successful(contents_file):
     # Test if the ContentsParser.parse_file is working for files with Header row.
     # Header row is the line containing value "FILE LOCATION".
     # Call the parse_file function to get the returned files_list_per_package
-    content_parser = ContentsParser("file_path", table_header=True)
+    content_parser = ContentsParser(contents_file(GZ_CONTENT_WITH_HEADER), table_header=True)
     files_list_per_package_returned = content_parser.get_files_list_per_package()
 
     # assert that the returned dict is same as the original
@@ -77,10 +95,145 @@ def test_parse_file_with_header_successful():
     assert files_list_per_package_returned['package2'] == ['file1', 'file2', 'file3']
 
 
-@patch('gzip.GzipFile', mock_open(read_data=GZ_CONTENT_WITHOUT_HEADER))
-def test_parse_file_with_header_invalid_format():
+def test_parse_file_with_header_invalid_format(contents_file):
 
     with pytest.raises(InvalidContentFileFormat):
         # Call the parse_file function to get the returned files_list_per_package
-        content_parser = ContentsParser("file_path", table_header=True)
+        content_parser = ContentsParser(contents_file(GZ_CONTENT_WITHOUT_HEADER), table_header=True)
         _ = content_parser.get_files_list_per_package()
+
+
+def test_count_files_per_package_successful(contents_file):
+    # Test if the ContentsParser.count_files_per_package gives the same counts as the file lists
+    content_parser = ContentsParser(contents_file(GZ_CONTENT_WITH_HEADER), table_header=True)
+    files_count_per_package_returned = content_parser.count_files_per_package()
+
+    assert files_count_per_package_returned == Counter({'package1': 2, 'package2': 3})
+
+
+def test_count_files_per_package_qualified_names_successful(contents_file):
+    # Files shared by several packages are counted for each of them and the $AREA/$SECTION/ prefix is dropped
+    file_path = contents_file(b"usr/bin/tool  utils/tool,admin/tool-extra\n"
+                              b"usr/lib/libfoo.so  non-free/libs/libfoo\n")
+    content_parser = ContentsParser(file_path, table_header=False)
+    files_count_per_package_returned = content_parser.count_files_per_package()
+
+    assert files_count_per_package_returned == Counter({'tool': 1, 'tool-extra': 1, 'libfoo': 1})
+
+
+def test_count_files_per_section_successful(contents_file):
+    # The packages are counted in the $AREA/$SECTION of their qualified name, the file is parsed only once
+    file_path = contents_file(b"usr/bin/tool  utils/tool,admin/tool-extra\n"
+                              b"usr/bin/other  utils/tool\n"
+                              b"usr/lib/libfoo.so  non-free/libs/libfoo,libbar\n")
+    content_parser = ContentsParser(file_path, table_header=False)
+    assert content_parser.count_files_per_package() == Counter({'tool': 2, 'tool-extra': 1, 'libfoo': 1,
+                                                                'libbar': 1})
+    files_count_per_section = content_parser.count_files_per_section()
+
+    assert list(files_count_per_section) == ['', 'admin', 'non-free/libs', 'utils']
+    assert files_count_per_section['utils'] == Counter({'tool': 2})
+    assert files_count_per_section['non-free/libs'] == Counter({'libfoo': 1})
+    assert files_count_per_section[''] == Counter({'libbar': 1})
+    assert content_parser.top_k_packages_per_section(1)['admin'] == [('tool-extra', 1)]
+
+
+def test_count_files_per_package_with_header_invalid_format(contents_file):
+
+    with pytest.raises(InvalidContentFileFormat):
+        content_parser = ContentsParser(contents_file(GZ_CONTENT_WITHOUT_HEADER), table_header=True)
+        _ = content_parser.count_files_per_package()
+
+
+@patch('src.contents_parser.READ_BLOCK_SIZE', 7)
+def test_parse_file_blocks_split_inside_lines_successful(contents_file):
+    # Blocks smaller than a line, blank rows, tabs, trailing whitespace and file names with spaces
+    # should give the same results in both the counting and the file lists. The file is stored without
+    # compression, so that the decompressed blocks are as small as the blocks read.
+    file_path = contents_file(b"some free form text\n"
+                              b"FILE  LOCATION\n"
+                              b"usr/share/doc/a file  doc/package1\n"
+                              b"\n"
+                              b"usr/bin/tool\tutils/package2 \r\n"
+                              b"usr/bin/other  utils/package2,package1", partial(gzip.compress, compresslevel=0))
+    content_parser = ContentsParser(file_path, table_header=True)
+    files_list_per_package_returned = content_parser.get_files_list_per_package()
+    files_count_per_package_returned = content_parser.count_files_per_package()
+
+    assert files_list_per_package_returned['package1'] == ['usr/share/doc/a file', 'usr/bin/other']
+    assert files_list_per_package_returned['package2'] == ['usr/bin/tool', 'usr/bin/other']
+    assert files_count_per_package_returned == Counter({'package1': 2, 'package2': 2})
+
+
+@patch('src.contents_parser.PARALLEL_CHUNK_SIZE', 16)
+@patch('src.contents_parser.READ_BLOCK_SIZE', 16)
+def test_count_files_per_package_parallel_successful(tmp_path):
+    # The counts of the worker processes should add up to the counts of a single process
+    file_path = str(tmp_path / 'Contents-test.gz')
+    with gzip.open(file_path, 'wb') as f:
+        f.write(b"FILE  LOCATION\n" + (GZ_CONTENT_WITHOUT_HEADER + b"\n") * 3)
+
+    content_parser = ContentsParser(file_path, table_header=True, workers=2)
+    files_count_per_package_returned = content_parser.count_files_per_package()
+
+    assert files_count_per_package_returned == ContentsParser(file_path, table_header=True).count_files_per_package()
+    assert files_count_per_package_returned == Counter({'package1': 6, 'package2': 9})
+
+
+def test_count_files_per_package_from_stream_successful():
+    # The gzip file is fed in small chunks cut anywhere, made of two gzip members like a concatenated file
+    compressed = gzip.compress(GZ_CONTENT_WITH_HEADER + b"\n") + gzip.compress(b"file4  package1\n")
+    compressed_chunks = (compressed[i:i + 5] for i in range(0, len(compressed), 5))
+
+    content_parser = ContentsParser.from_stream(compressed_chunks, table_header=True)
+    files_count_per_package_returned = content_parser.count_files_per_package()
+
+    assert files_count_per_package_returned == Counter({'package1': 3, 'package2': 3})
+    assert content_parser.top_k_packages_max_files(1) == [('package1', 3)]
+
+
+def test_parse_file_timings_successful(contents_file):
+    # The stages of the parsing are recorded in the StageTimings given to the parser
+    timings = StageTimings()
+    content_parser = ContentsParser(contents_file(GZ_CONTENT_WITH_HEADER), timings=timings)
+    assert content_parser.top_k_packages_max_files(1) == [('package2', 3)]
+    content_parser.get_files_list_per_package()
+
+    assert list(timings.stages) == ['count', 'inflate', 'packages', 'top_k', 'files_list']
+    assert timings.stages['count']['lines'] == 5
+    assert timings.stages['inflate']['bytes'] == 2 * len(GZ_CONTENT_WITH_HEADER)
+    assert timings.stages['files_list']['lines'] == 5
+
+
+def test_iter_package_file_records_timings(contents_file):
+    # The records stage times the production of the records only, the time the caller takes is not counted
+    timings = StageTimings()
+    content_parser = ContentsParser(contents_file(GZ_CONTENT_WITH_HEADER), timings=timings)
+    records, caller_s = [], 0.0
+    for record in content_parser.iter_package_file_records():
+        assert timings.running() == []  # No stage is running while the caller has a record
+        start = time.perf_counter()
+        time.sleep(0.01)
+        caller_s += time.perf_counter() - start
+        records.append(record)
+
+    assert len(records) == 5
+    records_stage = timings.stages['records']
+    assert records_stage['lines'] == 5 and records_stage['wall_s'] < caller_s / 2
+
+
+def test_count_files_per_package_xz_successful(contents_file):
+    # The xz compressed contents files are told by their first bytes, from a file or from a stream
+    content_parser = ContentsParser(contents_file(GZ_CONTENT_WITH_HEADER, lzma.compress), table_header=True)
+    assert content_parser.count_files_per_package() == Counter({'package1': 2, 'package2': 3})
+
+    compressed = lzma.compress(GZ_CONTENT_WITH_HEADER)
+    compressed_chunks = (compressed[i:i + 3] for i in range(0, len(compressed), 3))
+    content_parser = ContentsParser.from_stream(compressed_chunks, table_header=True)
+    assert content_parser.count_files_per_package() == Counter({'package1': 2, 'package2': 3})
+
+
+def test_parse_truncated_file(contents_file):
+    with pytest.raises(EOFError):
+        ContentsParser(contents_file(GZ_CONTENT_WITH_HEADER, lambda content: gzip.compress(content)[:-10]),
+                       table_header=True).count_files_per_package()
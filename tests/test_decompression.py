@@ -0,0 +1,57 @@
+import gzip
+import lzma
+import pytest
+
+from src.decompression import BACKENDS, CommandBackend, inflate_chunks, iter_decompressed_file, select_backend
+
+CONTENT = b"".join(b"usr/share/doc/package%d/file%d  doc/package%d\n" % (i % 50, i, i % 50) for i in range(20000))
+COMPRESS = {'gz': gzip.compress, 'xz': lzma.compress}
+
+
+@pytest.mark.parametrize('name', list(BACKENDS))
+def test_backend_decompresses_file(tmp_path, name):
+    backend = BACKENDS[name]
+    if not backend.available():
+        pytest.skip(f'{name} is not installed')
+    # Two members or streams one after the other, like concatenated files
+    file_path = tmp_path / 'Contents-test'
+    file_path.write_bytes(COMPRESS[backend.compression](CONTENT) + COMPRESS[backend.compression](b"file  pkg\n"))
+
+    assert b''.join(iter_decompressed_file(str(file_path), 4096, name)) == CONTENT + b"file  pkg\n"
+    if backend.streaming:
+        compressed = file_path.read_bytes()
+        chunks = (compressed[i:i + 1000] for i in range(0, len(compressed), 1000))
+        assert b''.join(inflate_chunks(chunks, name)) == CONTENT + b"file  pkg\n"
+
+
+def test_select_backend():
+    assert select_backend('gz').compression == 'gz'
+    assert select_backend('xz').compression == 'xz'
+    assert select_backend('gz', streaming=True).streaming
+    assert select_backend('gz', 'zlib').name == 'zlib'
+    with pytest.raises(ValueError):
+        select_backend('xz', 'zlib')  # zlib does not decompress xz files
+    with pytest.raises(ValueError):
+        select_backend('gz', 'unknown')
+
+
+def test_inflate_zero_padded_members():
+    compressed = gzip.compress(b"file1  pkgA\n") + b'\x00' * 8 + gzip.compress(b"file2  pkgB\n")
+    assert b''.join(inflate_chunks([compressed[:5], compressed[5:]])) == b"file1  pkgA\nfile2  pkgB\n"
+    assert b''.join(inflate_chunks([])) == b''
+
+
+def test_command_backend_errors(tmp_path):
+    backend = CommandBackend('gzip', 'gz', ['gzip', '-d', '-c'])
+    if not backend.available():
+        pytest.skip('gzip is not installed')
+    file_path = tmp_path / 'Contents-test.gz'
+    file_path.write_bytes(b'not a gzip file')
+    with pytest.raises(OSError, match='gzip could not decompress'):
+        b''.join(backend.iter_file(str(file_path), 4096))
+
+    # The command is stopped when the reader stops before the end of the file
+    file_path.write_bytes(gzip.compress(CONTENT * 20))
+    blocks = backend.iter_file(str(file_path), 4096)
+    assert next(blocks) == CONTENT[:4096]
+    blocks.close()
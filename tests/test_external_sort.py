@@ -0,0 +1,66 @@
+import gzip
+import os
+import random
+
+from unittest.mock import patch
+from src.contents_parser import ContentsParser
+from src.external_sort import ExternalSorter, group_package_files, iter_files_per_package
+
+
+def random_records(count: int) -> list:
+    rng = random.Random(0)
+    return [b'package%d\tusr/share/file%d\n' % (rng.randrange(50), rng.randrange(2000)) for _ in range(count)]
+
+
+def test_sort_in_memory(tmp_path):
+    records = random_records(1000)
+    with ExternalSorter(2**30, str(tmp_path)) as sorter:
+        for record in records:
+            sorter.add(record)
+        assert list(sorter) == sorted(set(records))
+        assert sorter.runs == 0
+    assert os.listdir(tmp_path) == []  # The folder of the runs is removed once the sorter is closed
+
+
+def test_sort_spilled_to_runs(tmp_path):
+    # The records never take more than the memory budget, the runs are merged in several passes
+    records = random_records(5000)
+    with ExternalSorter(4096, str(tmp_path), unique=False) as sorter:
+        for record in records:
+            sorter.add(record)
+            assert sorter._size < sorter.memory_budget
+        with patch('src.external_sort.MERGE_FAN_IN', 4):
+            assert list(sorter) == sorted(records)
+        assert sorter.runs > 4 + len(records) * 60 // 4096
+    assert os.listdir(tmp_path) == []
+
+
+def test_group_package_files():
+    records = [b'libfoo\tusr/lib/libfoo.so\n', b'libfoo\tusr/lib/libfoo.so.1\n', b'libfoo-dev\tusr/include/foo.h\n',
+               b'tool\tusr/bin/my tool\n']
+    assert [(package_name, list(paths)) for package_name, paths in group_package_files(records)] == [
+        ('libfoo', ['usr/lib/libfoo.so', 'usr/lib/libfoo.so.1']), ('libfoo-dev', ['usr/include/foo.h']),
+        ('tool', ['usr/bin/my tool'])]
+
+
+@patch('src.external_sort.MERGE_READ_SIZE', 64)
+def test_iter_files_per_package_same_as_files_lists(tmp_path):
+    # The files of the packages of two contents files, sorted on disk, are the sorted union of their file lists
+    file_paths = []
+    for i in range(2):
+        file_path = str(tmp_path / f'Contents-{i}.gz')
+        with gzip.open(file_path, 'wb') as f:
+            for j in range(300):
+                f.write(b'usr/share/%d/file%d  admin/package%d,package%d\n' % (i, j % 100, j % 7, j % 5))
+        file_paths.append(file_path)
+    content_parsers = [ContentsParser(file_path, table_header=False) for file_path in file_paths]
+
+    expected = {}
+    for content_parser in content_parsers:
+        for package_name, paths in content_parser.get_files_list_per_package().items():
+            expected.setdefault(package_name, set()).update(paths)
+    files_per_package = [(package_name, list(paths)) for package_name, paths in iter_files_per_package(
+        (content_parser.iter_package_file_records() for content_parser in content_parsers), 1024, str(tmp_path))]
+
+    assert files_per_package == sorted((package_name, sorted(paths)) for package_name, paths in expected.items())
+    assert sorted(os.listdir(tmp_path)) == ['Contents-0.gz', 'Contents-1.gz']
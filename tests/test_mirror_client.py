@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import pytest
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Barrier, Lock, Thread
+from requests.exceptions import ConnectionError, HTTPError
+from src.mirror_client import MirrorClient
+
+DEAD_MIRROR = 'http://127.0.0.1:1/'  # Nothing listens on this port, the connection is refused
+
+
+@pytest.fixture
+def flaky_mirror():
+    # A mirror answering 503 to the first requests of every file, then 404 to the files other than Contents-amd64.gz
+    requests_per_path = {}
+
+    class FlakyHTTPRequestHandler(BaseHTTPRequestHandler):
+        failures = 2
+
+        def do_GET(self):
+            requests_per_path[self.path] = requests_per_path.get(self.path, 0) + 1
+            if requests_per_path[self.path] <= self.failures:
+                self.send_error(503)
+            elif self.path != '/Contents-amd64.gz':
+                self.send_error(404)
+            else:
+                body = gzip.compress(b"file1  pkgA\n")
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHTTPRequestHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/', requests_per_path
+    server.shutdown()
+
+
+def test_fetch_fails_over_to_the_next_mirror(mirror):
+    client = MirrorClient([DEAD_MIRROR, mirror], retries=0)
+    assert asyncio.run(client.fetch('Contents-amd64.gz', 'Contents-amd64.gz')) == mirror
+    with gzip.open('Contents-amd64.gz') as f:
+        assert f.read() == b"file1  pkgA\nfile2  pkgA\nfile3  admin/pkgA,pkgB\n"
+
+
+def test_fetch_retries_with_backoff(flaky_mirror, tmp_path):
+    url, requests_per_path = flaky_mirror
+    client = MirrorClient([url], retries=2, backoff=0.05)
+    start = time.perf_counter()
+    assert asyncio.run(client.fetch('Contents-amd64.gz', str(tmp_path / 'Contents-amd64.gz'))) == url
+    assert time.perf_counter() - start >= 0.05 + 0.1  # The delay doubles before every retry
+    assert requests_per_path['/Contents-amd64.gz'] == 3
+    assert (tmp_path / 'Contents-amd64.gz').is_file()
+
+
+def test_fetch_raises_the_last_error_once_the_retries_are_used(flaky_mirror, tmp_path):
+    url, requests_per_path = flaky_mirror
+    with pytest.raises(HTTPError, match='503'):
+        asyncio.run(MirrorClient([url], retries=1, backoff=0).fetch('Contents-amd64.gz',
+                                                                    str(tmp_path / 'Contents-amd64.gz')))
+    assert requests_per_path['/Contents-amd64.gz'] == 2
+    with pytest.raises(ConnectionError):
+        asyncio.run(MirrorClient([DEAD_MIRROR], retries=1, backoff=0).fetch('Contents-amd64.gz',
+                                                                            str(tmp_path / 'Contents-amd64.gz')))
+
+
+def test_fetch_does_not_retry_a_missing_file(flaky_mirror, tmp_path):
+    url, requests_per_path = flaky_mirror
+    with pytest.raises(HTTPError, match='404'):
+        asyncio.run(MirrorClient([url], retries=5, backoff=0).fetch('Contents-ar.gz', str(tmp_path / 'Contents-ar.gz')))
+    assert requests_per_path['/Contents-ar.gz'] == 3  # The 2 failures, then the 404 ends the retries
+
+
+def test_fetch_all_limits_the_concurrent_downloads(tmp_path):
+    running, most_running, lock = 0, 0, Lock()
+
+    def download(url, file_name, chunk_size):
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    client = MirrorClient(['http://mirror/'], max_concurrency=2, download=download)
+    files = [(f'Contents-{i}.gz', str(tmp_path / f'Contents-{i}.gz')) for i in range(6)]
+    assert asyncio.run(client.fetch_all(files)) == ['http://mirror/'] * 6
+    assert most_running == 2
+    assert client._semaphores == {}  # The semaphore of the loop is dropped once its downloads are done
+
+
+def test_fetch_all_in_several_event_loops(tmp_path):
+    # Every event loop has its own semaphore, the client can be used by several asyncio.run
+    client = MirrorClient(['http://mirror/'], max_concurrency=1, download=lambda url, file_name, chunk_size: None)
+    files = [(f'Contents-{i}.gz', str(tmp_path / f'Contents-{i}.gz')) for i in range(3)]
+    for _ in range(2):
+        assert asyncio.run(client.fetch_all(files)) == ['http://mirror/'] * 3
+
+
+def test_download_shares_the_limit_across_threads(tmp_path):
+    running, most_running, lock = 0, 0, Lock()
+
+    def download(url, file_name, chunk_size):
+        nonlocal running, most_running
+        with lock:
+            running += 1
+            most_running = max(most_running, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+
+    with MirrorClient(['http://mirror/'], max_concurrency=2, download=download) as client:
+        threads = [Thread(target=client.download, args=(f'Contents-{i}.gz', str(tmp_path / f'Contents-{i}.gz')))
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        loop, loop_thread = client._loop, client._loop_thread
+    assert most_running == 2
+    assert loop.is_closed() and not loop_thread.is_alive()  # The event loop is stopped and closed with the client
+
+
+def test_fetch_all_runs_max_concurrency_downloads_at_once(tmp_path):
+    # The downloads run in the threads of the client, not in the default executor of the loop which has at most 32
+    max_concurrency = 40
+    barrier = Barrier(max_concurrency, timeout=10)
+
+    def download(url, file_name, chunk_size):
+        barrier.wait()  # Broken if the downloads can not all run at once
+
+    with MirrorClient(['http://mirror/'], max_concurrency=max_concurrency, download=download) as client:
+        files = [(f'Contents-{i}.gz', str(tmp_path / f'Contents-{i}.gz')) for i in range(max_concurrency)]
+        assert asyncio.run(client.fetch_all(files)) == ['http://mirror/'] * max_concurrency
+
+
+def test_no_mirror():
+    with pytest.raises(ValueError):
+        MirrorClient([])
@@ -0,0 +1,57 @@
+import pytest
+from collections import Counter
+from src.package_files import PackageFiles
+
+
+def create_package_files():
+    package_files = PackageFiles()
+    package_files.add(b'usr/bin/tool', ['tool', 'tool-extra'])
+    package_files.add(b'usr/share/doc/tool/copyright', ['tool'])
+    package_files.add(b'usr/share/doc/libfoo/copyright', ['libfoo'])
+    package_files.add(b'README', ['tool'])
+    return package_files
+
+
+@pytest.mark.parametrize('frozen', [False, True])
+def test_package_files_lookup_successful(frozen):
+    # The files keep the order they were added in, before and after being packed
+    package_files = create_package_files()
+    if frozen:
+        package_files.freeze()
+
+    assert package_files['tool'] == ['usr/bin/tool', 'usr/share/doc/tool/copyright', 'README']
+    assert package_files['libfoo'] == ['usr/share/doc/libfoo/copyright']
+    assert package_files.count('tool') == 3
+    assert package_files.counts() == Counter({'tool': 3, 'tool-extra': 1, 'libfoo': 1})
+
+
+def test_package_files_mapping_successful():
+    package_files = create_package_files().freeze()
+
+    assert len(package_files) == 3
+    assert list(package_files) == ['tool', 'tool-extra', 'libfoo']
+    assert 'libfoo' in package_files and 'missing' not in package_files
+    assert package_files.get('missing') is None and package_files.get('missing', ()) == ()
+    assert dict(package_files.items())['tool-extra'] == ['usr/bin/tool']
+
+
+@pytest.mark.parametrize('frozen', [False, True])
+def test_package_files_missing_package(frozen):
+    # A package that is not in the contents file has no files, and the lookup does not add it
+    package_files = create_package_files()
+    if frozen:
+        package_files.freeze()
+
+    assert package_files['missing'] == []
+    assert package_files.count('missing') == 0
+    assert 'missing' not in package_files and len(package_files) == 3
+
+
+def test_package_files_shared_directories():
+    # Directories shared by files are stored once
+    package_files = create_package_files()
+    package_files.add(b'usr/bin/other', ['other'])
+    package_files.freeze()
+
+    assert len(package_files._directories) == 4
+    assert package_files['other'] == ['usr/bin/other']
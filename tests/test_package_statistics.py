@@ -1,4 +1,8 @@
+import gzip
 import os.path
+import pytest
+import subprocess
+import sys
 
 from click.testing import CliRunner
 from unittest.mock import patch
@@ -163,3 +167,284 @@ def test_package_statistics_invalid_content_file_format_exception(mock_isfile, m
         result = runner.invoke(package_statistics.package_statistics, ['arm64', '--force=true'])
         assert result.exit_code == 1
         assert "Invalid contents File format! Table header(FILE LOCATION) not found" in result.output
+
+
+@patch('src.package_statistics.download_file')
+@patch('os.path.isfile')
+def test_package_statistics_workers_passed_to_parser(mock_isfile, mock_download_file):
+    from src import package_statistics
+    mock_isfile.return_value = True
+
+    with patch.object(package_statistics, 'ContentsParser') as mock_contents_parser:
+        mock_contents_parser.return_value.top_k_packages_max_files.return_value = [('package1', 2)]
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.package_statistics, ['arm64', '--workers=4'])
+        assert result.exit_code == 0
+        assert mock_contents_parser.call_args.kwargs['workers'] == 4
+        assert "package1" in result.output
+
+
+def test_package_statistics_invalid_workers():
+    from src import package_statistics
+    runner = CliRunner()
+    result = runner.invoke(package_statistics.package_statistics, ['arm64', '--workers=0'])
+    assert result.exit_code == 2
+
+
+def test_package_statistics_multiple_architectures(mirror):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.package_statistics, ['amd64', 'arm64'])
+        assert result.exit_code == 0
+        amd64_output, arm64_output, combined_output = result.output.split("\nTop ")[1:]
+        assert amd64_output.startswith(f"{K_VALUE} packages of amd64")
+        assert "1. pkgA" in amd64_output and "\t3" in amd64_output
+        assert arm64_output.startswith(f"{K_VALUE} packages of arm64")
+        assert "1. pkgB" in arm64_output
+        assert combined_output.startswith(f"{K_VALUE} packages of all the architectures")
+        assert [line.split()[1:] for line in combined_output.splitlines()[1:]] == \
+               [['pkgB', '4'], ['pkgA', '3'], ['pkgC', '1']]
+        assert os.path.exists(DOWNLOAD_FOLDER) is False
+
+
+def test_package_statistics_sections(mirror):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.package_statistics, ['amd64', '--sections=true', '--stream=true'])
+        assert result.exit_code == 0
+        total_output, no_section_output, admin_output = result.output.split("\nTop ")[1:]
+        assert total_output.startswith(f"{K_VALUE} packages of amd64\n")
+        assert no_section_output.startswith(f"{K_VALUE} packages of amd64 in section (none)")
+        assert [line.split()[1:] for line in no_section_output.splitlines()[1:]] == [['pkgA', '2'], ['pkgB', '1']]
+        assert admin_output.startswith(f"{K_VALUE} packages of amd64 in section admin")
+        assert [line.split()[1:] for line in admin_output.splitlines()[1:]] == [['pkgA', '1']]
+
+
+def test_package_statistics_all_architectures(mirror):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror), \
+            patch.object(package_statistics, 'ARCHITECTURES', ['amd64', 'arm64']):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.package_statistics, ['all', '--no_cache=false'])
+        assert result.exit_code == 0
+        assert "Downloading Contents-amd64.gz" in result.output
+        assert "Downloading Contents-arm64.gz" in result.output
+        assert os.path.isfile(os.path.join(DOWNLOAD_FOLDER, 'Contents-arm64.gz'))
+
+
+def test_package_statistics_missing_architecture_on_mirror(mirror):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.package_statistics, ['amd64', 'ar'])
+        assert result.exit_code == 1
+        assert "Couldn't download the contents file!! Please check the architecture name" in result.output
+
+
+def test_package_statistics_xz_compression(mirror):
+    # A mirror publishing only xz contents files is read with --compression=xz, downloaded or streamed
+    import lzma
+    from src import package_statistics
+    with open('mirror/Contents-amd64.xz', 'wb') as f:
+        f.write(lzma.compress(b"file1  pkgC\nfile2  pkgC\n"))
+
+    runner = CliRunner()
+    for stream in ['false', 'true']:
+        result = runner.invoke(package_statistics.package_statistics,
+                               ['amd64', f'--mirror={mirror}', '--compression=xz', f'--stream={stream}'])
+        assert result.exit_code == 0
+        assert "Contents-amd64.xz" in result.output
+        assert "1. pkgC" in result.output and "\t2" in result.output
+
+
+def test_package_statistics_mirror_failover(mirror):
+    from src import package_statistics
+
+    runner = CliRunner()
+    result = runner.invoke(package_statistics.package_statistics,
+                           ['amd64', '--mirror=http://127.0.0.1:1/', f'--mirror={mirror}', '--retries=0'])
+    assert result.exit_code == 0
+    assert f"Downloaded Contents-amd64.gz from {mirror}" in result.output
+    assert "1. pkgA" in result.output
+
+
+def test_package_statistics_export(mirror):
+    from src import package_statistics
+    from src.columnar import read_npy
+
+    runner = CliRunner()
+    result = runner.invoke(package_statistics.cli, ['export', 'amd64', 'arm64', f'--mirror={mirror}',
+                                                    '--output=export'])
+    assert result.exit_code == 0
+    assert "Exported 5 rows of amd64, arm64 to export" in result.output
+    assert bytes(read_npy(os.path.join('export', 'packages.npy'))) == b'pkgApkgBpkgC'
+    assert list(read_npy(os.path.join('export', 'amd64.files.npy'))) == [2, 1, 1]
+    assert list(read_npy(os.path.join('export', 'arm64.package_ids.npy'))) == [1, 2]
+
+
+def test_package_statistics_export_keeps_other_folders(mirror):
+    from src import package_statistics
+
+    os.mkdir('mydata')
+    with open(os.path.join('mydata', 'notes.txt'), 'w') as f:
+        f.write('notes')
+    runner = CliRunner()
+    for output in ['mydata', '.']:
+        result = runner.invoke(package_statistics.cli, ['export', 'amd64', f'--mirror={mirror}', f'--output={output}',
+                                                        '--no_cache=false'])
+        assert result.exit_code == 2
+        assert "Invalid value for --output" in result.output
+    assert os.listdir('mydata') == ['notes.txt']
+    assert os.path.isdir('mirror')
+
+
+def test_package_statistics_files(mirror):
+    from src import package_statistics
+
+    runner = CliRunner()
+    result = runner.invoke(package_statistics.cli, ['files', 'amd64', 'arm64', f'--mirror={mirror}',
+                                                    '--memory_budget=1'])
+    assert result.exit_code == 0
+    # The files of pkgB in both architectures are listed once, sorted
+    assert result.output.endswith("pkgA\n  file1\n  file2\n  file3\npkgB\n  file1\n  file2\n  file3\npkgC\n  file4\n")
+
+
+def test_package_statistics_aggregate(mirror):
+    pytest.importorskip('numpy')
+    from src import package_statistics
+
+    runner = CliRunner()
+    runner.invoke(package_statistics.cli, ['export', 'amd64', 'arm64', f'--mirror={mirror}', '--output=export'])
+    result = runner.invoke(package_statistics.cli, ['aggregate', '--input=export', '--percentiles=50'])
+    assert result.exit_code == 0
+    assert "1. pkgB" in result.output and "2. pkgA" in result.output
+    assert "1 packages only in amd64" in result.output and "1 packages only in arm64" in result.output
+    assert "Percentiles 50 of the files per section" in result.output
+    # A folder without export.json, or with a corrupt .npy file, is not an export
+    os.remove('export/amd64.files.npy')
+    open('export/amd64.files.npy', 'wb').close()
+    for folder in ['mirror', 'export']:
+        result = runner.invoke(package_statistics.cli, ['aggregate', f'--input={folder}'])
+        assert result.exit_code == 2
+        assert "Invalid value for --input" in result.output
+    for percentiles in ['101', '-1', 'median', '50,']:
+        result = runner.invoke(package_statistics.cli, ['aggregate', '--input=export', f'--percentiles={percentiles}'])
+        assert result.exit_code == 2
+        assert "Invalid value for '--percentiles'" in result.output
+
+
+@pytest.mark.parametrize('no_cache', ['true', 'false'])
+def test_package_statistics_stream(mirror, no_cache):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.package_statistics,
+                               ['amd64', '--stream=true', f'--no_cache={no_cache}'])
+        assert result.exit_code == 0
+        assert "Streaming Contents-amd64.gz" in result.output
+        assert "1. pkgA" in result.output
+        assert os.path.isfile(os.path.join(DOWNLOAD_FOLDER, 'Contents-amd64.gz')) is (no_cache == 'false')
+
+
+def test_cli_runs_statistics_by_default(mirror):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.cli, ['amd64'])
+        assert result.exit_code == 0
+        assert "1. pkgA" in result.output
+        assert runner.invoke(package_statistics.cli, ['--table_header=false', 'amd64']).exit_code == 0
+
+
+def test_cli_no_architecture():
+    from src import package_statistics
+    runner = CliRunner()
+    result = runner.invoke(package_statistics.cli)
+    assert result.exit_code == 2
+    assert "Missing argument" in result.output
+
+
+def test_owners(mirror):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.cli, ['owners', 'amd64', '/file3', '--no_cache=false'])
+        assert result.exit_code == 0
+        assert "Indexing" in result.output
+        assert result.output.splitlines()[-1].split() == ['file3', 'pkgA,', 'pkgB']
+
+        # The saved index is used by the next query
+        result = runner.invoke(package_statistics.cli, ['owners', 'amd64', 'file', '--prefix=true'])
+        assert result.exit_code == 0
+        assert "Indexing" not in result.output
+        assert [line.split()[0] for line in result.output.splitlines()[1:]] == ['file1', 'file2', 'file3']
+
+
+def test_owners_not_found(mirror):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.cli, ['owners', 'amd64', 'file4'])
+        assert result.exit_code == 1
+        assert "No package owns file4" in result.output
+        assert os.path.exists(DOWNLOAD_FOLDER) is False
+
+
+def test_diff(mirror, tmp_path):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.cli, ['diff', 'amd64'])
+        assert result.exit_code == 0
+        assert "No previous snapshot of amd64" in result.output
+
+        with gzip.open(tmp_path / 'mirror' / 'Contents-amd64.gz', 'wb') as f:
+            f.write(b"file1  pkgA\nfile3  admin/pkgA,pkgC\nfile4  pkgC\n")
+        result = runner.invoke(package_statistics.cli, ['diff', 'amd64'])
+        assert result.exit_code == 0
+        changes, top_k = result.output.split("since the previous snapshot\n")[1].split("\nTop ")
+        assert [line.split() for line in changes.splitlines()] == [
+            ['~', 'pkgA', '3', '->', '2', '(-1)'], ['-', 'pkgB', '1'], ['+', 'pkgC', '2'],
+            ['1', 'added,', '1', 'removed,', '1', 'changed']]
+        assert [line.split() for line in top_k.splitlines()[1:]] == [
+            ['1.', 'pkgA', '2', '(=)'], ['2.', 'pkgC', '2', '(new)'], ['Left', 'the', 'top', f'{K_VALUE}:', 'pkgB']]
+
+        # The new snapshot replaced the previous one
+        result = runner.invoke(package_statistics.cli, ['diff', 'amd64'])
+        assert "0 added, 0 removed, 0 changed" in result.output
+
+
+def test_package_statistics_timings_and_profile(mirror, tmp_path):
+    from src import package_statistics
+
+    with patch.object(package_statistics, 'URL_BASE', mirror):
+        runner = CliRunner()
+        result = runner.invoke(package_statistics.cli, ['amd64', 'arm64', '--timings=true', '--profile=run.prof',
+                                                        '--profile_memory=run.snapshot'])
+        assert result.exit_code == 0
+        timings = result.output.split("\nTimings\n")[1].splitlines()
+        stages = {line.split()[0]: line.split()[1:] for line in timings[1:]}
+        assert set(stages) == {'download', 'count', 'inflate', 'packages', 'top_k', 'total'}
+        assert stages['count'][0] == '2' and stages['count'][4] == '7'  # The calls and lines of the 2 files
+        assert (tmp_path / 'run.prof').is_file() and (tmp_path / 'run.snapshot').is_file()
+
+
+def test_package_statistics_imports_at_startup():
+    # The modules of the downloads, the query server, the index, the parallel parser and the profiling are imported
+    # on the code paths needing them, a query answered from the local files does not import them
+    src_folder = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    modules = subprocess.run([sys.executable, '-c', "import sys, package_statistics; print(*sys.modules)"],
+                             check=True, capture_output=True, text=True, cwd=src_folder).stdout.split()
+    assert set(modules).isdisjoint({'requests', 'tqdm', 'asyncio', 'socketserver', 'query_server', 'contents_index',
+                                    'concurrent.futures.process', 'multiprocessing', 'cProfile', 'tracemalloc'})
@@ -0,0 +1,98 @@
+import gzip
+import os
+import pytest
+
+from threading import Thread
+from unittest.mock import patch
+from src.mirror_client import MirrorClient
+from src.query import ServerError, main, query
+from src.query_server import QueryServer
+
+SOCKET_PATH = 'query.sock'  # Relative to the working directory of the mirror, a Unix socket path is short
+
+
+@pytest.fixture
+def server(mirror):
+    query_server = QueryServer(SOCKET_PATH, ['amd64', 'arm64'], refresh_interval=0,
+                               client=MirrorClient([mirror]))
+    Thread(target=query_server.serve_forever, daemon=True).start()
+    query({'query': 'status'}, SOCKET_PATH)  # Connecting waits till the architectures are loaded
+    yield query_server
+    query_server.shutdown()
+    query_server.server_close()
+
+
+def test_query_server_queries(server):
+    assert query({'query': 'top', 'architecture': 'amd64', 'k': 1}, SOCKET_PATH) == [['pkgA', 3]]
+    assert query({'query': 'top', 'architecture': 'arm64'}, SOCKET_PATH) == [['pkgB', 3], ['pkgC', 1]]
+    assert query({'query': 'files', 'architecture': 'amd64', 'package': 'pkgB'}, SOCKET_PATH) == ['file3']
+    assert query({'query': 'owners', 'architecture': 'amd64', 'path': '/file3'}, SOCKET_PATH) == \
+           [['file3', ['pkgA', 'pkgB']]]
+    assert query({'query': 'owners', 'architecture': 'arm64', 'path': 'file', 'prefix': True}, SOCKET_PATH) == \
+           [['file1', ['pkgB']], ['file2', ['pkgB']], ['file3', ['pkgB']], ['file4', ['pkgC']]]
+    status = query({'query': 'status'}, SOCKET_PATH)
+    assert status['arm64']['packages'] == 2 and status['arm64']['paths'] == 4
+
+
+def test_query_server_errors(server):
+    with pytest.raises(ServerError, match='i386 is not loaded'):
+        query({'query': 'top', 'architecture': 'i386'}, SOCKET_PATH)
+    with pytest.raises(ServerError, match='Unknown query'):
+        query({'query': 'drop'}, SOCKET_PATH)
+    with pytest.raises(ServerError, match='Invalid query'):
+        query({'query': 'files', 'architecture': 'amd64'}, SOCKET_PATH)
+    # The queries that are not an object, or whose fields are not of the expected type, are errors of the query
+    for invalid in [[], 'top', {'query': 'top', 'architecture': ['amd64']},
+                    {'query': 'top', 'architecture': 'amd64', 'k': 'ten'},
+                    {'query': 'top', 'architecture': 'amd64', 'k': -1},
+                    {'query': 'owners', 'architecture': 'amd64', 'path': 3}]:
+        with pytest.raises(ServerError, match='Invalid query'):
+            query(invalid, SOCKET_PATH)
+    assert query({'query': 'top', 'architecture': 'amd64', 'k': 1}, SOCKET_PATH) == [['pkgA', 3]]
+
+
+def test_query_client_no_answer(server, capsys):
+    # The connection closed by the server without an answer is an error of the server
+    with patch.object(server, 'answer', side_effect=RuntimeError):
+        with pytest.raises(ServerError, match='without answering'):
+            query({'query': 'status'}, SOCKET_PATH)
+        with pytest.raises(SystemExit) as exit_info:
+            main(['--socket', SOCKET_PATH, 'status'])
+    assert exit_info.value.code == 1
+    assert "closed the connection" in capsys.readouterr().out
+
+
+def test_query_server_refresh(server, tmp_path):
+    # A contents file changed on the mirror is downloaded and parsed again, an unchanged one is kept
+    arm64_data = server._data['arm64']
+    mirror_file = tmp_path / 'mirror' / 'Contents-amd64.gz'
+    with gzip.open(mirror_file, 'wb') as f:
+        f.write(b"file1  pkgD\nfile5  pkgD\n")
+    modified = os.path.getmtime(mirror_file) + 10  # The mirror compares the modification times in seconds
+    os.utime(mirror_file, (modified, modified))
+    server.load('amd64')
+    server.load('arm64')
+
+    assert query({'query': 'top', 'architecture': 'amd64'}, SOCKET_PATH) == [['pkgD', 2]]
+    assert query({'query': 'owners', 'architecture': 'amd64', 'path': 'file3'}, SOCKET_PATH) == []
+    assert server._data['arm64'] is arm64_data
+
+
+def test_query_client(server, capsys):
+    main(['--socket', SOCKET_PATH, 'top', 'amd64', '-k', '1'])
+    assert capsys.readouterr().out.split() == ['1.', 'pkgA', '3']
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(['--socket', SOCKET_PATH, 'owners', 'amd64', 'file4'])
+    assert exit_info.value.code == 1
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(['--socket', SOCKET_PATH, 'top', 'amd64', '-k', '-1'])
+    assert exit_info.value.code == 2  # The usage error of argparse
+    assert "-1 is negative" in capsys.readouterr().err
+
+
+def test_query_client_no_server(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        main(['--socket', str(tmp_path / 'missing.sock'), 'status'])
+    assert "The query server is not running" in capsys.readouterr().out
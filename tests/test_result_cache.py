@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+from collections import Counter
+from contextlib import nullcontext
+from unittest.mock import patch
+
+from src.contents_parser import ContentsParser
+from src.result_cache import ResultCache
+
+FILES_COUNT_PER_PACKAGE = Counter({'package1': 2, 'package2': 3, 'package3': 2})
+
+
+def write_contents_file(file_path, content=b"file1  package1\nfile2  package1\nfile3  package2\n"):
+    with gzip.open(file_path, 'wb') as f:
+        f.write(content)
+    return str(file_path)
+
+
+def test_result_cache_put_get_successful(tmp_path):
+    # The result should be the same after a round trip, sorted by most files and then by name
+    cache = ResultCache(str(tmp_path / 'results'), 1024 * 1024)
+    cache.put('key', FILES_COUNT_PER_PACKAGE)
+
+    result = cache.get('key')
+    assert result == FILES_COUNT_PER_PACKAGE
+    assert list(result) == ['package2', 'package1', 'package3']
+    assert cache.get('other_key') is None
+
+
+def test_result_cache_broken_result(tmp_path):
+    # A broken result should be treated as not cached and removed
+    cache = ResultCache(str(tmp_path), 1024 * 1024)
+    (tmp_path / 'key.bin').write_bytes(b'broken')
+
+    assert cache.get('key') is None
+    assert os.path.exists(tmp_path / 'key.bin') is False
+
+
+def test_result_cache_evict_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), 1024 * 1024)
+    for key in ('first', 'second', 'third'):
+        cache.put(key, FILES_COUNT_PER_PACKAGE)
+    os.utime(tmp_path / 'first.bin', (1, 1))
+    os.utime(tmp_path / 'second.bin', (2, 2))
+    os.utime(tmp_path / 'third.bin', (3, 3))
+    cache.get('first')  # Using a result makes it the most recently used
+
+    # Only two results fit in the cache after the next store
+    cache.max_bytes = 2 * os.path.getsize(tmp_path / 'first.bin')
+    cache.put('fourth', FILES_COUNT_PER_PACKAGE)
+    assert sorted(os.listdir(tmp_path)) == ['first.bin', 'fourth.bin']
+
+
+def test_result_cache_evicted_by_another_thread(tmp_path):
+    # The results are stored by several threads, a result can be removed by another one at any time
+    cache = ResultCache(str(tmp_path), 1024 * 1024)
+    for key in ('first', 'second'):
+        cache.put(key, FILES_COUNT_PER_PACKAGE)
+
+    scandir = os.scandir
+
+    def scandir_then_evict(folder):
+        entries = list(scandir(folder))
+        os.remove(tmp_path / 'first.bin')
+        return nullcontext(entries)
+
+    with patch('src.result_cache.os.scandir', scandir_then_evict):
+        cache.evict()
+    assert os.listdir(tmp_path) == ['second.bin']
+
+    with patch('src.result_cache.os.utime', side_effect=FileNotFoundError):
+        assert cache.get('second') is None
+
+
+def test_result_cache_key(tmp_path):
+    # The key changes with the content of the file, the validators and the table_header option
+    file_path = write_contents_file(tmp_path / 'Contents-amd64.gz')
+    key = ResultCache.key(file_path, False)
+    assert key == ResultCache.key(file_path, False)
+    assert key != ResultCache.key(file_path, True)
+
+    with open(f'{file_path}.headers', 'w') as f:
+        json.dump({'etag': '"abc"', 'last_modified': None}, f)
+    assert key != ResultCache.key(file_path, False)
+
+    write_contents_file(file_path, b"file1  package1\n")
+    assert key != ResultCache.key(file_path, False)
+
+
+def test_contents_parser_uses_cache(tmp_path):
+    # The second parser of the same file should load the counts from the cache without parsing the file
+    file_path = write_contents_file(tmp_path / 'Contents-amd64.gz')
+    cache = ResultCache(str(tmp_path / 'results'), 1024 * 1024)
+    files_count_per_package = ContentsParser(file_path, table_header=False, cache=cache).count_files_per_package()
+    assert files_count_per_package == Counter({'package1': 2, 'package2': 1})
+
+    with patch('src.contents_parser.iter_decompressed_file', side_effect=AssertionError('The file is parsed')):
+        content_parser = ContentsParser(file_path, table_header=False, cache=cache)
+        assert content_parser.count_files_per_package() == files_count_per_package
+        assert content_parser.top_k_packages_max_files(1) == [('package1', 2)]
+
+
+def test_result_cache_file_digest_saved(tmp_path):
+    # The digest is read from the saved digest while the file does not change, and computed again once it does
+    file_path = write_contents_file(tmp_path / 'Contents-amd64.gz')
+    digest = ResultCache.file_digest(file_path)
+    assert os.path.isfile(f'{file_path}.sha256')
+    with patch('hashlib.sha256', side_effect=AssertionError('The file is read again')):
+        assert ResultCache.file_digest(file_path) == digest
+
+    os.replace(write_contents_file(tmp_path / 'new.gz', b"file1  package1\n"), file_path)
+    assert ResultCache.file_digest(file_path) != digest
@@ -0,0 +1,60 @@
+import gzip
+import pytest
+from src.snapshots import InvalidSnapshot, SnapshotDiff, iter_snapshot, write_snapshot
+
+
+def test_write_snapshot_sorted_by_name(tmp_path):
+    snapshot_path = str(tmp_path / 'Contents-amd64.snapshot.gz')
+    write_snapshot(snapshot_path, {'pkgB': 2, 'pkgA': 3, 'lib+c': 1})
+
+    assert list(iter_snapshot(snapshot_path)) == [('lib+c', 1), ('pkgA', 3), ('pkgB', 2)]
+    assert not (tmp_path / 'Contents-amd64.snapshot.gz.part').exists()
+
+
+def test_snapshot_diff_successful():
+    old_rows = [('pkgA', 5), ('pkgB', 3), ('pkgC', 1), ('pkgE', 4)]
+    new_rows = [('pkgA', 5), ('pkgB', 6), ('pkgD', 2), ('pkgE', 1)]
+    snapshot_diff = SnapshotDiff(iter(old_rows), iter(new_rows), 2)
+
+    assert list(snapshot_diff) == [('pkgB', 3, 6), ('pkgC', 1, None), ('pkgD', None, 2), ('pkgE', 4, 1)]
+    assert (snapshot_diff.added, snapshot_diff.removed, snapshot_diff.changed) == (1, 1, 2)
+    movement, left_top_k = snapshot_diff.top_k_movement()
+    assert movement == [('pkgB', 6, None), ('pkgA', 5, 1)]
+    assert left_top_k == ['pkgE']
+
+
+def test_snapshot_diff_one_side_empty():
+    snapshot_diff = SnapshotDiff(iter([]), iter([('pkgA', 1), ('pkgB', 2)]), 1)
+
+    assert list(snapshot_diff) == [('pkgA', None, 1), ('pkgB', None, 2)]
+    assert snapshot_diff.top_k_movement() == ([('pkgB', 2, None)], [])
+
+
+def test_snapshot_diff_unsorted_rows():
+    with pytest.raises(InvalidSnapshot):
+        list(SnapshotDiff(iter([('pkgB', 1), ('pkgA', 1)]), iter([]), 1))
+
+
+def test_iter_snapshot_broken(tmp_path):
+    snapshot_path = str(tmp_path / 'broken.snapshot.gz')
+    with gzip.open(snapshot_path, 'wt') as f:
+        f.write('pkgA 1\npkgB\n')
+
+    with pytest.raises(InvalidSnapshot):
+        list(iter_snapshot(snapshot_path))
+
+
+@pytest.mark.parametrize('damage', ['truncated', 'not_gzip', 'not_utf8'])
+def test_iter_snapshot_corrupt(tmp_path, damage):
+    # A snapshot that can not be decompressed or decoded is an invalid snapshot, not an error of gzip
+    snapshot_path = tmp_path / 'Contents-amd64.snapshot.gz'
+    write_snapshot(str(snapshot_path), {f'pkg{i}': i for i in range(100)})
+    if damage == 'truncated':
+        snapshot_path.write_bytes(snapshot_path.read_bytes()[:-6])
+    elif damage == 'not_gzip':
+        snapshot_path.write_bytes(b'pkgA 1\n')
+    else:
+        snapshot_path.write_bytes(gzip.compress(b'pkgA 1\n\xff\xfe 2\n'))
+
+    with pytest.raises(InvalidSnapshot):
+        list(iter_snapshot(str(snapshot_path)))
@@ -0,0 +1,60 @@
+import pstats
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from src.timings import Profiler, StageTimings, iter_stage, stage
+
+
+def test_stage_timings_nested_stages():
+    # The time of a nested stage is not counted in the stage it is nested in
+    timings = StageTimings()
+    with timings.stage('outer') as counters:
+        counters['lines'] += 3
+        for block in timings.iter_stage('inner', [b'abc', b'de']):
+            assert timings.running() == ['outer']  # The inner stage is not running while the caller has a block
+            time.sleep(0.02)
+        counters['bytes'] += len(block)
+
+    inner, outer = timings.stages['inner'], timings.stages['outer']
+    assert inner['calls'] == 3 and inner['bytes'] == 5
+    assert outer['calls'] == 1 and outer['lines'] == 3 and outer['bytes'] == 2
+    assert outer['wall_s'] >= 0.04 > inner['wall_s']
+    assert outer['allocated_peak_mb'] is None and outer['peak_rss_mb'] > 0
+
+    report = timings.report()
+    assert report[0].split()[:2] == ['Stage', 'Calls']
+    assert [line.split()[0] for line in report[1:]] == ['outer', 'inner', 'total']
+
+
+def test_stage_timings_allocations():
+    timings = StageTimings()
+    tracemalloc.start()
+    try:
+        with timings.stage('allocate'):
+            data = bytearray(4 * 2**20)
+    finally:
+        tracemalloc.stop()
+    assert timings.stages['allocate']['allocated_peak_mb'] >= 4
+    del data
+
+
+def test_stage_without_timings():
+    with stage(None, 'download') as counters:
+        counters['bytes'] += 1
+    blocks = [b'abc']
+    assert iter_stage(None, 'inflate', blocks) is blocks
+
+
+def test_profiler_threads(tmp_path):
+    # The functions run in other threads are in the profile along with the calling thread
+    def work_in_thread():
+        return sum(range(1000))
+
+    profiler = Profiler()
+    with profiler.profile(), ThreadPoolExecutor(max_workers=2) as executor:
+        assert executor.submit(profiler.call, work_in_thread).result() == 499500
+    profile_path = str(tmp_path / 'run.prof')
+    profiler.dump(profile_path)
+
+    functions = {function for _, _, function in pstats.Stats(profile_path).stats}
+    assert 'work_in_thread' in functions and 'test_profiler_threads' not in functions
@@ -0,0 +1,47 @@
+import random
+from src.top_k import TopK
+
+
+def sorted_top_k(files_count_per_package: dict, k: int) -> list:
+    return sorted(files_count_per_package.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+def test_top_k_successful():
+    top_k = TopK(2)
+    top_k.update({'package1': 2, 'package2': 3, 'package3': 1})
+    assert top_k.result() == [('package2', 3), ('package1', 2)]
+    assert len(top_k) == 2
+
+
+def test_top_k_ties_broken_by_name():
+    # The result is the same whatever the order the packages are pushed in
+    files_count_per_package = {f'package{i}': i % 5 for i in range(200)}
+    expected = sorted_top_k(files_count_per_package, 10)
+    items = list(files_count_per_package.items())
+    for seed in range(5):
+        random.Random(seed).shuffle(items)
+        top_k = TopK(10)
+        for package_name, count in items:
+            top_k.push(package_name, count)
+        assert top_k.result() == expected
+
+
+def test_top_k_incremental_updates():
+    # The counts can be pushed in parts, for example as every architecture or worker finishes
+    files_count_per_package = {f'package{i}': random.Random(i).randrange(1000) for i in range(1000)}
+    items = list(files_count_per_package.items())
+    top_k = TopK(10)
+    for start in range(0, len(items), 128):
+        top_k.update(iter(items[start:start + 128]))
+    assert top_k.result() == sorted_top_k(files_count_per_package, 10)
+
+
+def test_top_k_fewer_packages_than_k():
+    top_k = TopK(5)
+    top_k.update([('package1', 1), ('package2', 1)])
+    assert top_k.result() == [('package1', 1), ('package2', 1)]
+    assert TopK(0).result() == [] and TopK(5).result() == []
+
+    top_k = TopK(0)
+    top_k.push('package1', 1)
+    assert top_k.result() == []
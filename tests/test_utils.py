@@ -1,7 +1,11 @@
+import gzip
+import json
+import lzma
 import requests
 import responses
 import pytest
-from src.utils import download_file, unzip_gz_file
+from responses import matchers
+from src.utils import download_file, get_session, stream_file, unzip_gz_file
 import os
 from unittest.mock import patch, mock_open
 
@@ -27,6 +31,7 @@ def test_download_file_success():
     assert content == FILE_CONTENT
     assert os.path.isfile(GZ_FILE_NAME)
     os.remove(GZ_FILE_NAME)
+    os.remove(f'{GZ_FILE_NAME}.headers')  # The validators saved along with the file
 
 
 @responses.activate
@@ -42,10 +47,131 @@ def test_download_file_error():
         assert os.path.isfile(GZ_FILE_NAME) is False
 
 
-@patch('gzip.open', mock_open(read_data=FILE_CONTENT))
-@patch('os.path.isfile')
-def test_unzip_gz_file_success(mock_isfile):
-    mock_isfile.return_value = True
+@responses.activate
+def test_stream_file_success(tmp_path):
+    # The chunks should be yielded as they arrive and saved to the file only once complete
+    responses.add(responses.GET, VALID_URL, body=FILE_CONTENT, status=200)
+    file_name = str(tmp_path / GZ_FILE_NAME)
+
+    chunks = stream_file(VALID_URL, file_name, chunk_size=5)
+    assert next(chunks) == FILE_CONTENT[:5]
+    assert os.path.isfile(file_name) is False
+    assert b''.join(chunks) == FILE_CONTENT[5:]
+    with open(file_name, 'rb') as f:
+        assert f.read() == FILE_CONTENT
+    assert os.path.isfile(f'{file_name}.part') is False
+
+
+@responses.activate
+def test_stream_file_without_saving_success(tmp_path, monkeypatch):
+    responses.add(responses.GET, VALID_URL, body=FILE_CONTENT, status=200)
+    monkeypatch.chdir(tmp_path)
+
+    assert b''.join(stream_file(VALID_URL)) == FILE_CONTENT
+    assert os.listdir(tmp_path) == []
+
+
+def write_file(file_name, content, etag):
+    with open(file_name, 'wb') as f:
+        f.write(content)
+    with open(f'{file_name}.headers', 'w') as f:
+        json.dump({'etag': etag, 'last_modified': None}, f)
+
+
+@responses.activate
+def test_download_file_not_modified(tmp_path):
+    # The local copy should be kept when the server answers 304 Not Modified to the ETag of the local copy
+    file_name = str(tmp_path / GZ_FILE_NAME)
+    write_file(file_name, FILE_CONTENT, '"v1"')
+    responses.add(responses.GET, VALID_URL, status=304,
+                  match=[matchers.header_matcher({'If-None-Match': '"v1"'})])
+
+    with patch('src.utils.iter_file') as mock_iter_file:
+        assert download_file(VALID_URL, file_name)
+        mock_iter_file.assert_not_called()  # The local copy is not read
+    with open(file_name, 'rb') as f:
+        assert f.read() == FILE_CONTENT
+    # The local copy is streamed when it has not changed
+    assert b''.join(stream_file(VALID_URL, file_name)) == FILE_CONTENT
+
+
+@responses.activate
+def test_download_file_modified(tmp_path):
+    # The file and its validators should be replaced when the file on the server changed
+    file_name = str(tmp_path / GZ_FILE_NAME)
+    write_file(file_name, b'old content', '"v1"')
+    responses.add(responses.GET, VALID_URL, body=FILE_CONTENT, status=200, headers={'ETag': '"v2"'})
+
+    assert download_file(VALID_URL, file_name)
+    with open(file_name, 'rb') as f:
+        assert f.read() == FILE_CONTENT
+    with open(f'{file_name}.headers') as f:
+        assert json.load(f)['etag'] == '"v2"'
+
+
+@responses.activate
+def test_download_file_resume_part(tmp_path):
+    # An interrupted download should continue from the end of the part file
+    file_name = str(tmp_path / GZ_FILE_NAME)
+    write_file(f'{file_name}.part', FILE_CONTENT[:5], '"v1"')
+    responses.add(responses.GET, VALID_URL, body=FILE_CONTENT[5:], status=206, headers={'ETag': '"v1"'},
+                  match=[matchers.header_matcher({'Range': 'bytes=5-', 'If-Range': '"v1"'})])
+
+    assert b''.join(stream_file(VALID_URL, file_name)) == FILE_CONTENT
+    with open(file_name, 'rb') as f:
+        assert f.read() == FILE_CONTENT
+    assert os.path.isfile(f'{file_name}.part') is False
+
+
+@responses.activate
+def test_download_file_restart_changed_part(tmp_path):
+    # The whole file is sent when it changed since the part was saved, the part should be overwritten
+    file_name = str(tmp_path / GZ_FILE_NAME)
+    write_file(f'{file_name}.part', b'old c', '"v1"')
+    responses.add(responses.GET, VALID_URL, body=FILE_CONTENT, status=200, headers={'ETag': '"v2"'})
+
+    assert download_file(VALID_URL, file_name)
+    with open(file_name, 'rb') as f:
+        assert f.read() == FILE_CONTENT
+
+
+@responses.activate
+def test_download_file_complete_part(tmp_path):
+    # A complete part is answered 416 Range Not Satisfiable, it should be dropped and the file downloaded again
+    file_name = str(tmp_path / GZ_FILE_NAME)
+    write_file(f'{file_name}.part', FILE_CONTENT, '"v1"')
+    responses.add(responses.GET, VALID_URL, status=416, headers={'Content-Range': f'bytes */{len(FILE_CONTENT)}'},
+                  match=[matchers.header_matcher({'Range': f'bytes={len(FILE_CONTENT)}-'})])
+    responses.add(responses.GET, VALID_URL, body=FILE_CONTENT, status=200, headers={'ETag': '"v1"'})
+
+    assert b''.join(stream_file(VALID_URL, file_name)) == FILE_CONTENT
+    assert len(responses.calls) == 2 and 'Range' not in responses.calls[1].request.headers
+    with open(file_name, 'rb') as f:
+        assert f.read() == FILE_CONTENT
+    assert sorted(os.listdir(tmp_path)) == [GZ_FILE_NAME, f'{GZ_FILE_NAME}.headers']
+
+
+@responses.activate
+def test_download_file_interrupted_keeps_part(tmp_path):
+    # A failed download should not leave a complete looking file
+    file_name = str(tmp_path / GZ_FILE_NAME)
+    responses.add(responses.GET, VALID_URL, body=FILE_CONTENT, status=200, headers={'ETag': '"v1"'})
+
+    chunks = stream_file(VALID_URL, file_name, chunk_size=5)
+    next(chunks)
+    chunks.close()
+    assert os.path.isfile(file_name) is False
+    assert os.path.isfile(f'{file_name}.part')
+
+
+def test_get_session_shared():
+    assert get_session() is get_session()
+
+
+def test_unzip_gz_file_success(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with gzip.open(GZ_FILE_NAME, 'wb') as f:
+        f.write(FILE_CONTENT)
 
     # Call the unzip_gz_file with GZ_FILE_NAME and FILE_NAME
     result = unzip_gz_file(GZ_FILE_NAME, FILE_NAME)
@@ -59,6 +185,18 @@ def test_unzip_gz_file_success(mock_isfile):
     os.remove(FILE_NAME)
 
 
+def test_unzip_xz_file_success(tmp_path):
+    # The compression is told by the first bytes of the file, a file that is neither gzip nor xz is refused
+    (tmp_path / 'file.xz').write_bytes(lzma.compress(FILE_CONTENT))
+    assert unzip_gz_file(str(tmp_path / 'file.xz'), str(tmp_path / FILE_NAME))
+    assert (tmp_path / FILE_NAME).read_bytes() == FILE_CONTENT
+
+    (tmp_path / 'plain.gz').write_bytes(FILE_CONTENT)
+    with pytest.raises(ValueError):
+        unzip_gz_file(str(tmp_path / 'plain.gz'), str(tmp_path / 'plain'))
+    assert not (tmp_path / 'plain').exists()
+
+
 @patch('gzip.open', mock_open(read_data=FILE_CONTENT))
 @patch('os.path.isfile')
 def test_unzip_gz_file_not_gz_input_exception(mock_isfile):